@@ -2,17 +2,34 @@ import uuid
 import datetime
 
 from enum import Enum
-from typing import List
-from country import validate_country_code
-from state import Client, Invoice, State, Supplier
+from typing import List, Optional, Tuple
+from country import find_country, validate_country_code
+from state import Client, Document, Invoice, Settlement, State, Supplier
 from state import Expense as StateExpense
 from pydantic.dataclasses import dataclass
+from blobs import BlobText
+import vat
 
 class ActionType:
     UPDATE_CLIENT = "client"
     UPDATE_SUPPLIER = "supplier"
     NEW_INVOICE = "invoice"
     EXPENSE = "expense"
+    SETTLE_INVOICE = "settlement"
+    ADD_DOCUMENT = "document"
+
+def check_party(country: str, vat_number: str) -> Tuple[str, str]:
+    """
+    The alpha2 code of the country and the normalized VAT number of a client or supplier.
+    Raises ValueError for unknown country codes and VAT numbers which are invalid for their country.
+    """
+    if country:
+        if not validate_country_code(country):
+            raise ValueError(f"Unknown country code {country!r}")
+        country = find_country(country).alpha2
+    if vat_number:
+        vat_number = vat.check(vat_number, country or None)
+    return (country, vat_number)
 
 @dataclass
 class Action:
@@ -32,6 +49,9 @@ class UpdateClient(Action):
     phone: str
     country: str
 
+    def __post_init__(self):
+        (self.country, self.vat_number) = check_party(self.country, self.vat_number)
+
     def action_type(self) -> str:
         return ActionType.UPDATE_CLIENT
 
@@ -61,24 +81,8 @@ class UpdateSupplier(Action):
     def action_type(self) -> str:
         return ActionType.UPDATE_SUPPLIER
 
-    def __init__(
-        self,
-        supplier_id: uuid.UUID,
-        name: str,
-        address: str,
-        vat_number: str,
-        email: str,
-        phone: str,
-        country: str,
-    ):
-        validate_country_code(country)
-        self.supplier_id = supplier_id
-        self.name = name
-        self.address = address
-        self.vat_number = vat_number
-        self.email = email
-        self.phone = phone
-        self.country = country
+    def __post_init__(self):
+        (self.country, self.vat_number) = check_party(self.country, self.vat_number)
 
     def apply(self, st: State):
         st.store_supplier(
@@ -157,3 +161,49 @@ class Expense(Action):
                 vat_type=self.vat_type
             )
         )
+
+@dataclass
+class SettleInvoice(Action):
+    invoice_id: uuid.UUID
+    bank_tx: uuid.UUID
+    amount: float  # resolved when the action is created: replays settle the same amount
+
+    def action_type(self) -> str:
+        return ActionType.SETTLE_INVOICE
+
+    def apply(self, st: State):
+        # the invoice and the incoming payment must be in the same currency,
+        # and the amount can neither exceed what is outstanding nor what is unallocated
+        st.payment_index().check_settlement(self.invoice_id, self.bank_tx, self.amount)
+        st.store_settlement(
+            Settlement(
+                id=uuid.uuid4(),
+                invoice_id=self.invoice_id,
+                bank_tx=self.bank_tx,
+                amount=self.amount
+            )
+        )
+
+@dataclass
+class AddDocument(Action):
+    document_id: uuid.UUID
+    name: str
+    description: str
+    content: BlobText
+    date: Optional[datetime.date] = None
+    location: Optional[str] = None
+
+    def action_type(self) -> str:
+        return ActionType.ADD_DOCUMENT
+
+    def apply(self, st: State):
+        st.store_document(
+            Document(
+                id=self.document_id,
+                name=self.name,
+                description=self.description,
+                content=self.content,
+                date=self.date,
+                location=self.location,
+            )
+        )
@@ -1,12 +1,28 @@
+import os
 import re
+import time
 import uuid
+import asyncio
 import datetime
+import functools
+import contextvars
+
+from concurrent.futures import ThreadPoolExecutor
 
 from agents import function_tool
 from agents.agent import Agent
 
-from state import Bank, BankTransaction, CompanyData, State, Transient
-from action import Action, NewInvoice, UpdateClient, UpdateSupplier, Expense, VATType
+from log import session_id
+from metrics import TOOL_DURATION, TOOL_ERRORS
+from tracing import TRACER, TracedState
+from instrument import InstrumentedState, StateProfile
+from cache import MISSING, ToolCache
+import fx
+import refdata
+import vat
+from aggregates import spend_report
+from state import Bank, BankTransaction, CompanyData, Document, State, Transient
+from action import Action, AddDocument, NewInvoice, SettleInvoice, UpdateClient, UpdateSupplier, Expense, VATType
 from typing import Dict, List, Tuple, Optional, Callable, Union
 
 from pydantic.dataclasses import dataclass
@@ -18,18 +34,93 @@ class Context:
     current_date: datetime.date
     unreconciled_bank_transactions: Dict[uuid.UUID, List[BankTransaction]]
 
+# Model of the agent: an OpenAI model name, "stub" for a local scripted
+# model (see stub_model.py) or "replay:<recording>" to answer from a recording
+# (see replay.py). Empty for the SDK default.
+MODEL = os.environ.get("ACCTA_MODEL", "")
+
+# Directory the model calls of every session are recorded to (see replay.py)
+RECORD_DIR = os.environ.get("ACCTA_RECORD", "")
+REPLAY_REALTIME = os.environ.get("ACCTA_REPLAY_REALTIME", "") not in ("", "0")
+
+def default_model(state: Optional[State] = None):
+    """The model of a new agent, `state` is the ledger its session starts from (for recordings)."""
+    if MODEL == "stub" or MODEL.startswith("replay:"):
+        from agents import set_tracing_disabled
+
+        # nothing to export traces to
+        set_tracing_disabled(True)
+
+    if MODEL.startswith("replay:"):
+        from replay import ReplayModel
+        return ReplayModel(MODEL[len("replay:"):], REPLAY_REALTIME)
+
+    if MODEL == "stub":
+        from stub_model import StubModel
+        model = StubModel.from_env()
+    elif RECORD_DIR:
+        from agents.models.openai_provider import OpenAIProvider
+        model = OpenAIProvider().get_model(MODEL or None)
+    else:
+        return MODEL or None
+
+    if RECORD_DIR:
+        from replay import RecordingModel
+        model = RecordingModel(model, RECORD_DIR, state)
+    return model
+
+# Number of threads executing tool bodies (shared by all sessions).
+# 0 runs the tools directly on the event loop.
+TOOL_WORKERS = int(os.environ.get("ACCTA_TOOL_WORKERS", 4))
+
+_tool_pool: Optional[ThreadPoolExecutor] = None
+
+def tool_pool() -> ThreadPoolExecutor:
+    global _tool_pool
+    if _tool_pool is None:
+        _tool_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+    return _tool_pool
+
 class Transaction:
     def __init__(
         self,
         state: State,
-        action_callback: Optional[Callable] = None
+        action_callback: Optional[Callable] = None,
+        profile: Optional[StateProfile] = None
     ):
         self.act_cnt = 1
+        # serializes tool calls: the transient state is not safe for concurrent use
+        self.lock = asyncio.Lock()
         self.state = state
         # mapping from an action "name" to the action
         self.actions: List[Tuple[str, Action]] = []
-        self.transient = Transient(state)
+        # applied (in order) around every new transient, e.g. for profiling
+        self.state_wrappers: List[Callable[[State], State]] = []
+        if profile is not None:
+            self.state_wrappers.append(lambda st: InstrumentedState(st, profile))
+        self.transient = self.new_transient()
         self.action_callback = action_callback
+        # results of query tools, for the current version of the transient
+        self.cache = ToolCache()
+
+    def new_transient(self) -> State:
+        transient = Transient(self.state)
+        for wrap in self.state_wrappers:
+            transient = wrap(transient)
+        return transient
+
+    @staticmethod
+    def traced(state: State) -> State:
+        """The state, counting the calls of traced tool calls while tracing is on (it is free while off)."""
+        return TracedState(state) if TRACER.enabled else state
+
+    @property
+    def transient(self) -> State:
+        return self.traced(self._transient)
+
+    @transient.setter
+    def transient(self, transient: State):
+        self._transient = transient
 
     def context(self) -> Context:
         return Context(
@@ -57,10 +148,43 @@ class Transaction:
         self.actions.append((act_id, action))
         return act_id
 
+    async def add_document(self, document: Document) -> Optional[str]:
+        """
+        Adds a document (e.g. an upload) as an action, so it can be undone like any other.
+        Returns the id of the action, None when the state already has the document.
+        """
+        async with self.lock:
+            if any(doc.id == document.id for doc in self.transient.list_documents()):
+                return None
+            action = AddDocument(
+                document_id=document.id,
+                name=document.name,
+                description=document.description,
+                content=document.content,
+                date=document.date,
+                location=document.location,
+            )
+            act_id = self.add_action(action)
+
+        if self.action_callback:
+            self.action_callback('action_created', {
+                'action_id': act_id,
+                'action_type': 'add_document',
+                'action_args': {
+                    'document_id': str(document.id),
+                    'name': document.name,
+                    'description': document.description,
+                    'date': document.date.isoformat() if document.date else None,
+                    'location': document.location,
+                },
+                'timestamp': datetime.datetime.now().isoformat()
+            })
+        return act_id
+
     def tool_action_clear(self):
         """Undo all actions"""
         self.actions = []
-        self.transient = Transient(self.state)
+        self.transient = self.new_transient()
 
     def tool_action_undo(self, id: str):
         """Undoes the action with the given id"""
@@ -76,30 +200,113 @@ class Transaction:
         # reset state and try to replay all actions
         # note, that this could fail:
         # the error should be returned to the agent.
-        transient = Transient(self.state)
+        transient = self.new_transient()
         for (_, action) in actions:
-            action.apply(transient)
+            action.apply(self.traced(transient))
 
         # write back the new state and actions
         self.transient = transient
         self.actions = actions
 
-def create_agent(action_callback: Optional[Callable] = None, initial_state: Optional[State] = None):
-    """Create a new agent instance with fresh state."""
+def offload(tx: Transaction, fn: Callable, cached: bool = False) -> Callable:
+    """
+    Runs a synchronous tool body on the tool pool,
+    one call at a time per transaction.
+
+    Results of `cached` tools (which must only read the state)
+    are reused while the transient state is unchanged.
+    """
+    name = fn.__name__
+    cached = cached and tx.cache.max_bytes > 0
+
+    def timed(key, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with TRACER.span(name, session_id.get(), kwargs) as span:
+                result = fn(*args, **kwargs)
+                if span is not None:
+                    span.set_result(result)
+                if key is not None:
+                    tx.cache.put(key, result)
+                return result
+        except Exception:
+            TOOL_ERRORS.inc(tool=name)
+            raise
+        finally:
+            TOOL_DURATION.observe(time.perf_counter() - start, tool=name)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        await tx.lock.acquire()
+        key = None
+        if cached:
+            # answered on the event loop, without a trip to the pool
+            key = ToolCache.key(name, args, kwargs, tx.transient.version)
+            result = tx.cache.get(key, name)
+            if result is not MISSING:
+                tx.lock.release()
+                return result
+
+        if TOOL_WORKERS == 0:
+            try:
+                return timed(key, *args, **kwargs)
+            finally:
+                tx.lock.release()
+
+        try:
+            # the worker runs in a copy of our context (session id for logs and traces)
+            future = asyncio.get_running_loop().run_in_executor(
+                tool_pool(),
+                contextvars.copy_context().run,
+                functools.partial(timed, key, *args, **kwargs)
+            )
+        except BaseException:
+            tx.lock.release()
+            raise
+
+        # the worker cannot be interrupted:
+        # if the run is cancelled, keep the transaction locked until the tool body returns.
+        future.add_done_callback(lambda _: tx.lock.release())
+        return await asyncio.shield(future)
+
+    return wrapper
+
+def new_transaction(
+    action_callback: Optional[Callable] = None,
+    initial_state: Optional[State] = None,
+    profile: Optional[StateProfile] = None,
+) -> Transaction:
+    """A transaction on the state, by default a fresh copy of the test state."""
     if initial_state is None:
         from test_state import create_test_state
         st = create_test_state()
     else:
         st = initial_state
-    tx = Transaction(st, action_callback)
+    return Transaction(st, action_callback, profile)
+
+def create_agent(
+    action_callback: Optional[Callable] = None,
+    initial_state: Optional[State] = None,
+    profile: Optional[StateProfile] = None,
+    model = None,
+    transaction: Optional[Transaction] = None,
+):
+    """Create a new agent instance with fresh state (or working on the given transaction)."""
+    tx = transaction if transaction is not None else new_transaction(action_callback, initial_state, profile)
+
+    def tool(fn: Callable):
+        return function_tool(offload(tx, fn))
+
+    def query(fn: Callable):
+        return function_tool(offload(tx, fn, cached=True))
 
     # Create function tools that access state via closure
-    @function_tool
+    @tool
     def tool_query_client(name_query: str):
         """Query clients by name"""
         pass
 
-    @function_tool
+    @query
     def tool_query_supplier(name_query: str):
         """Query suppliers by name"""
         suppliers = []
@@ -108,7 +315,35 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
                 suppliers.append(supplier)
         return suppliers
 
-    @function_tool
+    @query
+    def tool_query_search_country(name_query: str):
+        """Find countries by code, name or common alias, tolerating typos"""
+        return [
+            {"name": country.name, "code": country.alpha2, "currency": refdata.CURRENCIES.get(country.alpha2)}
+            for country in refdata.reference().search(name_query)
+        ]
+
+    @query
+    def tool_query_check_countries():
+        """Check the countries and VAT numbers of the company, clients and suppliers"""
+        records = [tx.transient.company(), *tx.transient.list_clients(), *tx.transient.list_suppliers()]
+        results = refdata.reference().validate(records)
+        for (result, checked) in zip(results, vat.validate_many(records)):
+            if checked["valid"] is False:
+                result["problems"].append(f"VAT number {checked['vat_number']!r}: {checked['reason']}")
+        return [result for result in results if result["problems"]]
+
+    @query
+    def tool_query_validate_vat_numbers():
+        """Validate the VAT numbers of the company, clients and suppliers (format and check digit)"""
+        records = [tx.transient.company(), *tx.transient.list_clients(), *tx.transient.list_suppliers()]
+        results = vat.validate_many(records)
+        return {
+            "checked": sum(1 for result in results if result["valid"] is not None),
+            "invalid": [result for result in results if result["valid"] is False],
+        }
+
+    @query
     def tool_query_for_document(search_regex: str):
         """
         Search for documents based on a search term. Used for e.g. finding receipts
@@ -119,29 +354,76 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
         for doc in tx.transient.list_documents():
             if regex.search(doc.description):
                 docs.append(doc)
-            elif regex.search(doc.content):
+            elif doc.content.search(regex):
                 docs.append(doc)
         return docs
 
-    @function_tool
+    @query
     def tool_query_list_bank_transactions(bank_id: uuid.UUID):
         """List bank transactions for a given bank ID."""
         return tx.transient.list_transactions(bank_id)
 
-    @function_tool
+    @query
     def tool_query_list_unreconciled_bank_transactions(bank_id: uuid.UUID):
         """List unreconciled transactions for a given year and bank ID."""
         return tx.transient.list_unreconciled_transactions(bank_id)
 
-    @function_tool
+    @query
     def tool_query_list_unpaid_invoices():
-        """List outstanding invoices."""
+        """List outstanding invoices (not fully settled), by due date, with the amount paid and outstanding."""
         invoices = []
-        for invoice in tx.transient.list_invoices():
-            invoices.append(invoice)
+        for (invoice, paid, outstanding) in tx.transient.list_unpaid_invoices():
+            invoices.append({"invoice": invoice, "paid": paid, "outstanding": outstanding})
         return invoices
 
-    @function_tool
+    @query
+    def tool_query_receivables_aging(as_of: Optional[datetime.date] = None, client_id: Optional[uuid.UUID] = None):
+        """
+        Aging of the receivables at a date (default today): what clients owe per currency,
+        in buckets of days overdue (1-30, 31-60, 61-90, 90+) and not yet due (including due on the date).
+        """
+        as_of = as_of or datetime.date.today()
+        clients = {client.id: client.name for client in tx.transient.list_clients()}
+        rows = tx.transient.receivables_aging(as_of, client_id)
+        for row in rows:
+            row["client_name"] = clients.get(row["client"], "")
+        rows.sort(key=lambda row: (row["client_name"], row["currency"]))
+        return {"as_of": as_of, "clients": rows}
+
+    @query
+    def tool_query_list_overdue_invoices(as_of: Optional[datetime.date] = None, client_id: Optional[uuid.UUID] = None):
+        """List the invoices past their due date at a date (default today), most overdue first."""
+        as_of = as_of or datetime.date.today()
+        return [
+            {"invoice": invoice, "days_overdue": days, "outstanding": outstanding}
+            for (invoice, days, outstanding) in tx.transient.list_overdue_invoices(as_of, client_id)
+        ]
+
+    @query
+    def tool_query_propose_payments(invoice_id: Optional[uuid.UUID] = None):
+        """
+        Propose incoming bank transactions which could pay an invoice (or the 20 unpaid invoices due first):
+        exact matches, one transfer paying several invoices of the client ("combined") and partial payments.
+        Record the payments the user agrees with using tool_action_settle_invoice.
+        """
+        index = tx.transient.payment_index()
+        clients = {client.id: client.name for client in tx.transient.list_clients()}
+        if invoice_id is not None:
+            if invoice_id not in index.invoices:
+                return {"error": f"Invoice with id {invoice_id} not found"}
+            invoice_ids = [invoice_id]
+        else:
+            invoice_ids = [id for (_, id) in index.unpaid[:20]]
+
+        proposals = []
+        for id in invoice_ids:
+            invoice = index.invoices[id]
+            matches = index.propose(id, clients.get(invoice.client, ""), limit=3)
+            if matches:
+                proposals.append({"invoice_id": id, "outstanding": index.outstanding[id] / 100, "payments": matches})
+        return proposals
+
+    @query
     def tool_query_list_invoices():
         """List all invoices."""
         invoices = []
@@ -149,7 +431,89 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
             invoices.append(invoice)
         return invoices
 
-    @function_tool
+    @query
+    def tool_query_convert_currency(amount: float, from_currency: str, to_currency: str, date: datetime.date):
+        """Convert an amount between currencies at the ECB reference rate of the given date."""
+        return {
+            "amount": round(fx.rates().convert(amount, from_currency, to_currency, date), 2),
+            "currency": to_currency.upper(),
+            "rate": fx.rates().rate_at(from_currency, to_currency, date),
+        }
+
+    @query
+    def tool_query_currency_summary(currency: str, year: int):
+        """
+        Totals of the bank transactions and invoices of a year, converted into one currency
+        at the exchange rate of each transaction's (or invoice's) date.
+        """
+        rates = fx.rates()
+        summary = {"currency": currency.upper(), "year": year, "banks": [], "invoices": {}}
+
+        net = 0.0
+        for bank in tx.transient.list_banks():
+            txs = [t for t in tx.transient.list_transactions(bank.id) if t.date.year == year]
+            converted = rates.convert_many([t.amount for t in txs], bank.currency, currency, [t.date for t in txs])
+            income = sum(amount for amount in converted if amount > 0)
+            expenses = sum(amount for amount in converted if amount < 0)
+            net += income + expenses
+            summary["banks"].append({
+                "bank": bank.name,
+                "bank_currency": bank.currency,
+                "transactions": len(txs),
+                "income": round(income, 2),
+                "expenses": round(expenses, 2),
+            })
+
+        invoices = [i for i in tx.transient.list_invoices() if i.created.year == year]
+        converted = rates.convert_many([i.amount for i in invoices], [i.currency for i in invoices], currency, [i.created for i in invoices])
+        summary["invoices"] = {"count": len(invoices), "total": round(sum(converted), 2)}
+        summary["net_bank_movement"] = round(net, 2)
+        return summary
+
+    @query
+    def tool_query_bank_balance(bank_id: uuid.UUID, date: datetime.date, end_date: Optional[datetime.date] = None):
+        """
+        The balance of a bank account at the end of a date (relative to before its first transaction).
+        With end_date, also the opening, closing, lowest and highest balance from date to end_date.
+        """
+        bank = next((bank for bank in tx.transient.list_banks() if bank.id == bank_id), None)
+        if bank is None:
+            return {"error": f"Bank with id {bank_id} not found"}
+        if end_date is None:
+            return {"bank": bank.name, "currency": bank.currency, "date": date, "balance": round(tx.transient.balance_at(bank_id, date), 2)}
+
+        ((low, low_date), (high, high_date)) = tx.transient.balance_extremes(bank_id, date, end_date)
+        return {
+            "bank": bank.name,
+            "currency": bank.currency,
+            "opening": round(tx.transient.balance_at(bank_id, date - datetime.timedelta(days=1)), 2),
+            "closing": round(tx.transient.balance_at(bank_id, end_date), 2),
+            "lowest": {"balance": round(low, 2), "date": low_date},
+            "highest": {"balance": round(high, 2), "date": high_date},
+        }
+
+    @query
+    def tool_query_spend_report(
+        group_by: List[str],
+        supplier_id: Optional[uuid.UUID] = None,
+        vat_type: Optional[str] = None,
+        bank_id: Optional[uuid.UUID] = None,
+        from_month: Optional[str] = None,
+        to_month: Optional[str] = None,
+    ):
+        """
+        Totals of the expensed spend, computed by the server: use these numbers instead of adding up transactions.
+        group_by is a list of "supplier", "vat_type" ("VAT" or "NO_VAT"), "month" and "bank" (empty for the grand total).
+        Months are "YYYY-MM", from_month and to_month are inclusive (e.g. a quarter is "2024-01" to "2024-03").
+        Spend is in the currency of the bank and positive for outgoing money.
+        """
+        return spend_report(
+            tx.transient, group_by,
+            supplier=supplier_id, vat_type=vat_type, bank=bank_id,
+            from_month=from_month, to_month=to_month,
+        )
+
+    @tool
     def tool_action_clear():
         """Undo all actions"""
         # Emit clear event (more efficient than individual removals)
@@ -157,9 +521,9 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
             tx.action_callback('action_clear', {})
 
         tx.actions = []
-        tx.transient = Transient(tx.state)
+        tx.transient = tx.new_transient()
 
-    @function_tool
+    @tool
     def tool_action_undo(id: str):
         """Undoes the action with the given id"""
         for (act_id, _) in tx.actions:
@@ -176,15 +540,15 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
         actions = [change for change in tx.actions if change[0] != id]
 
         # reset state and try to replay all actions
-        transient = Transient(tx.state)
+        transient = tx.new_transient()
         for (_, action) in actions:
-            action.apply(transient)
+            action.apply(tx.traced(transient))
 
         # write back the new state and actions
         tx.transient = transient
         tx.actions = actions
 
-    @function_tool
+    @tool
     def tool_action_new_client(
         name: str,
         email: str,
@@ -216,8 +580,8 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
                 'email': email,
                 'phone': phone,
                 'address': address,
-                'country_code': country_code,
-                'vat_number': vat_number
+                'country_code': action.country,
+                'vat_number': action.vat_number
             }
             tx.action_callback('action_created', {
                 'action_id': act_id,
@@ -228,7 +592,7 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
 
         return {"action_id": act_id, "client_id": str(client_id)}
 
-    @function_tool
+    @tool
     def tool_action_update_supplier(
         name: str,
         email: str,
@@ -280,8 +644,8 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
                 'email': email,
                 'phone': phone,
                 'address': address,
-                'country': country,
-                'vat_number': vat_number
+                'country': action.country,
+                'vat_number': action.vat_number
             }
             tx.action_callback('action_created', {
                 'action_id': act_id,
@@ -292,7 +656,7 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
 
         return {"action_id": act_id, "supplier_id": str(supplier_id)}
 
-    @function_tool
+    @tool
     def tool_action_create_invoice(
         client_id: uuid.UUID,
         amount: float,
@@ -332,7 +696,36 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
 
         return act_id
 
-    @function_tool
+    @tool
+    def tool_action_settle_invoice(invoice_id: uuid.UUID, bank_tx: uuid.UUID, amount: Optional[float] = None):
+        """
+        Record that an incoming bank transaction pays (part of) an invoice.
+        Without an amount, as much as possible is settled. Call once per invoice when a transfer pays several.
+        """
+        # by default as much as possible, as of now: undo and replay must not change an approved amount
+        amount = tx.transient.payment_index().check_settlement(invoice_id, bank_tx, amount)
+        action = SettleInvoice(invoice_id=invoice_id, bank_tx=bank_tx, amount=amount)
+        action.apply(tx.transient)
+        act_id = f"{action.action_type()}-{tx.act_cnt}"
+        tx.act_cnt += 1
+        tx.actions.append((act_id, action))
+
+        # Emit creation event
+        if tx.action_callback:
+            tx.action_callback('action_created', {
+                'action_id': act_id,
+                'action_type': 'settle_invoice',
+                'action_args': {
+                    'invoice_id': str(invoice_id),
+                    'bank_tx': str(bank_tx),
+                    'amount': amount,
+                },
+                'timestamp': datetime.datetime.now().isoformat()
+            })
+
+        return act_id
+
+    @tool
     def tool_action_expense(
         bank_txs: List[uuid.UUID],
         receipts: List[uuid.UUID],
@@ -415,17 +808,28 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
         # Query tools
         tool_query_client,
         tool_query_supplier,
+        tool_query_search_country,
+        tool_query_check_countries,
+        tool_query_validate_vat_numbers,
         tool_query_for_document,
         tool_query_list_bank_transactions,
         tool_query_list_unreconciled_bank_transactions,
         tool_query_list_unpaid_invoices,
+        tool_query_propose_payments,
+        tool_query_receivables_aging,
+        tool_query_list_overdue_invoices,
         tool_query_list_invoices,
+        tool_query_convert_currency,
+        tool_query_currency_summary,
+        tool_query_spend_report,
+        tool_query_bank_balance,
         # Action tools
         tool_action_clear,
         tool_action_undo,
         tool_action_new_client,
         tool_action_update_supplier,
         tool_action_create_invoice,
+        tool_action_settle_invoice,
         tool_action_expense,
     ]
 
@@ -463,4 +867,5 @@ def create_agent(action_callback: Optional[Callable] = None, initial_state: Opti
         name="Assistant",
         instructions=instructions,
         tools=tools,
+        model=model if model is not None else default_model(tx.state),
     )
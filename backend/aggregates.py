@@ -0,0 +1,177 @@
+"""
+Incrementally maintained spend aggregates.
+
+A SpendCube holds the spend of the expenses summed per
+(supplier, VAT type, month, bank): the amounts of the bank transactions
+of every expense, attributed to the month of the transaction.
+Storing an expense updates the cells it touches, so a report costs
+O(cells) instead of a scan over every expense and transaction.
+
+Amounts are in the currency of the bank, so reports keep currencies apart.
+"""
+import uuid
+
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from state import BankTransaction, Expense, State
+
+DIMENSIONS = ("supplier", "vat_type", "month", "bank")
+
+# (supplier id, vat type, "YYYY-MM", bank id)
+Key = Tuple[uuid.UUID, str, str, uuid.UUID]
+
+def month(date) -> str:
+    return f"{date.year:04d}-{date.month:02d}"
+
+class SpendCube:
+    """
+    Cells of [amount, transactions] per key.
+
+    `postings` maps a transaction id to its bank and transaction,
+    `contributions` the id of every added expense to the amounts it added.
+    """
+    def __init__(
+        self,
+        currencies: Dict[uuid.UUID, str],
+        postings: Dict[uuid.UUID, Tuple[uuid.UUID, "BankTransaction"]],
+    ):
+        self.currencies = currencies
+        self.postings = postings
+        self.cells: Dict[Key, List] = {}
+        self.contributions: Dict[uuid.UUID, List[Tuple[Key, float, int]]] = {}
+
+    @classmethod
+    def build(cls, st: "State") -> "SpendCube":
+        """A cube of all expenses of a state: a scan over every transaction and expense."""
+        banks = st.list_banks()
+        cube = cls(
+            {bank.id: bank.currency for bank in banks},
+            {tx.id: (bank.id, tx) for bank in banks for tx in st.list_transactions(bank.id)},
+        )
+        for expense in st.list_expenses():
+            cube.add(expense)
+        return cube
+
+    def delta(self) -> "SpendCube":
+        """An empty cube over the same transactions, for changes on top of this one."""
+        return SpendCube(self.currencies, self.postings)
+
+    def _update(self, key: Key, amount: float, count: int):
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = [0.0, 0]
+        cell[0] += amount
+        cell[1] += count
+        if cell[1] == 0 and abs(cell[0]) < 1e-9:
+            del self.cells[key]
+
+    def add(self, expense: "Expense"):
+        """Adds (or replaces) an expense. Transactions unknown to the cube are ignored."""
+        self.remove(expense.id)
+        contributions = []
+        for tx_id in expense.bank_txs:
+            posting = self.postings.get(tx_id)
+            if posting is None:
+                continue
+            (bank_id, tx) = posting
+            key = (expense.supplier_id, str(expense.vat_type), month(tx.date), bank_id)
+            self._update(key, tx.amount, 1)
+            contributions.append((key, tx.amount, 1))
+        self.contributions[expense.id] = contributions
+
+    def remove(self, expense_id: uuid.UUID):
+        for (key, amount, count) in self.contributions.pop(expense_id, []):
+            self._update(key, -amount, -count)
+
+    def retract(self, contributions: List[Tuple[Key, float, int]]):
+        """Cancels contributions made to another cube."""
+        for (key, amount, count) in contributions:
+            self._update(key, -amount, -count)
+
+def contributions(cubes: Iterable[SpendCube], expense_id: uuid.UUID) -> Optional[List[Tuple[Key, float, int]]]:
+    for cube in cubes:
+        found = cube.contributions.get(expense_id)
+        if found is not None:
+            return found
+    return None
+
+def report(
+    cubes: Iterable[SpendCube],
+    group_by: List[str],
+    supplier: Optional[uuid.UUID] = None,
+    vat_type: Optional[str] = None,
+    bank: Optional[uuid.UUID] = None,
+    from_month: Optional[str] = None,
+    to_month: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Sums the cells of the cubes per group, and per currency.
+
+    Months are "YYYY-MM" and both bounds are inclusive.
+    The spend of a group is the negated sum of its transactions (outgoing money is positive).
+    """
+    for dimension in group_by:
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension {dimension!r}, expected one of {', '.join(DIMENSIONS)}")
+    positions = [DIMENSIONS.index(dimension) for dimension in group_by]
+
+    groups: Dict[Tuple, List] = {}
+    for cube in cubes:
+        currencies = cube.currencies
+        for (key, (amount, count)) in cube.cells.items():
+            (key_supplier, key_vat_type, key_month, key_bank) = key
+            if supplier is not None and key_supplier != supplier:
+                continue
+            if vat_type is not None and key_vat_type != vat_type:
+                continue
+            if bank is not None and key_bank != bank:
+                continue
+            if from_month is not None and key_month < from_month:
+                continue
+            if to_month is not None and key_month > to_month:
+                continue
+            group = (*map(key.__getitem__, positions), currencies[key_bank])
+            cell = groups.get(group)
+            if cell is None:
+                cell = groups[group] = [0.0, 0]
+            cell[0] += amount
+            cell[1] += count
+
+    rows = []
+    for group in sorted(groups):
+        (amount, count) = groups[group]
+        if count == 0:
+            continue
+        row = dict(zip(group_by, group[:-1]))
+        row["currency"] = group[-1]
+        row["spend"] = round(-amount, 2)
+        row["transactions"] = count
+        rows.append(row)
+    return rows
+
+def spend_report(st: "State", group_by: List[str], **filters) -> Dict:
+    """A report of a state, with the names of the suppliers and banks and totals per currency."""
+    rows = st.spend_report(group_by, **filters)
+
+    if "supplier" in group_by:
+        names = {supplier.id: supplier.name for supplier in st.list_suppliers()}
+        for row in rows:
+            row["supplier_name"] = names.get(row["supplier"], "")
+    if "bank" in group_by:
+        names = {bank.id: bank.name for bank in st.list_banks()}
+        for row in rows:
+            row["bank_name"] = names.get(row["bank"], "")
+
+    totals: Dict[str, List] = {}
+    for row in rows:
+        total = totals.setdefault(row["currency"], [0.0, 0])
+        total[0] += row["spend"]
+        total[1] += row["transactions"]
+    return {
+        "groups": rows,
+        "totals": [
+            {"currency": currency, "spend": round(spend, 2), "transactions": count}
+            for (currency, (spend, count)) in sorted(totals.items())
+        ],
+    }
@@ -0,0 +1,105 @@
+"""
+Aging of receivables.
+
+The open invoices of every (client, currency) are kept sorted by due date,
+with the cumulative sum of what is outstanding on them (rebuilt on the
+first query after a change of the group). The aging buckets of a group
+are four bisections and differences of the sums, so a report takes time
+proportional to the number of groups, not the number of invoices.
+
+Amounts are in cents.
+"""
+import bisect
+import datetime
+import itertools
+import uuid
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# (name, fewest days overdue) of the buckets, most overdue first:
+# an invoice due on the date is not yet due (as in PaymentIndex.overdue_invoices)
+BUCKETS = (("90+", 91), ("61-90", 61), ("31-60", 31), ("1-30", 1))
+
+class Receivables:
+    """The open invoices of one client in one currency, by due date."""
+    __slots__ = ("dues", "ids", "amounts", "sums")
+
+    def __init__(self):
+        self.dues: List[int] = []
+        self.ids: List[uuid.UUID] = []
+        self.amounts: List[int] = []
+        # sums[i] is the total of amounts[:i] (None when stale)
+        self.sums: Optional[List[int]] = None
+
+    def copy(self) -> "Receivables":
+        copy = Receivables()
+        (copy.dues, copy.ids, copy.amounts, copy.sums) = (list(self.dues), list(self.ids), list(self.amounts), self.sums)
+        return copy
+
+    def _find(self, due: int, id: uuid.UUID) -> int:
+        i = bisect.bisect_left(self.dues, due)
+        while self.ids[i] != id:
+            i += 1
+        return i
+
+    def remove(self, due: int, id: uuid.UUID):
+        i = self._find(due, id)
+        del self.dues[i], self.ids[i], self.amounts[i]
+        self.sums = None
+
+    def insert(self, due: int, id: uuid.UUID, amount: int):
+        i = bisect.bisect_right(self.dues, due)
+        self.dues.insert(i, due)
+        self.ids.insert(i, id)
+        self.amounts.insert(i, amount)
+        self.sums = None
+
+    def total(self, start: int, end: int) -> int:
+        """Outstanding on the invoices at positions [start, end)."""
+        if self.sums is None:
+            self.sums = [0, *itertools.accumulate(self.amounts)]
+        return self.sums[end] - self.sums[start]
+
+    def buckets(self, as_of: int) -> Dict[str, int]:
+        """Outstanding per bucket of days overdue at the date (an ordinal), and not yet due."""
+        result = {}
+        start = 0
+        for (name, days) in BUCKETS:
+            end = bisect.bisect_right(self.dues, as_of - days)
+            result[name] = self.total(start, end)
+            start = end
+        result["not_due"] = self.total(start, len(self.dues))
+        return result
+
+class AgingIndex:
+    def __init__(self):
+        self.groups: Dict[Tuple[uuid.UUID, str], Receivables] = {}
+
+    def copy(self) -> "AgingIndex":
+        index = AgingIndex()
+        index.groups = {key: group.copy() for (key, group) in self.groups.items()}
+        return index
+
+    def update(self, client: uuid.UUID, currency: str, due: datetime.date, id: uuid.UUID, old: int, new: int):
+        """The outstanding amount of an invoice changed from `old` to `new` cents."""
+        key = (client, currency)
+        if old > 0:
+            self.groups[key].remove(due.toordinal(), id)
+        if new > 0:
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = Receivables()
+            group.insert(due.toordinal(), id, new)
+        elif key in self.groups and not self.groups[key].ids:
+            del self.groups[key]
+
+    def open_invoices(self, client: uuid.UUID, currency: str) -> List[uuid.UUID]:
+        group = self.groups.get((client, currency))
+        return list(group.ids) if group is not None else []
+
+    def report(self, as_of: datetime.date, client: Optional[uuid.UUID] = None) -> Iterator[Tuple[uuid.UUID, str, Dict[str, int]]]:
+        """(client, currency, buckets) of every client (or one) with open invoices."""
+        day = as_of.toordinal()
+        for ((key_client, currency), group) in self.groups.items():
+            if client is None or key_client == client:
+                yield (key_client, currency, group.buckets(day))
@@ -1,17 +1,31 @@
 import asyncio
 import json
 import logging
+import os
+import time
 import uuid
 
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, Any
-from pydantic.json import pydantic_encoder
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from typing import Dict, Any, List, Optional, Set, Tuple
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from agents import SQLiteSession, Runner
 
-from agent import create_agent
+import uploads
+from agent import Transaction, create_agent, new_transaction
+from aggregates import spend_report
+from state import State
+from store_sqlite import StoreSqlite
+from events import ActionEventBus
+from log import SAMPLED, session_id as log_session_id, setup_logging
+from metrics import REGISTRY, RUN_DURATION, TIME_TO_FIRST_DELTA, gauge, monitor_loop_lag
+from outbox import Outbox
+from tracing import TRACER, report as tracing_report
+from instrument import StateProfile
+from transport import Codec, negotiate
 
 from messages import (
     BaseMessage,
@@ -25,24 +39,23 @@ from messages import (
     ToolOutputMessage,
     TextDeltaMessage,
     TextDoneMessage,
-    ActionCreatedMessage,
-    ActionRemovedMessage,
-    ActionClearMessage,
+    ActionsStateMessage,
+    RunCancelledMessage,
+    DocumentProgressMessage,
 )
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-# Add TRACE level for very verbose logging
-TRACE = 5
-logging.addLevelName(TRACE, "TRACE")
-def trace(self, message, *args, **kwargs):
-    if self.isEnabledFor(TRACE):
-        self._log(TRACE, message, args, **kwargs)
-logging.Logger.trace = trace
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    monitor = asyncio.create_task(monitor_loop_lag())
+    yield
+    monitor.cancel()
+    uploads.shutdown()
 
-app = FastAPI(title="Accta Agent API")
+app = FastAPI(title="Accta Agent API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -57,41 +70,119 @@ app.add_middleware(
 current_dir = Path(__file__).parent
 frontend_build_path = current_dir.parent / "frontend" / "build"
 
+# Ledger shared by all worker processes (see `main.py --mode serve-prod`).
+# When unset, every connection gets its own copy of the test state.
+LEDGER_DB = os.environ.get("ACCTA_LEDGER_DB")
+
+_ledger: Optional[State] = None
+
+def ledger() -> Optional[State]:
+    global _ledger
+    if _ledger is None and LEDGER_DB:
+        _ledger = StoreSqlite(LEDGER_DB)
+    return _ledger
+
 class ConnectionManager:
     def __init__(self):
         self.websocket_sessions: Dict[WebSocket, SQLiteSession] = {}
         self.websocket_agents: Dict[WebSocket, Any] = {}
         self.websocket_actions: Dict[WebSocket, List[Dict]] = {}  # Track actions per connection
+        self.websocket_codecs: Dict[WebSocket, Codec] = {}  # Wire encoding per connection
+        self.websocket_runs: Dict[WebSocket, asyncio.Task] = {}  # In-flight agent run per connection
+        self.websocket_outboxes: Dict[WebSocket, Outbox] = {}  # Send queue per connection
+        self.websocket_buses: Dict[WebSocket, ActionEventBus] = {}  # Action events per connection
+        self.websocket_profiles: Dict[WebSocket, StateProfile] = {}  # State access statistics per connection
+        self.websocket_transactions: Dict[WebSocket, Transaction] = {}  # State of the agent per connection
+        self.websocket_uploads: Dict[WebSocket, Set[asyncio.Task]] = {}  # Document extractions per connection
 
     async def connect(self, websocket: WebSocket):
-        await websocket.accept()
+        codec = negotiate(websocket)
+        await websocket.accept(subprotocol=codec.subprotocol)
         session_id = str(uuid.uuid4())
         session = SQLiteSession(session_id=session_id, db_path=":memory:")
+        log_session_id.set(session_id)  # tags the logs of this connection (and the tasks it starts)
+
+        outbox = Outbox(websocket, codec)
+        outbox.start()
+
+        async def consume(events):
+            await self._handle_action_events(websocket, events)
+
+        bus = ActionEventBus(consume)
+        bus.start()
+        self.websocket_buses[websocket] = bus
 
-        # Create action callback for this websocket
-        def action_callback(event_type: str, data: Dict):
-            asyncio.create_task(self._handle_action_event(websocket, event_type, data))
+        profile = StateProfile()
+        self.websocket_profiles[websocket] = profile
 
-        agent = create_agent(action_callback)  # Create fresh agent with action callback
+        self.new_agent(websocket)  # Create fresh agent with action callback
         self.websocket_sessions[websocket] = session
-        self.websocket_agents[websocket] = agent
         self.websocket_actions[websocket] = []
-        logger.info(f"WebSocket connected: {websocket.client} (session: {session_id[:8]}..., total connections: {len(self.websocket_sessions)})")
+        self.websocket_codecs[websocket] = codec
+        self.websocket_outboxes[websocket] = outbox
+        logger.info("WebSocket connected: %s (session: %s..., total connections: %d)", websocket.client, session_id[:8], len(self.websocket_sessions))
         return session_id, session
 
-    def disconnect(self, websocket: WebSocket):
+    def new_agent(self, websocket: WebSocket):
+        """Gives the connection a new agent, on a fresh transaction"""
+        tx = new_transaction(self.action_callback(websocket), ledger(), self.websocket_profiles.get(websocket))
+        self.websocket_transactions[websocket] = tx
+        self.websocket_agents[websocket] = create_agent(transaction=tx)
+
+    async def disconnect(self, websocket: WebSocket):
+        bus = self.websocket_buses.pop(websocket, None)
+        if bus is not None:
+            await bus.close()
+        outbox = self.websocket_outboxes.pop(websocket, None)
+        if outbox is not None:
+            await outbox.close()
+        for task in self.websocket_uploads.pop(websocket, ()):
+            task.cancel()
         session = self.websocket_sessions.pop(websocket, None)
         self.websocket_agents.pop(websocket, None)
+        self.websocket_transactions.pop(websocket, None)
         self.websocket_actions.pop(websocket, None)
+        self.websocket_codecs.pop(websocket, None)
+        self.websocket_profiles.pop(websocket, None)
         session_id = session.session_id if session else "unknown"
-        logger.info(f"WebSocket disconnected: {websocket.client} (session: {session_id[:8] if session else 'unknown'}..., remaining connections: {len(self.websocket_sessions)})")
+        logger.info("WebSocket disconnected: %s (session: %s..., remaining connections: %d)", websocket.client, session_id[:8], len(self.websocket_sessions))
+
+    def is_running(self, websocket: WebSocket) -> bool:
+        run = self.websocket_runs.get(websocket)
+        return run is not None and not run.done()
+
+    async def cancel_run(self, websocket: WebSocket) -> bool:
+        """Cancels the in-flight agent run (if any) and waits for it to wind down."""
+        run = self.websocket_runs.pop(websocket, None)
+        if run is None or run.done():
+            return False
+        run.cancel()
+        try:
+            await run
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error("Error while cancelling agent run: %s", e)
+        return True
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
         await websocket.send_text(message)
 
     async def send_message(self, message: BaseMessage, websocket: WebSocket):
-        """Send a Pydantic dataclass message as JSON to the websocket."""
-        await websocket.send_text(json.dumps(message, default=pydantic_encoder))
+        """Queue a Pydantic dataclass message for the websocket, waiting if the client is behind."""
+        outbox = self.websocket_outboxes.get(websocket)
+        if outbox is not None:
+            await outbox.put(message)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.websocket_sessions),
+            "outboxes": {
+                self.websocket_sessions[websocket].session_id: outbox.stats()
+                for (websocket, outbox) in self.websocket_outboxes.items()
+                if websocket in self.websocket_sessions
+            },
+        }
 
     def get_session(self, websocket: WebSocket) -> SQLiteSession:
         return self.websocket_sessions.get(websocket)
@@ -99,66 +190,200 @@ class ConnectionManager:
     def get_agent(self, websocket: WebSocket):
         return self.websocket_agents.get(websocket)
 
-    async def _handle_action_event(self, websocket: WebSocket, event_type: str, data: Dict):
-        """Handle action events from the backend and send to frontend"""
+    def get_websocket(self, session_id: str) -> Optional[WebSocket]:
+        for (websocket, session) in self.websocket_sessions.items():
+            if session.session_id == session_id:
+                return websocket
+        return None
+
+    def get_profile(self, session_id: str) -> Optional[StateProfile]:
+        websocket = self.get_websocket(session_id)
+        return self.websocket_profiles.get(websocket) if websocket is not None else None
+
+    def start_upload(self, websocket: WebSocket, stored: "uploads.StoredFile") -> str:
+        """Extracts an uploaded file in the background and adds it to the documents of the connection"""
+        upload_id = uuid.uuid4().hex
+        task = asyncio.create_task(self._process_upload(websocket, upload_id, stored))
+        tasks = self.websocket_uploads.setdefault(websocket, set())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return upload_id
+
+    async def _process_upload(self, websocket: WebSocket, upload_id: str, stored: "uploads.StoredFile"):
+        async def progress(stage: str, **details):
+            await self.send_message(
+                DocumentProgressMessage(upload_id=upload_id, name=stored.name, stage=stage, **details),
+                websocket
+            )
+
+        document_id = str(stored.document_id)
+        await progress("stored", document_id=document_id)
+        await progress("queued", document_id=document_id)
         try:
+            document = await uploads.extract_document(
+                stored,
+                lambda: asyncio.ensure_future(progress("extracting", document_id=document_id))
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Extraction of %s (%s) failed: %s", stored.name, stored.sha256[:12], e, exc_info=True)
+            await progress("failed", document_id=document_id, error=str(e))
+            return
+
+        tx = self.websocket_transactions.get(websocket)
+        if tx is None:
+            return
+        act_id = await tx.add_document(document)
+        if act_id is None:
+            await progress("duplicate", document_id=document_id)
+        else:
+            logger.info("Uploaded document %s (%d bytes) as %s", stored.name, stored.size, act_id)
+            await progress("done", document_id=document_id, action_id=act_id)
+
+    def action_callback(self, websocket: WebSocket):
+        """The callback through which the agent of this websocket publishes action events"""
+        return self.websocket_buses[websocket].publish
+
+    async def _handle_action_events(self, websocket: WebSocket, events: List[Tuple[str, Dict]]):
+        """Apply a batch of action events and send them to the frontend as a single diff"""
+        actions = self.websocket_actions.setdefault(websocket, [])
+        diff = []
+        for (event_type, data) in events:
             if event_type == 'action_created':
                 # Add to local actions list
-                if websocket in self.websocket_actions:
-                    self.websocket_actions[websocket].append({
-                        'id': data['action_id'],
-                        'type': data['action_type'],
-                        'args': data['action_args'],
-                        'timestamp': data['timestamp'],
-                        'status': 'active'
-                    })
-
-                # Send to frontend
-                await self.send_message(
-                    ActionCreatedMessage(
-                        action_id=data['action_id'],
-                        action_type=data['action_type'],
-                        action_args=data['action_args'],
-                        timestamp=data['timestamp']
-                    ),
-                    websocket
-                )
+                actions.append({
+                    'id': data['action_id'],
+                    'type': data['action_type'],
+                    'args': data['action_args'],
+                    'timestamp': data['timestamp'],
+                    'status': 'active'
+                })
 
             elif event_type == 'action_removed':
                 # Update local actions list
-                if websocket in self.websocket_actions:
-                    for action in self.websocket_actions[websocket]:
-                        if action['id'] == data['action_id']:
-                            action['status'] = 'removed'
-                            break
-
-                # Send to frontend
-                await self.send_message(
-                    ActionRemovedMessage(action_id=data['action_id']),
-                    websocket
-                )
+                for action in actions:
+                    if action['id'] == data['action_id']:
+                        action['status'] = 'removed'
+                        break
 
             elif event_type == 'action_clear':
                 # Clear all actions
-                if websocket in self.websocket_actions:
-                    self.websocket_actions[websocket] = []
+                actions.clear()
 
-                # Send to frontend
-                await self.send_message(
-                    ActionClearMessage(),
-                    websocket
-                )
+            else:
+                logger.warning("Unknown action event: %s", event_type)
+                continue
 
-        except Exception as e:
-            logger.error(f"Error handling action event: {e}")
+            diff.append({'event': event_type, **data})
+
+        if diff:
+            await self.send_message(
+                ActionsStateMessage(actions=diff),
+                websocket
+            )
 
 manager = ConnectionManager()
 
+gauge("accta_active_connections", "Open websocket connections", lambda: len(manager.websocket_sessions))
+gauge("accta_extract_jobs", "Document extractions queued or running", uploads.extracting)
+gauge("accta_active_runs", "Agent runs in progress", lambda: sum(manager.is_running(ws) for ws in list(manager.websocket_runs)))
+
+async def run_agent(websocket: WebSocket, session: SQLiteSession, user_input: str):
+    """Runs the agent on a single user message, streaming events to the websocket."""
+    logger.trace("Starting agent processing...")
+    started = time.perf_counter()
+    first_delta = True
+    agent = manager.get_agent(websocket)
+
+    # sent before the run starts: a cancellation while this waits for room in the outbox has nothing to stop
+    await manager.send_message(
+        StartMessage(),
+        websocket
+    )
+    logger.trace("Sent start message")
+
+    result = Runner.run_streamed(
+        agent,
+        input=user_input,
+        session=session,
+        max_turns=50,
+    )
+
+    try:
+        logger.trace("Starting event stream...")
+        async for event in result.stream_events():
+            if event.type == 'run_item_stream_event':
+                logger.trace("Received event: %s - %s", event.type, event.name)
+                if event.name == 'tool_called':
+                    tool_name = event.item.raw_item.name
+                    tool_args = event.item.raw_item.arguments
+                    logger.debug("Tool called: %s", tool_name)
+                    logger.trace("Tool args: %s", tool_args)
+
+                    await manager.send_message(
+                        ToolCalledMessage(
+                            tool_name=tool_name,
+                            tool_args=tool_args
+                        ),
+                        websocket
+                    )
+
+                elif event.name == 'tool_output':
+                    output = event.item.output
+                    logger.trace("Tool output: %s", output)
+
+                    # Use Pydantic's built-in encoder for clean serialization
+                    await manager.send_message(
+                        ToolOutputMessage(output=output),
+                        websocket
+                    )
+
+            elif event.type == 'raw_response_event':
+                if event.data.type == 'response.output_text.delta':
+                    logger.trace("Text delta: %r", event.data.delta, extra=SAMPLED)
+                    if first_delta:
+                        TIME_TO_FIRST_DELTA.observe(time.perf_counter() - started)
+                        first_delta = False
+                    await manager.send_message(
+                        TextDeltaMessage(delta=event.data.delta),
+                        websocket
+                    )
+
+                elif event.data.type == 'response.output_text.done':
+                    logger.trace("Text done")
+                    await manager.send_message(
+                        TextDoneMessage(),
+                        websocket
+                    )
+    except asyncio.CancelledError:
+        # stop the model stream and any running tools
+        logger.debug("Agent run cancelled")
+        result.cancel()
+        RUN_DURATION.observe(time.perf_counter() - started, outcome="cancelled")
+        raise
+    except Exception as e:
+        logger.error("Agent run failed: %s", e, exc_info=True)
+        RUN_DURATION.observe(time.perf_counter() - started, outcome="error")
+        await manager.send_message(
+            ErrorMessage(message=f"Agent run failed: {e}"),
+            websocket
+        )
+        return
+
+    logger.trace("Event stream completed")
+    RUN_DURATION.observe(time.perf_counter() - started, outcome="complete")
+    await manager.send_message(
+        CompleteMessage(),
+        websocket
+    )
+    logger.trace("Sent complete message")
+
 @app.websocket("/ws/agent")
 async def websocket_endpoint(websocket: WebSocket):
-    logger.debug(f"WebSocket connection from {websocket.client}")
+    logger.debug("WebSocket connection from %s", websocket.client)
     session_id, session = await manager.connect(websocket)
-    logger.trace(f"WebSocket connected with session ID: {session_id}")
+    logger.trace("WebSocket connected with session ID: %s", session_id)
 
     # Send session ID to client
     await manager.send_message(
@@ -166,17 +391,19 @@ async def websocket_endpoint(websocket: WebSocket):
         websocket
     )
 
+    # The agent runs in a separate task,
+    # so the socket can still be read (e.g. to cancel the run) while it is in progress.
     try:
         while True:
             logger.trace("Waiting for message...")
             data = await websocket.receive_text()
-            logger.trace(f"Received data: {data}")
+            logger.trace("Received data: %s", data)
 
             try:
                 message_data = json.loads(data)
-                logger.trace(f"Parsed message: {message_data}")
+                logger.trace("Parsed message: %s", message_data)
             except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error: {e}")
+                logger.error("JSON decode error: %s", e)
                 await manager.send_message(
                     ErrorMessage(message="Invalid JSON format"),
                     websocket
@@ -186,15 +413,28 @@ async def websocket_endpoint(websocket: WebSocket):
             # Handle session management commands
             if message_data.get("type") == "session_command":
                 command = message_data.get("command")
-                if command == "clear_session":
+                if command == "cancel_run":
+                    if await manager.cancel_run(websocket):
+                        await manager.send_message(
+                            RunCancelledMessage(),
+                            websocket
+                        )
+                    else:
+                        await manager.send_message(
+                            ErrorMessage(message="No run in progress"),
+                            websocket
+                        )
+                    continue
+                elif command == "clear_session":
+                    if await manager.cancel_run(websocket):
+                        await manager.send_message(
+                            RunCancelledMessage(),
+                            websocket
+                        )
                     await session.clear_session()
-                    # Create action callback for this websocket
-                    def action_callback(event_type: str, data: Dict):
-                        asyncio.create_task(manager._handle_action_event(websocket, event_type, data))
-
                     # Create new agent with fresh state
-                    manager.websocket_agents[websocket] = create_agent(action_callback)
-                    manager.websocket_actions[websocket] = []  # Clear actions
+                    manager.new_agent(websocket)
+                    manager.action_callback(websocket)('action_clear', {})  # Clear actions
                     await manager.send_message(
                         SessionClearedMessage(session_id=session_id),
                         websocket
@@ -209,7 +449,7 @@ async def websocket_endpoint(websocket: WebSocket):
                     continue
 
             user_input = message_data.get("message", "")
-            logger.trace(f"User input: '{user_input}'")
+            logger.trace("User input: %r", user_input)
 
             if not user_input:
                 logger.trace("No message provided")
@@ -219,82 +459,127 @@ async def websocket_endpoint(websocket: WebSocket):
                 )
                 continue
 
-            logger.trace("Starting agent processing...")
-            agent = manager.get_agent(websocket)
-            result = Runner.run_streamed(
-                agent,
-                input=user_input,
-                session=session,
-                max_turns=50,
-            )
-
-            await manager.send_message(
-                StartMessage(),
-                websocket
-            )
-            logger.trace("Sent start message")
-
-            logger.trace("Starting event stream...")
-            async for event in result.stream_events():
-                if event.type == 'run_item_stream_event':
-                    logger.trace(f"Received event: {event.type} - {event.name}")
-                    if event.name == 'tool_called':
-                        tool_name = event.item.raw_item.name
-                        tool_args = event.item.raw_item.arguments
-                        logger.debug(f"Tool called: {tool_name}")
-                        logger.trace(f"Tool args: {tool_args}")
-
-                        await manager.send_message(
-                            ToolCalledMessage(
-                                tool_name=tool_name,
-                                tool_args=tool_args
-                            ),
-                            websocket
-                        )
-
-                    elif event.name == 'tool_output':
-                        output = event.item.output
-                        logger.trace(f"Tool output: {output}")
-
-                        # Use Pydantic's built-in encoder for clean serialization
-                        await manager.send_message(
-                            ToolOutputMessage(output=output),
-                            websocket
-                        )
-
-                elif event.type == 'raw_response_event':
-                    if event.data.type == 'response.output_text.delta':
-                        logger.trace(f"Text delta: {event.data.delta}")
-                        await manager.send_message(
-                            TextDeltaMessage(delta=event.data.delta),
-                            websocket
-                        )
-
-                    elif event.data.type == 'response.output_text.done':
-                        logger.trace("Text done")
-                        await manager.send_message(
-                            TextDoneMessage(),
-                            websocket
-                        )
+            if manager.is_running(websocket):
+                await manager.send_message(
+                    ErrorMessage(message="The agent is still processing the previous message"),
+                    websocket
+                )
+                continue
 
-            logger.trace("Event stream completed")
-            await manager.send_message(
-                CompleteMessage(),
-                websocket
+            manager.websocket_runs[websocket] = asyncio.create_task(
+                run_agent(websocket, session, user_input)
             )
-            logger.trace("Sent complete message")
 
     except WebSocketDisconnect:
-        logger.debug(f"WebSocket disconnected unexpectedly: {websocket.client}")
-        manager.disconnect(websocket)
+        logger.debug("WebSocket disconnected unexpectedly: %s", websocket.client)
+        await manager.cancel_run(websocket)
+        await manager.disconnect(websocket)
     except Exception as e:
-        logger.error(f"WebSocket error: {e}", exc_info=True)
-        manager.disconnect(websocket)
+        logger.error("WebSocket error: %s", e, exc_info=True)
+        await manager.cancel_run(websocket)
+        await manager.disconnect(websocket)
 
 @app.get("/api/health")
 async def health():
     return {"status": "healthy"}
 
+@app.get("/api/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/tracing")
+async def tracing_status():
+    return {
+        "enabled": TRACER.enabled,
+        "path": TRACER.path,
+        "report": tracing_report(TRACER.spans()),
+    }
+
+@app.post("/api/tracing")
+async def tracing_configure(config: Dict[str, Any]):
+    """
+    Switch tool tracing on or off: {"enabled": true}.
+    The trace file is set at startup (ACCTA_TRACE_FILE), never through the API.
+    """
+    if set(config) != {"enabled"} or not isinstance(config["enabled"], bool):
+        raise HTTPException(status_code=400, detail='Expected {"enabled": true|false}')
+    TRACER.configure(config["enabled"])
+    return {"enabled": TRACER.enabled, "path": TRACER.path}
+
+@app.get("/api/profile/{session_id}")
+async def profile_report(session_id: str):
+    profile = manager.get_profile(session_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return {"enabled": profile.enabled, **profile.report()}
+
+@app.post("/api/profile/{session_id}")
+async def profile_configure(session_id: str, config: Dict[str, Any]):
+    """Switch State profiling of a session on or off: {"enabled": true, "reset": false}"""
+    profile = manager.get_profile(session_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    profile.enabled = bool(config.get("enabled"))
+    if config.get("reset"):
+        profile.reset()
+    return {"enabled": profile.enabled}
+
+@app.get("/api/reports/spend")
+async def report_spend(
+    group_by: List[str] = Query([]),
+    supplier: Optional[uuid.UUID] = None,
+    vat_type: Optional[str] = None,
+    bank: Optional[uuid.UUID] = None,
+    from_month: Optional[str] = None,
+    to_month: Optional[str] = None,
+):
+    """Spend of the shared ledger, e.g. ?group_by=supplier&group_by=month&from_month=2024-01"""
+    st = ledger()
+    if st is None:
+        raise HTTPException(status_code=404, detail="No shared ledger (ACCTA_LEDGER_DB)")
+    try:
+        return await asyncio.to_thread(
+            spend_report, st, group_by,
+            supplier=supplier, vat_type=vat_type, bank=bank, from_month=from_month, to_month=to_month,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/documents", status_code=202)
+async def upload_documents(request: Request, session_id: str = Query(...)):
+    """
+    Upload files (multipart/form-data) to the documents of a session.
+    The files are stored as they arrive; extraction happens in the background,
+    with progress reported over the websocket of the session.
+    """
+    websocket = manager.get_websocket(session_id)
+    if websocket is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    try:
+        stored = await uploads.receive(request.stream(), request.headers.get("content-type", ""))
+    except uploads.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not stored:
+        raise HTTPException(status_code=400, detail="No files in the upload")
+    return {
+        "uploads": [
+            {
+                "upload_id": manager.start_upload(websocket, file),
+                "name": file.name,
+                "document_id": str(file.document_id),
+                "size": file.size,
+                "duplicate": file.duplicate,
+            }
+            for file in stored
+        ]
+    }
+
+@app.get("/api/connections")
+async def connections():
+    return manager.stats()
+
 # Mount static files for frontend (this must come after all API routes)
 if frontend_build_path.exists():
     app.mount("/", StaticFiles(directory=str(frontend_build_path), html=True), name="frontend")
@@ -0,0 +1,110 @@
+"""
+Running balances of bank accounts.
+
+A BalanceIndex keeps the transactions of one bank sorted by date
+with the cumulative sum of their amounts, so the balance at a date is
+found by bisection. The lowest and highest balance over a period come
+from a segment tree over the cumulative sums, built on the first such query.
+
+Banks have no opening balance: balances are relative to zero
+before the first transaction.
+"""
+import bisect
+import datetime
+import itertools
+
+from array import array
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from state import BankTransaction
+
+class BalanceIndex:
+    def __init__(self, txs: List["BankTransaction"]):
+        txs = sorted(txs, key=lambda tx: tx.date)
+        self.days = array("l", (tx.date.toordinal() for tx in txs))
+        self.sums = array("d", itertools.accumulate(tx.amount for tx in txs))
+        # segment trees of the positions of the lowest/highest sums (built on demand)
+        self.lows: Optional[array] = None
+        self.highs: Optional[array] = None
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def insert(self, tx: "BankTransaction"):
+        """Adds a transaction: O(1) at the end of the history, O(n) before it."""
+        day = tx.date.toordinal()
+        i = bisect.bisect_right(self.days, day)
+        before = self.sums[i - 1] if i > 0 else 0.0
+        self.days.insert(i, day)
+        self.sums.insert(i, before + tx.amount)
+        for j in range(i + 1, len(self.sums)):
+            self.sums[j] += tx.amount
+        self.lows = self.highs = None
+
+    def _end(self, date: datetime.date) -> int:
+        """Number of transactions on or before the date."""
+        return bisect.bisect_right(self.days, date.toordinal())
+
+    def balance_at(self, date: datetime.date) -> float:
+        """The balance at the end of the date."""
+        i = self._end(date)
+        return self.sums[i - 1] if i > 0 else 0.0
+
+    def _build(self):
+        n = len(self.sums)
+        sums = self.sums
+        lows = array("l", [0]) * (2 * n)
+        highs = array("l", [0]) * (2 * n)
+        for i in range(n):
+            lows[n + i] = highs[n + i] = i
+        for i in range(n - 1, 0, -1):
+            (a, b) = (lows[2 * i], lows[2 * i + 1])
+            lows[i] = a if sums[a] <= sums[b] else b
+            (a, b) = (highs[2 * i], highs[2 * i + 1])
+            highs[i] = a if sums[a] >= sums[b] else b
+        (self.lows, self.highs) = (lows, highs)
+
+    def _query(self, tree: array, lo: int, hi: int, sign: int) -> int:
+        """Position of the lowest sum (sign 1) or highest (sign -1) in [lo, hi), the first on ties."""
+        n = len(self.sums)
+        sums = self.sums
+        best = -1
+        lo += n
+        hi += n
+        while lo < hi:
+            if lo & 1:
+                p = tree[lo]
+                if best < 0 or (sign * sums[p], p) < (sign * sums[best], best):
+                    best = p
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                p = tree[hi]
+                if best < 0 or (sign * sums[p], p) < (sign * sums[best], best):
+                    best = p
+            lo >>= 1
+            hi >>= 1
+        return best
+
+    def extremes(self, start: datetime.date, end: datetime.date) -> Tuple[Tuple[float, datetime.date], Tuple[float, datetime.date]]:
+        """
+        The lowest and highest balance from the start of `start` to the end of `end`,
+        each with the date it was first reached.
+        """
+        if end < start:
+            raise ValueError("The end of the period is before its start")
+        if self.lows is None:
+            self._build()
+        lo = bisect.bisect_left(self.days, start.toordinal())
+        hi = self._end(end)
+        opening = self.sums[lo - 1] if lo > 0 else 0.0
+        low = high = (opening, start)
+        if lo < hi:
+            i = self._query(self.lows, lo, hi, 1)
+            j = self._query(self.highs, lo, hi, -1)
+            if self.sums[i] < opening:
+                low = (self.sums[i], datetime.date.fromordinal(self.days[i]))
+            if self.sums[j] > opening:
+                high = (self.sums[j], datetime.date.fromordinal(self.days[j]))
+        return (low, high)
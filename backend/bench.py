@@ -0,0 +1,727 @@
+"""
+Microbenchmarks for the backend hot paths.
+
+Run from the backend directory:
+
+    python bench.py              # run all benchmarks
+    python bench.py messages     # run a single benchmark
+
+Results can be saved as JSON and compared against an earlier run:
+
+    python bench.py state --json before.json
+    python bench.py state --compare before.json
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+import uuid
+
+from typing import Callable, Dict, List
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+# seconds per call, by benchmark and then by reported name
+RESULTS: Dict[str, Dict[str, float]] = {}
+_current = ""
+
+def benchmark(name: str):
+    def register(fn: Callable):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+def timeit(fn: Callable, repeat: int = 5, number: int = 1000) -> float:
+    """Returns the best per-call time (in seconds) over `repeat` rounds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def autorange(fn: Callable, repeat: int = 3, budget: float = 0.05) -> float:
+    """Like timeit, with the number of calls chosen to take about `budget` seconds."""
+    start = time.perf_counter()
+    fn()
+    once = time.perf_counter() - start
+    return min(once, timeit(fn, repeat=repeat, number=max(1, int(budget / max(once, 1e-9)))))
+
+def report(name: str, seconds: float, baseline: float = None):
+    RESULTS.setdefault(_current, {})[name] = seconds
+    line = f"  {name:<50} {seconds * 1e6:10.2f} us"
+    if baseline is not None:
+        line += f"  ({baseline / seconds:.1f}x)"
+    print(line)
+
+def message_mix() -> List:
+    """A representative mix of messages sent during a single agent run."""
+    from test_state import create_test_state
+    from messages import (
+        StartMessage, CompleteMessage, ToolCalledMessage, ToolOutputMessage,
+        TextDeltaMessage, TextDoneMessage, ActionCreatedMessage,
+    )
+
+    st = create_test_state()
+    bank = st.list_banks()[0]
+
+    mix = [StartMessage()]
+    mix += [
+        ToolCalledMessage(
+            tool_name="tool_query_list_unreconciled_bank_transactions",
+            tool_args=json.dumps({"bank_id": str(bank.id)})
+        ),
+        ToolOutputMessage(output=st.list_unreconciled_transactions(bank.id)),
+        ToolCalledMessage(
+            tool_name="tool_query_for_document",
+            tool_args=json.dumps({"search_regex": "(hotel)|(marriott)"})
+        ),
+        ToolOutputMessage(output=st.list_documents()[:4]),
+        ActionCreatedMessage(
+            action_id="expense-1",
+            action_type="reconcile_transactions",
+            action_args={
+                "bank_txs": [str(tx.id) for tx in st.list_transactions(bank.id)[:2]],
+                "receipts": [str(doc.id) for doc in st.list_documents()[:2]],
+                "supplier_id": str(uuid.uuid4()),
+            },
+            timestamp=datetime.datetime.now().isoformat()
+        ),
+    ]
+    mix += [TextDeltaMessage(delta=word + " ") for word in ("The hotel stay was reconciled " * 40).split()]
+    mix += [TextDoneMessage(), CompleteMessage()]
+    return mix
+
+@benchmark("messages")
+def bench_messages():
+    """Serialization of the websocket message mix."""
+    from pydantic_core import to_jsonable_python
+    from blobs import BlobRef
+    from serializer import encode
+
+    mix = message_mix()
+
+    def fallback(obj):
+        # the field serializer of document bodies is only used by type adapters
+        if isinstance(obj, BlobRef):
+            return obj.text()
+        raise TypeError(f"Object of type '{obj.__class__.__name__}' is not JSON serializable")
+
+    def default(obj):
+        return to_jsonable_python(obj, fallback=fallback)
+
+    def generic():
+        for msg in mix:
+            json.dumps(msg, default=default).encode()
+
+    def cached():
+        for msg in mix:
+            encode(msg)
+
+    cached() # warm the adapter cache
+
+    print(f"message mix: {len(mix)} messages, {sum(len(encode(m)) for m in mix)} bytes")
+    baseline = timeit(generic, number=100)
+    report("json.dumps + to_jsonable_python", baseline)
+    report("serializer.encode", timeit(cached, number=100), baseline)
+
+@benchmark("transport")
+def bench_transport():
+    """Wire size and encoding time of a large tool output."""
+    import zlib
+    from state import Document
+    from messages import ToolOutputMessage
+    from test_state import create_test_state
+    from transport import JsonCodec, MsgpackCodec
+
+    docs = create_test_state().list_documents()
+    output = ToolOutputMessage(output=[
+        Document(id=uuid.uuid4(), name=doc.name, description=doc.description, content=doc.content)
+        for _ in range(50) for doc in docs
+    ])
+
+    for codec in (JsonCodec(), MsgpackCodec()):
+        frames = codec.frames(output)
+        raw = sum(len(frame if codec.binary else frame.encode()) for frame in frames)
+        deflated = sum(len(zlib.compress(frame if codec.binary else frame.encode())) for frame in frames)
+        print(f"  {type(codec).__name__}: {len(frames)} frames, {raw} bytes, {deflated} bytes deflated")
+        report(f"{type(codec).__name__}.frames", timeit(lambda: codec.frames(output), number=10))
+
+def large_state(copies: int = 500):
+    """The test state with its documents duplicated `copies` times."""
+    from state import Document
+    from test_state import create_test_state
+
+    st = create_test_state()
+    for doc in st.list_documents():
+        for _ in range(copies):
+            st.store_document(
+                Document(id=uuid.uuid4(), name=doc.name, description=doc.description, content=doc.content)
+            )
+    return st
+
+async def invoke_tool(agent, name: str, args: Dict):
+    from agents.tool_context import ToolContext
+
+    tool = next(tool for tool in agent.tools if tool.name == name)
+    arguments = json.dumps(args)
+    ctx = ToolContext(context=None, tool_name=name, tool_call_id=uuid.uuid4().hex, tool_arguments=arguments)
+    return await tool.on_invoke_tool(ctx, arguments)
+
+async def loop_lag(stop, interval: float = 0.001) -> List[float]:
+    """Samples how late the event loop wakes up from a short sleep."""
+    import asyncio
+
+    lags = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+    return lags
+
+@benchmark("tools")
+def bench_tools():
+    """Event-loop lag while sessions run heavy document searches."""
+    import asyncio
+    import agent as agent_module
+    from cache import ToolCache
+
+    st = large_state()
+
+    def new_sessions() -> List:
+        # without a result cache: every search runs the tool body
+        sessions = []
+        for _ in range(8):
+            tx = agent_module.new_transaction(initial_state=st)
+            tx.cache = ToolCache(max_bytes=0)
+            sessions.append(agent_module.create_agent(transaction=tx))
+        return sessions
+
+    print(f"  {len(st.list_documents())} documents, 8 sessions x 4 searches")
+
+    async def run():
+        sessions = new_sessions()
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(loop_lag(stop))
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            invoke_tool(agent, "tool_query_for_document", {"search_regex": "(hotel)|(truck)"})
+            for agent in sessions
+            for _ in range(4)
+        ])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        lags = sorted(await sampler)
+        return elapsed, lags
+
+    for workers in (0, agent_module.TOOL_WORKERS or 4):
+        agent_module.TOOL_WORKERS = workers
+        agent_module._tool_pool = None
+        (elapsed, lags) = asyncio.run(run())
+        label = "inline on the event loop" if workers == 0 else f"{workers} tool workers"
+        print(
+            f"  {label:<26} total {elapsed * 1e3:8.1f} ms"
+            f"  loop lag p50 {lags[len(lags) // 2] * 1e3:6.2f} ms"
+            f"  p99 {lags[int(len(lags) * 0.99)] * 1e3:6.2f} ms"
+            f"  max {lags[-1] * 1e3:6.2f} ms"
+        )
+
+@benchmark("logging")
+def bench_logging():
+    """Per-call cost of hot path log statements."""
+    import logging
+    from log import SAMPLED, setup_logging, stop_logging
+
+    logger = logging.getLogger("bench")
+    delta = "The hotel stay was reconciled "
+    output = message_mix()[2].output
+
+    def eager():
+        logger.trace(f"Text delta: {delta}")
+        logger.trace(f"Tool output: {output}")
+
+    def lazy():
+        logger.trace("Text delta: %r", delta, extra=SAMPLED)
+        logger.trace("Tool output: %s", output)
+
+    def debug():
+        logger.debug("Tool called: %s", "tool_query_for_document")
+
+    class SlowStream:
+        """A sink which takes 100us per write, like a busy terminal or pipe."""
+        def write(self, data):
+            time.sleep(0.0001)
+
+        def flush(self):
+            pass
+
+    sink = SlowStream()
+
+    setup_logging(level="INFO", stream=sink)
+    baseline = timeit(eager, number=1000)
+    report("INFO, eager f-strings", baseline)
+    report("INFO, lazy arguments", timeit(lazy, number=1000), baseline)
+
+    # the old setup: a synchronous stream handler on the root logger
+    root = logging.getLogger()
+    handlers = root.handlers
+    root.handlers = [logging.StreamHandler(sink)]
+    root.setLevel(logging.DEBUG)
+    baseline = timeit(debug, number=1000)
+    report("DEBUG, synchronous stream handler", baseline)
+    root.handlers = handlers
+
+    setup_logging(level="DEBUG", stream=sink)
+    report("DEBUG, queue handler", timeit(debug, number=1000), baseline)
+    setup_logging(level="DEBUG", fmt="json", stream=sink)
+    report("DEBUG, queue handler (json)", timeit(debug, number=1000), baseline)
+    stop_logging()
+
+# ledger sizes (in bank transactions) of the state benchmark
+SCALES = [1000, 10000, 100000]
+
+def state_ledger(scale: int) -> Dict:
+    """
+    A synthetic ledger of `scale` transactions and the entities the state
+    benchmarks act on: a transaction and a document free to be expensed
+    (and ones that are not), a client and a supplier.
+    """
+    from ledger_gen import generate_ledger
+
+    st = generate_ledger(transactions=scale, suppliers=max(50, scale // 100), clients=max(20, scale // 500), invoices=scale // 10, seed=scale)
+    bank = st.list_banks()[0]
+    txs = st.list_transactions(bank.id)
+    docs = st.list_documents()
+    expensed = {tx_id for expense in st.list_expenses() for tx_id in expense.bank_txs}
+    used = {doc_id for expense in st.list_expenses() for doc_id in expense.docs_ids}
+    return {
+        "state": st,
+        "bank": bank,
+        "free_tx": next(tx for tx in reversed(txs) if tx.id not in expensed and tx.amount < 0),
+        "expensed_tx": next(tx for tx in txs if tx.id in expensed),
+        "free_doc": next(doc for doc in reversed(docs) if doc.id not in used),
+        "used_doc": next(doc for doc in docs if doc.id in used),
+        "client": st.list_clients()[-1],
+        "supplier": st.list_suppliers()[-1],
+    }
+
+def state_actions(ledger: Dict) -> Dict:
+    """One action of every kind on the ledger of `state_ledger`."""
+    from action import Expense, NewInvoice, UpdateClient, UpdateSupplier, VATType
+
+    (client, supplier) = (ledger["client"], ledger["supplier"])
+    return {
+        "update_supplier": UpdateSupplier(
+            supplier_id=supplier.id, name=supplier.name, email=supplier.email, phone=supplier.phone,
+            address=supplier.address, vat_number="DK24256790", country="DK"
+        ),
+        "update_client": UpdateClient(
+            client_id=client.id, name=client.name, address=client.address, vat_number="DK24256790",
+            email=client.email, phone=client.phone, country="DK"
+        ),
+        "new_invoice": NewInvoice(
+            invoice_id=uuid.uuid4(), amount=100.0, currency="USD", client_id=client.id,
+            due_date=datetime.date(2025, 2, 1), description="Consulting"
+        ),
+        "expense": Expense(
+            bank_txs=[ledger["free_tx"].id], docs_ids=[ledger["free_doc"].id], supplier=supplier.id,
+            vat_type=VATType(), description="Benchmark"
+        ),
+    }
+
+@benchmark("state")
+def bench_state():
+    """
+    State operations, actions, undo and document search on synthetic ledgers.
+    test_state_bench.py runs the same operations as a pytest suite, checking their results.
+    """
+    import asyncio
+    from agent import Transaction, create_agent
+    from state import Transient
+
+    for scale in SCALES:
+        start = time.perf_counter()
+        ledger = state_ledger(scale)
+        (st, bank, free_tx, free_doc) = (ledger["state"], ledger["bank"], ledger["free_tx"], ledger["free_doc"])
+        (client, docs) = (ledger["client"], st.list_documents())
+        print(
+            f" {scale} transactions: {len(docs)} documents, {len(st.list_expenses())} expenses,"
+            f" {len(st.list_suppliers())} suppliers (generated in {time.perf_counter() - start:.1f} s)"
+        )
+
+        for (label, state) in (("memory", st), ("transient", Transient(st))):
+            report(f"{scale}/{label}/list_documents", autorange(state.list_documents))
+            report(f"{scale}/{label}/list_expenses", autorange(state.list_expenses))
+            report(f"{scale}/{label}/list_transactions", autorange(lambda: state.list_transactions(bank.id)))
+            report(f"{scale}/{label}/list_unused_documents", autorange(state.list_unused_documents))
+            report(f"{scale}/{label}/list_unreconciled_transactions", autorange(lambda: state.list_unreconciled_transactions(bank.id)))
+            report(f"{scale}/{label}/check_transaction_ids", autorange(lambda: state.check_transaction_ids([free_tx.id])))
+            report(f"{scale}/{label}/check_document_ids", autorange(lambda: state.check_document_ids([free_doc.id])))
+            report(f"{scale}/{label}/check_transactions_not_expensed", autorange(lambda: state.check_transactions_not_expensed([free_tx.id])))
+            report(f"{scale}/{label}/check_documents_not_expensed", autorange(lambda: state.check_documents_not_expensed([free_doc.id])))
+            report(f"{scale}/{label}/check_client_id", autorange(lambda: state.check_client_id(client.id)))
+
+        actions = state_actions(ledger)
+        for (name, action) in actions.items():
+            report(f"{scale}/apply/{name}", autorange(lambda: action.apply(Transient(st))))
+
+        # undo the first of 9 actions: the other 8 are replayed
+        tx = Transaction(st)
+        for action in [actions["update_supplier"], actions["update_client"], actions["new_invoice"]] * 3:
+            tx.add_action(action)
+
+        def undo():
+            tx.tool_action_undo(tx.actions[0][0])
+            tx.add_action(actions["update_supplier"])
+        report(f"{scale}/undo", autorange(undo))
+
+        agent = create_agent(initial_state=st)
+        search = lambda: asyncio.run(invoke_tool(agent, "tool_query_for_document", {"search_regex": "(hotel)|(marriott)"}))
+        report(f"{scale}/tool_query_for_document", autorange(search, budget=0.2))
+
+@benchmark("fx")
+def bench_fx():
+    """Loading the rate history, conversion of a year of transactions and the currency summary tool."""
+    import asyncio
+    import fx
+    from agent import create_agent
+    from ledger_gen import generate_ledger
+
+    start = time.perf_counter()
+    rates = fx.FxRates.load(fx.default_rates_path())
+    report("load", time.perf_counter() - start)
+    report("rate_at", autorange(lambda: rates.rate_at("USD", "DKK", datetime.date(2024, 6, 1))))
+
+    st = generate_ledger(banks=4, transactions=100000, invoices=10000, seed=1)
+    txs = st.list_transactions(st.list_banks()[0].id)
+    amounts = [tx.amount for tx in txs]
+    dates = [tx.date for tx in txs]
+    print(f" converting {len(txs)} transactions")
+    report("convert_many", autorange(lambda: rates.convert_many(amounts, "USD", "EUR", dates)))
+    report("convert", autorange(lambda: [rates.convert(a, "USD", "EUR", d) for (a, d) in zip(amounts, dates)]))
+
+    # only the first call computes the summary: the tool cache answers the rest
+    agent = create_agent(initial_state=st)
+    summary = lambda: asyncio.run(invoke_tool(agent, "tool_query_currency_summary", {"currency": "EUR", "year": 2024}))
+    start = time.perf_counter()
+    summary()
+    report("tool_query_currency_summary", time.perf_counter() - start)
+    report("tool_query_currency_summary/cached", autorange(summary))
+
+@benchmark("reports")
+def bench_reports():
+    """Spend reports from the maintained aggregates, against a scan of the ledger."""
+    from aggregates import SpendCube, report as spend_report
+    from ledger_gen import generate_ledger
+    from state import Expense, Transient
+
+    for scale in SCALES:
+        st = generate_ledger(transactions=scale, suppliers=max(50, scale // 100), invoices=scale // 10, seed=scale)
+        transient = Transient(st)
+        print(f" {scale} transactions: {len(st.list_expenses())} expenses, {len(st.spend_cubes()[0].cells)} cells")
+        for group_by in ([], ["vat_type"], ["supplier", "month"]):
+            name = "+".join(group_by) or "total"
+            report(f"{scale}/{name}/scan", autorange(lambda: spend_report([SpendCube.build(st)], group_by)))
+            report(f"{scale}/{name}/memory", autorange(lambda: st.spend_report(group_by)))
+            report(f"{scale}/{name}/transient", autorange(lambda: transient.spend_report(group_by)))
+
+        bank = st.list_banks()[0]
+        tx = st.list_transactions(bank.id)[0]
+        supplier = st.list_suppliers()[0]
+        expense = lambda: Expense(id=uuid.uuid4(), bank_txs=[tx.id], docs_ids=[], supplier_id=supplier.id, description="", vat_type="VAT")
+        report(f"{scale}/store_expense/transient", autorange(lambda: transient.store_expense(expense())))
+
+@benchmark("balance")
+def bench_balance():
+    """Balance at a date and lowest/highest balance over a quarter, indexed against a scan."""
+    from ledger_gen import generate_ledger
+
+    day = datetime.date(2024, 6, 1)
+    (start, end) = (datetime.date(2024, 4, 1), datetime.date(2024, 6, 30))
+    for scale in SCALES:
+        st = generate_ledger(banks=1, transactions=scale, seed=scale)
+        bank = st.list_banks()[0]
+
+        def scan():
+            return sum(tx.amount for tx in st.list_transactions(bank.id) if tx.date <= day)
+
+        report(f"{scale}/balance_at/scan", autorange(scan))
+        start_time = time.perf_counter()
+        st.balance_at(bank.id, day)
+        report(f"{scale}/balance_at/build", time.perf_counter() - start_time)
+        report(f"{scale}/balance_at/indexed", autorange(lambda: st.balance_at(bank.id, day)))
+        def scan_extremes():
+            balance = 0.0
+            balances = []
+            for tx in sorted(st.list_transactions(bank.id), key=lambda tx: tx.date):
+                if tx.date > end:
+                    break
+                balance += tx.amount
+                if tx.date >= start:
+                    balances.append(balance)
+            return (min(balances), max(balances))
+
+        report(f"{scale}/balance_extremes/scan", autorange(scan_extremes))
+        report(f"{scale}/balance_extremes/indexed", autorange(lambda: st.balance_extremes(bank.id, start, end)))
+
+@benchmark("payments")
+def bench_payments():
+    """Unpaid invoices, payment proposals and receivables aging from the payment index, against a scan of the ledger."""
+    from ledger_gen import generate_ledger
+    from payments import PaymentIndex
+    from state import Settlement, Transient
+
+    for scale in SCALES:
+        st = generate_ledger(transactions=scale, invoices=scale // 10, seed=scale)
+        clients = {client.id: client.name for client in st.list_clients()}
+        start = time.perf_counter()
+        index = st.payment_index()
+        report(f"{scale}/build", time.perf_counter() - start)
+        report(f"{scale}/copy", autorange(index.copy))
+
+        transient = Transient(st)
+        report(f"{scale}/list_unpaid_invoices/scan", autorange(lambda: PaymentIndex.build(transient).unpaid_invoices()))
+        report(f"{scale}/list_unpaid_invoices/indexed", autorange(transient.list_unpaid_invoices))
+        invoices = [index.invoices[id] for (_, id) in index.unpaid[:100]]
+        report(f"{scale}/propose/100 invoices", autorange(lambda: [index.propose(i.id, clients[i.client], 3) for i in invoices]))
+
+        as_of = datetime.date(2024, 9, 1)
+        report(f"{scale}/receivables_aging", autorange(lambda: transient.receivables_aging(as_of)))
+        report(f"{scale}/list_overdue_invoices/january", autorange(lambda: transient.list_overdue_invoices(datetime.date(2024, 2, 1))))
+
+        # storing the same settlement again replaces it: the index is updated twice
+        payment = next(id for (id, unallocated) in index.unallocated.items() if unallocated > 0)
+        settlement = Settlement(id=uuid.uuid4(), invoice_id=invoices[0].id, bank_tx=payment, amount=0.01)
+        report(f"{scale}/store_settlement", autorange(lambda: transient.store_settlement(settlement)))
+
+@benchmark("refdata")
+def bench_refdata():
+    """Building the reference data indexes, country lookups and batch validation."""
+    import country
+    import refdata
+
+    start = time.perf_counter()
+    data = refdata.ReferenceData(country.COUNTRIES)
+    report("build", time.perf_counter() - start)
+    report("country/code", autorange(lambda: data.country("USA")))
+    report("country/alias", autorange(lambda: data.country("united states")))
+    report("search/prefix", autorange(lambda: data.search("united")))
+    report("search/fuzzy", autorange(lambda: data.search("Germny")))
+    report("search_country", autorange(lambda: country.search_country("Denmark")))
+
+    from test_state import create_test_state
+
+    st = create_test_state()
+    records = [st.company(), *st.list_clients(), *st.list_suppliers()] * 1000
+    print(f" validating {len(records)} records")
+    report("validate", autorange(lambda: data.validate(records)))
+    report("validate/single", autorange(lambda: [data.validate([record]) for record in records]))
+
+@benchmark("vat")
+def bench_vat():
+    """Bulk validation of VAT numbers: every number checked once (cold cache) and again (cached)."""
+    import random
+    import vat
+    from state import Supplier
+
+    countries = ["DK", "DE", "NL", "FR", "GB", "SE", "IT", "PL", "US"]
+    for scale in SCALES:
+        rng = random.Random(scale)
+        # a supplier base in which every number is used by ten suppliers
+        numbers = [(country, f"{country}{rng.randrange(10**8, 10**9)}") for country in rng.choices(countries, k=max(scale // 10, 1))]
+        suppliers = [
+            Supplier(id=uuid.uuid4(), name="", email="", phone="", address="", vat_number=number, country=country)
+            for (country, number) in numbers * 10
+        ]
+
+        def cold():
+            vat._validate.cache_clear()
+            return vat.validate_many(suppliers)
+
+        report(f"{scale}/validate_many/cold", autorange(cold))
+        report(f"{scale}/validate_many/cached", autorange(lambda: vat.validate_many(suppliers)))
+        report(f"{scale}/validate/uncached", autorange(lambda: [vat._validate.__wrapped__(vat.compact(s.vat_number), s.country) for s in suppliers]))
+
+@benchmark("uploads")
+def bench_uploads():
+    """Streaming a multipart upload to disk, with and without a copy of the file already stored."""
+    import asyncio
+    import tempfile
+    import uploads
+
+    size = 16 * 1024 * 1024
+    boundary = "benchboundary"
+    data = os.urandom(size)
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"data.bin\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+
+    async def chunks():
+        for i in range(0, len(body), 64 * 1024):
+            yield body[i:i + 64 * 1024]
+
+    with tempfile.TemporaryDirectory() as directory:
+        receive = lambda: asyncio.run(uploads.receive(chunks(), f"multipart/form-data; boundary={boundary}", directory, 2 * size))
+        start = time.perf_counter()
+        receive()
+        report("receive/16 MB", time.perf_counter() - start)
+        report("receive/16 MB duplicate", autorange(receive))
+
+        async def lagged():
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(loop_lag(stop))
+            await asyncio.sleep(0)  # the sampler is waiting before the upload starts
+            await uploads.receive(chunks(), f"multipart/form-data; boundary={boundary}", directory, 2 * size)
+            stop.set()
+            return sorted(await sampler)
+        lags = asyncio.run(lagged())
+        print(f"  loop lag while receiving: p50 {lags[len(lags) // 2] * 1e3:.2f} ms  max {lags[-1] * 1e3:.2f} ms")
+
+@benchmark("blobs")
+def bench_blobs():
+    """Memory held by documents with their bodies in the blob store, and searching those bodies."""
+    import random
+    import re
+    import tempfile
+    import tracemalloc
+    import blobs
+    from state import Document
+
+    rng = random.Random(1)
+    words = ["invoice", "receipt", "total", "amount", "vat", "hotel", "flight", "taxi", "dinner", "software"]
+    count = 2000
+    bodies = [" ".join(rng.choice(words) for _ in range(800)) + f" ref-{i}" for i in range(count)]
+    with tempfile.TemporaryDirectory() as directory:
+        store = blobs.BlobStore(directory)
+        start = time.perf_counter()
+        refs = [store.put(body) for body in bodies]
+        report(f"{count}/put", time.perf_counter() - start)
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        documents = [Document(id=uuid.uuid4(), name="", description="", content=ref) for ref in refs]
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        text_bytes = sum(len(body) for body in bodies)
+        print(f" {count} documents hold {held // 1024} KB, their bodies are {text_bytes // 1024} KB")
+
+        pattern = re.compile(r"ref-1999\b", re.IGNORECASE)
+        report(f"{count}/search/str", autorange(lambda: [pattern.search(body) for body in bodies]))
+        report(f"{count}/search/mmap", autorange(lambda: [doc.content.search(pattern) for doc in documents]))
+        report(f"{count}/search/text", autorange(lambda: [pattern.search(doc.content.text()) for doc in documents]))
+
+def exif_jpeg(taken: str, latitude: float, longitude: float) -> bytes:
+    """A (pixel-less) JPEG with the EXIF date and GPS coordinates of a phone photo."""
+    import struct
+
+    def rationals(degrees: float) -> bytes:
+        (minutes, seconds) = divmod(round(abs(degrees) * 360000), 6000)
+        return struct.pack("<6I", minutes // 60, 1, minutes % 60, 1, seconds, 100)
+
+    def ifd(offset: int, entries: List) -> bytes:
+        # entries of (tag, type, count, inline value or data); data follows the directory
+        head = struct.pack("<H", len(entries))
+        data = b""
+        data_offset = offset + 2 + 12 * len(entries) + 4
+        for (tag, kind, count, value) in entries:
+            if isinstance(value, bytes) and len(value) > 4:
+                head += struct.pack("<HHII", tag, kind, count, data_offset + len(data))
+                data += value
+            else:
+                head += struct.pack("<HHI", tag, kind, count) + (value if isinstance(value, bytes) else struct.pack("<I", value)).ljust(4, b"\x00")
+        return head + b"\x00\x00\x00\x00" + data
+
+    stamp = taken.encode() + b"\x00"
+    gps = [
+        (1, 2, 2, b"S\x00" if latitude < 0 else b"N\x00"), (2, 5, 3, rationals(latitude)),
+        (3, 2, 2, b"W\x00" if longitude < 0 else b"E\x00"), (4, 5, 3, rationals(longitude)),
+    ]
+    ifd0_size = len(ifd(8, [(0x8769, 4, 1, 0), (0x8825, 4, 1, 0)]))
+    exif_offset = 8 + ifd0_size
+    exif_ifd = ifd(exif_offset, [(0x9003, 2, len(stamp), stamp)])
+    gps_offset = exif_offset + len(exif_ifd)
+    tiff = b"II*\x00" + struct.pack("<I", 8)
+    tiff += ifd(8, [(0x8769, 4, 1, exif_offset), (0x8825, 4, 1, gps_offset)]) + exif_ifd + ifd(gps_offset, gps)
+    app1 = b"Exif\x00\x00" + tiff
+    frame = struct.pack(">HBHHB", 11, 8, 3024, 4032, 1) + b"\x01\x11\x00"
+    return b"\xff\xd8\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1 + b"\xff\xc0" + frame + b"\xff\xd9"
+
+@benchmark("geo")
+def bench_geo():
+    """Reverse geocoding of GPS coordinates with the k-d tree, against a scan of the gazetteer, and EXIF parsing."""
+    import math
+    import random
+    import extract
+    import geo
+
+    start = time.perf_counter()
+    places = geo.Gazetteer(geo.parse(geo.GAZETTEER))
+    report(f"{len(places.places)}/build", time.perf_counter() - start)
+
+    rng = random.Random(1)
+    # uniform over the sphere
+    points = [(math.degrees(math.asin(rng.uniform(-1, 1))), rng.uniform(-180, 180)) for _ in range(1000)]
+    vectors = [geo.unit_vector(place.latitude, place.longitude) for place in places.places]
+
+    def scan(latitude: float, longitude: float):
+        point = geo.unit_vector(latitude, longitude)
+        return min(range(len(vectors)), key=lambda i: sum((a - b) ** 2 for (a, b) in zip(point, vectors[i])))
+
+    for (latitude, longitude) in points[:100]:
+        assert places.places[scan(latitude, longitude)] == places.nearest(latitude, longitude)[0]
+    report("nearest/scan", autorange(lambda: [scan(*point) for point in points]) / len(points))
+    report("nearest/kdtree", autorange(lambda: [places.nearest(*point) for point in points]) / len(points))
+    report("describe", autorange(lambda: [places.describe(*point) for point in points]) / len(points))
+
+    photo = exif_jpeg("2024:05:03 14:22:10", 48.8584, 2.2945)
+    found = extract.exif(photo)
+    print(f" exif: {found['date']} at {places.describe(found['latitude'], found['longitude'])}")
+    report("exif", autorange(lambda: extract.exif(photo)))
+
+def compare(baseline: Dict[str, Dict[str, float]]):
+    """Prints the results which differ by more than 10% from the baseline."""
+    print("compared to the baseline:")
+    for (bench, results) in RESULTS.items():
+        for (name, seconds) in results.items():
+            before = baseline.get(bench, {}).get(name)
+            if before is None or abs(seconds / before - 1) < 0.1:
+                continue
+            verdict = "slower" if seconds > before else "faster"
+            print(f"  {bench}/{name:<50} {before * 1e6:10.2f} us -> {seconds * 1e6:10.2f} us  {max(seconds, before) / min(seconds, before):.2f}x {verdict}")
+
+def main():
+    global _current
+
+    parser = argparse.ArgumentParser(description="ACCTA benchmarks")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--json", help="Save the results to this file")
+    parser.add_argument("--compare", help="Compare the results to an earlier --json file")
+    parser.add_argument("--scales", help=f"Ledger sizes of the state benchmark (default: {','.join(map(str, SCALES))})")
+    args = parser.parse_args()
+
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+
+    if args.scales:
+        SCALES[:] = [int(scale) for scale in args.scales.split(",")]
+
+    for name in args.names or BENCHMARKS:
+        print(f"[{name}] {BENCHMARKS[name].__doc__}")
+        _current = name
+        BENCHMARKS[name]()
+        print()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(RESULTS, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Content-addressed storage of document bodies.
+
+Bodies are written once, as UTF-8 files named by their SHA-256, to a
+blob directory. A document only holds a `BlobRef` (the hash and size of
+its body), and the body is read through an mmap of the file when it is
+needed, so resident memory grows with the number of documents, not the
+size of their text.
+
+An SQLite ledger keeps its bodies next to its database, in `<db>.blobs`,
+and the bodies of in-memory ledgers go to accta-blobs in the temp
+directory. ACCTA_BLOB_DIR replaces both.
+
+`BlobText` is the pydantic field type of such bodies:
+it is validated from the text (which is then stored) or a reference,
+and serialized back to the text, or to a reference with the
+serialization context {"blob_refs": True} (as the SQLite store does).
+A "blobs" store in the context is the one the text is stored to and
+references are resolved in (a referenced body must be there),
+and where bodies are copied to when serialized as references.
+"""
+import functools
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+import threading
+
+from typing import Annotated, Any, Dict, Optional
+
+from pydantic import PlainSerializer, PlainValidator, SerializationInfo, ValidationInfo, WithJsonSchema
+
+BLOB_DIR = os.environ.get("ACCTA_BLOB_DIR")
+
+class BlobStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+    def put(self, text: str) -> "BlobRef":
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            # written under another name first: readers never see a partial blob
+            with tempfile.NamedTemporaryFile(dir=self.directory, prefix=".blob-", delete=False) as f:
+                f.write(data)
+            os.replace(f.name, path)
+        return BlobRef(digest, len(data), len(data) == len(text), self)
+
+    def add(self, ref: "BlobRef") -> "BlobRef":
+        """The body of a reference to another store, copied to this one."""
+        if ref.store is self:
+            return ref
+        path = self.path(ref.digest)
+        if not os.path.exists(path):
+            with tempfile.NamedTemporaryFile(dir=self.directory, prefix=".blob-", delete=False) as f:
+                f.write(ref.store.read(ref.digest))
+            os.replace(f.name, path)
+        return BlobRef(ref.digest, ref.size, ref.ascii, self)
+
+    def read(self, digest: str) -> bytes:
+        with open(self.path(digest), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""  # empty files cannot be mapped
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                return view[:]
+
+    def search(self, digest: str, pattern: "re.Pattern[bytes]") -> bool:
+        """Searches the mapped file itself, without reading it into memory."""
+        with open(self.path(digest), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return pattern.search(b"") is not None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                return pattern.search(view) is not None
+
+class BlobRef:
+    """A body in a blob store. Compares by hash; its repr is that of the text."""
+    __slots__ = ("digest", "size", "ascii", "store")
+
+    def __init__(self, digest: str, size: int, ascii: bool, store: BlobStore):
+        self.digest = digest
+        self.size = size  # in bytes
+        self.ascii = ascii  # bytes and characters coincide
+        self.store = store
+
+    def text(self) -> str:
+        return self.store.read(self.digest).decode("utf-8")
+
+    def search(self, pattern: "re.Pattern[str]") -> bool:
+        """If the pattern matches the text (as `pattern.search(text)` would)."""
+        if self.ascii and pattern.pattern.isascii():
+            ascii_pattern = _ascii_pattern(pattern.pattern, pattern.flags)
+            if ascii_pattern is not None:
+                return self.store.search(self.digest, ascii_pattern)
+        return pattern.search(self.text()) is not None
+
+    def __str__(self) -> str:
+        return self.text()
+
+    def __repr__(self) -> str:
+        return repr(self.text())
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, BlobRef):
+            return self.digest == other.digest
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+@functools.lru_cache(maxsize=256)
+def _ascii_pattern(source: str, flags: int) -> "Optional[re.Pattern[bytes]]":
+    # on ASCII text a bytes pattern matches where the str pattern does
+    try:
+        return re.compile(source.encode("ascii"), flags & ~re.UNICODE)
+    except re.error:
+        return None  # e.g. escapes of non-ASCII characters
+
+_stores: Dict[str, BlobStore] = {}
+_lock = threading.Lock()
+
+def blobs(directory: Optional[str] = None) -> BlobStore:
+    """The blob store of a directory, by default that of in-memory ledgers."""
+    directory = BLOB_DIR or directory or os.path.join(tempfile.gettempdir(), "accta-blobs")
+    store = _stores.get(directory)
+    if store is None:
+        with _lock:
+            store = _stores.get(directory)
+            if store is None:
+                store = _stores[directory] = BlobStore(directory)
+    return store
+
+def ledger_blobs(db_path: str) -> BlobStore:
+    """The blob store of an SQLite ledger: next to its database."""
+    return blobs(os.path.abspath(db_path) + ".blobs")
+
+def _context_store(info: Any) -> BlobStore:
+    store = info.context.get("blobs") if info.context else None
+    return store if store is not None else blobs()
+
+def _validate(value: Any, info: ValidationInfo) -> BlobRef:
+    if isinstance(value, BlobRef):
+        return value
+    if isinstance(value, str):
+        return _context_store(info).put(value)
+    if isinstance(value, dict) and "sha256" in value:
+        store = _context_store(info)
+        if not os.path.exists(store.path(value["sha256"])):
+            raise ValueError(f"Blob {value['sha256']} is missing from {store.directory}")
+        return BlobRef(value["sha256"], value["size"], value["ascii"], store)
+    raise ValueError("Expected the text or a blob reference")
+
+def _serialize(ref: BlobRef, info: SerializationInfo) -> Any:
+    if info.context and info.context.get("blob_refs"):
+        if info.context.get("blobs") is not None:
+            ref = info.context["blobs"].add(ref)
+        return {"sha256": ref.digest, "size": ref.size, "ascii": ref.ascii}
+    return ref.text()
+
+BlobText = Annotated[
+    BlobRef,
+    PlainValidator(_validate),
+    PlainSerializer(_serialize),
+    WithJsonSchema({"type": "string"}),
+]
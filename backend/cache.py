@@ -0,0 +1,120 @@
+"""
+Per-session cache of query tool results.
+
+Results are keyed on the tool, its arguments and the version of the
+session's transient state. Every store_* on a Transient bumps its version,
+and undo/clear replace the transient (with a fresh version), so a cached
+result is never served for a state it was not computed on.
+The backing ledger is not versioned: sessions only ever modify their transient.
+"""
+import dataclasses
+import functools
+import os
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from blobs import BlobRef
+from metrics import TOOL_CACHE_EVICTIONS, TOOL_CACHE_HITS, TOOL_CACHE_MISSES
+
+# Byte budget of each session's cache (0 disables caching)
+TOOL_CACHE_BYTES = int(os.environ.get("ACCTA_TOOL_CACHE_BYTES", 4 * 1024 * 1024))
+
+MISSING = object()
+
+SAMPLE = 64
+
+def estimate_size(value: Any) -> int:
+    """
+    Roughly the length of the repr of a result, without building it:
+    document bodies count with the size of their blob, and are not read.
+    """
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, BlobRef):
+        return value.size + 2
+    if isinstance(value, (list, tuple, set, frozenset)):
+        if len(value) > SAMPLE:
+            # long results (e.g. all documents) are estimated from a sample of their items
+            items = list(value)
+            step = len(items) / SAMPLE
+            sample = [items[int(i * step)] for i in range(SAMPLE)]
+            return 2 + sum(estimate_size(item) + 2 for item in sample) * len(items) // SAMPLE
+        return 2 + sum(estimate_size(item) + 2 for item in value)
+    if isinstance(value, dict):
+        return 2 + sum(estimate_size(key) + estimate_size(item) + 4 for (key, item) in value.items())
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        names = _field_names(type(value))
+        return len(type(value).__name__) + 2 + sum(len(name) + 3 + estimate_size(getattr(value, name)) for name in names)
+    return len(repr(value))  # numbers, ids, dates, ...
+
+@functools.lru_cache(maxsize=None)
+def _field_names(cls: type) -> Tuple[str, ...]:
+    return tuple(field.name for field in dataclasses.fields(cls))
+
+class ToolCache:
+    """
+    LRU cache with a byte budget.
+
+    The size of a result is (an estimate of) the length of its repr, roughly what the model receives.
+    Not thread-safe: calls are serialized by the transaction lock.
+    """
+    def __init__(self, max_bytes: int = TOOL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # version of the entries: older entries can never be hit again
+        self.version: Optional[int] = None
+
+    @staticmethod
+    def key(tool: str, args: Tuple, kwargs: Dict, version: int) -> Hashable:
+        return (tool, repr(args), repr(sorted(kwargs.items())), version)
+
+    def _sync(self, version: int):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def get(self, key: Hashable, tool: str) -> Any:
+        """The cached result, or MISSING."""
+        self._sync(key[-1])
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            TOOL_CACHE_MISSES.inc(tool=tool)
+            return MISSING
+        self.entries.move_to_end(key)
+        self.hits += 1
+        TOOL_CACHE_HITS.inc(tool=tool)
+        return entry[0]
+
+    def put(self, key: Hashable, result: Any, size: Optional[int] = None):
+        self._sync(key[-1])
+        size = estimate_size(result) if size is None else size
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        self.entries[key] = (result, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            (_, (_, evicted)) = self.entries.popitem(last=False)
+            self.size -= evicted
+            TOOL_CACHE_EVICTIONS.inc()
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
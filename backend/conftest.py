@@ -0,0 +1,11 @@
+import sys
+
+def pytest_terminal_summary(terminalreporter):
+    """Prints the times reported by the benchmark tests (see bench.report)."""
+    bench = sys.modules.get("bench")
+    if bench is None or not bench.RESULTS:
+        return
+    for (name, results) in bench.RESULTS.items():
+        terminalreporter.section(f"benchmark: {name}")
+        for (label, seconds) in results.items():
+            terminalreporter.write_line(f"  {label:<50} {seconds * 1e6:10.2f} us")
@@ -1,7 +1,8 @@
+import functools
 import re
 
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional, Tuple
 
 @dataclass
 class Country:
@@ -266,12 +267,13 @@ COUNTRY_CODES = {
     country.alpha2: country for country in COUNTRIES
 }
 
+@functools.lru_cache(maxsize=256)
+def _search(regex: str) -> Tuple[Country, ...]:
+    pattern = re.compile(regex)
+    return tuple(country for country in COUNTRIES if pattern.search(country.name))
+
 def search_country(regex: str) -> List[Country]:
-    results = []
-    for country in COUNTRIES:
-        if re.search(regex, country.name):
-            results.append(country)
-    return results
+    return list(_search(regex))
 
 def to_country_code(regex: str) -> str:
     """
@@ -285,8 +287,19 @@ def to_country_code(regex: str) -> str:
         raise ValueError("Multiple countries match")
     return countries[0].alpha2
 
+def find_country(value: str) -> Optional[Country]:
+    """
+    The country with the given alpha2, alpha3 or numeric code,
+    name or common alias (e.g. "USA", "uk"), case-insensitively.
+    """
+    from refdata import reference
+    return reference().country(value)
+
 def validate_country_code(code: str) -> bool:
     """
-    Returns True if the given code is a valid alpha2 country code.
+    Returns True if the given code is a valid alpha2, alpha3 or numeric country code.
     """
-    return code in COUNTRY_CODES
+    from refdata import reference
+    data = reference()
+    code = code.strip().upper()
+    return code in data.by_alpha2 or code in data.by_alpha3 or (code.isdigit() and int(code) in data.by_numeric)
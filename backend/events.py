@@ -0,0 +1,78 @@
+"""Ordered delivery of action events"""
+import asyncio
+import logging
+import threading
+
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Event = Tuple[str, Dict]
+
+def compact(events: List[Event]) -> List[Event]:
+    """Drops events made obsolete by a later 'action_clear' in the same batch."""
+    for i in range(len(events) - 1, -1, -1):
+        if events[i][0] == 'action_clear':
+            return events[i:]
+    return events
+
+class ActionEventBus:
+    """
+    Per-session queue of action events.
+
+    The transaction publishes synchronously, in the order the actions are applied,
+    and a single consumer task receives the events in batches:
+    everything published since the consumer last ran.
+
+    Tools run on worker threads, so `publish` may be called off the event loop:
+    such events are handed to the loop in publication order.
+    """
+    def __init__(self, consumer: Callable[[List[Event]], Awaitable[None]]):
+        self.consumer = consumer
+        self.events: Deque[Event] = deque()
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_id: Optional[int] = None
+
+    def publish(self, event_type: str, data: Dict):
+        if self.loop is not None and threading.get_ident() != self.thread_id:
+            self.loop.call_soon_threadsafe(self._append, event_type, data)
+        else:
+            self._append(event_type, data)
+
+    def _append(self, event_type: str, data: Dict):
+        self.events.append((event_type, data))
+        self.ready.set()
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.task = asyncio.create_task(self._drain())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.events.clear()
+
+    async def _drain(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+
+            batch = list(self.events)
+            self.events.clear()
+            if not batch:
+                continue
+
+            try:
+                await self.consumer(compact(batch))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error handling action events: %s", e, exc_info=True)
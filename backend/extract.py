@@ -0,0 +1,279 @@
+"""
+Text and metadata extraction of uploaded documents.
+
+Runs in the worker processes of the upload pool (see uploads.py),
+so everything here is plain functions of a file path.
+Only the standard library is used: PDFs give up the text of their
+(Flate compressed or plain) content streams, images their size and
+the date and place (see geo.py) in their EXIF metadata.
+"""
+import datetime
+import mimetypes
+import os
+import re
+import struct
+import zlib
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import geo
+
+# Bumped when extraction changes, so results cached by earlier versions are redone
+VERSION = 2
+
+# Text kept as the content of a document
+MAX_CONTENT = 200_000
+
+TEXT_TYPES = ("text/", "application/json", "application/xml", "application/csv")
+
+def kind(name: str, content_type: str = "") -> str:
+    """The media type of a file: the declared one, else guessed from its name."""
+    if content_type and content_type != "application/octet-stream":
+        return content_type.split(";")[0].strip().lower()
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+def decode_text(data: bytes) -> str:
+    for encoding in ("utf-8-sig", "cp1252"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return data.decode("latin-1")
+
+_STREAM = re.compile(rb"stream\r?\n(.*?)\r?\nendstream", re.S)
+_TEXT_OPERATORS = re.compile(rb"\[((?:[^\]\\]|\\.)*)\]\s*TJ|\(((?:[^()\\]|\\.)*)\)\s*(?:Tj|'|\")|(T\*|ET)")
+_PAGE = re.compile(rb"/Type\s*/Page\b")
+_STRING = re.compile(rb"\(((?:[^()\\]|\\.)*)\)")
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+
+def _unescape(literal: bytes) -> bytes:
+    def replace(match: "re.Match") -> bytes:
+        escaped = match.group(1)
+        if escaped[:1].isdigit():
+            return bytes([int(escaped, 8) & 0xFF])
+        return _ESCAPES.get(escaped, escaped)
+    return re.sub(rb"\\([0-7]{1,3}|.)", replace, literal, flags=re.S)
+
+def _streams(data: bytes) -> Iterator[bytes]:
+    for match in _STREAM.finditer(data):
+        stream = match.group(1)
+        try:
+            yield zlib.decompress(stream)
+        except zlib.error:
+            yield stream
+
+def pdf_text(data: bytes) -> str:
+    """The text shown by the content streams of a PDF (literal strings only, no font decoding)."""
+    lines: List[str] = []
+    line: List[bytes] = []
+    for stream in _streams(data):
+        for match in _TEXT_OPERATORS.finditer(stream):
+            (array, string, newline) = match.groups()
+            if array is not None:
+                line.extend(_unescape(part) for part in _STRING.findall(array))
+            elif string is not None:
+                line.append(_unescape(string))
+            elif line:
+                lines.append(decode_text(b"".join(line)).strip())
+                line = []
+    if line:
+        lines.append(decode_text(b"".join(line)).strip())
+    return "\n".join(text for text in lines if text)
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) of a PNG, GIF or JPEG image."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n") and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    if data.startswith(b"\xff\xd8"):
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            (length,) = struct.unpack(">H", data[i + 2:i + 4])
+            # start of frame markers (not DHT, JPG or DAC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                (height, width) = struct.unpack(">HH", data[i + 5:i + 9])
+                return (width, height)
+            i += 2 + length
+    return None
+
+# EXIF tags: in the first image file directory (IFD), the Exif IFD and the GPS IFD
+_DATE_TIME = 0x0132
+_EXIF_IFD = 0x8769
+_GPS_IFD = 0x8825
+_DATE_TIME_ORIGINAL = 0x9003
+_DATE_TIME_DIGITIZED = 0x9004
+_GPS_LATITUDE_REF = 1
+_GPS_LATITUDE = 2
+_GPS_LONGITUDE_REF = 3
+_GPS_LONGITUDE = 4
+_GPS_DATE_STAMP = 0x1D
+
+# size of a value of the TIFF field types: BYTE, ASCII, SHORT, LONG, RATIONAL, UNDEFINED, SLONG, SRATIONAL
+_FIELD_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+def _exif_tiff(data: bytes) -> Optional[bytes]:
+    """The TIFF structure holding the EXIF metadata of a JPEG, PNG or TIFF image."""
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return data
+    if data.startswith(b"\xff\xd8"):
+        i = 2
+        while i + 4 <= len(data) and data[i] == 0xFF:
+            marker = data[i + 1]
+            if marker == 0xDA:  # start of scan: no more metadata
+                return None
+            (length,) = struct.unpack(">H", data[i + 2:i + 4])
+            if marker == 0xE1 and data[i + 4:i + 10] == b"Exif\x00\x00":
+                return data[i + 10:i + 2 + length]
+            i += 2 + length
+        return None
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        i = 8
+        while i + 8 <= len(data):
+            (length, chunk) = struct.unpack(">I4s", data[i:i + 8])
+            if chunk == b"eXIf":
+                return data[i + 8:i + 8 + length]
+            if chunk == b"IDAT":
+                return None
+            i += 12 + length
+    return None
+
+def _ifd(tiff: bytes, offset: int, order: str) -> Dict[int, Any]:
+    """The (decoded) fields of the image file directory at the offset."""
+    fields: Dict[int, Any] = {}
+    (count,) = struct.unpack(order + "H", tiff[offset:offset + 2])
+    for i in range(count):
+        entry = offset + 2 + 12 * i
+        (tag, kind, number) = struct.unpack(order + "HHI", tiff[entry:entry + 8])
+        size = _FIELD_SIZES.get(kind)
+        if size is None:
+            continue
+        start = entry + 8
+        if size * number > 4:  # not inline: an offset to the value
+            (start,) = struct.unpack(order + "I", tiff[start:start + 4])
+        raw = tiff[start:start + size * number]
+        if len(raw) < size * number:
+            continue
+        if kind == 2:
+            fields[tag] = raw.split(b"\x00")[0].decode("latin-1").strip()
+        elif kind in (5, 10):
+            values = struct.unpack(order + ("I" if kind == 5 else "i") * 2 * number, raw)
+            fields[tag] = [n / d if d else None for (n, d) in zip(values[::2], values[1::2])]
+        elif kind in (3, 4, 9):
+            fields[tag] = list(struct.unpack(order + {3: "H", 4: "I", 9: "i"}[kind] * number, raw))
+        else:
+            fields[tag] = raw
+    return fields
+
+def _exif_date(value: Any) -> Optional[datetime.date]:
+    if not isinstance(value, str):
+        return None
+    for layout in ("%Y:%m:%d %H:%M:%S", "%Y:%m:%d"):
+        try:
+            return datetime.datetime.strptime(value[:19], layout).date()
+        except ValueError:
+            pass
+    return None  # e.g. "0000:00:00 00:00:00" of cameras without a clock
+
+def _degrees(value: Any, ref: Any, negative: str) -> Optional[float]:
+    if not isinstance(value, list) or len(value) != 3 or None in value:
+        return None
+    degrees = value[0] + value[1] / 60 + value[2] / 3600
+    return -degrees if ref == negative else degrees
+
+def _pointer(ifd: Dict[int, Any], tag: int) -> Optional[int]:
+    """The offset of the IFD a field points to (None if absent, or not an offset)."""
+    value = ifd.get(tag)
+    if isinstance(value, list) and value and isinstance(value[0], int):
+        return value[0]
+    return None
+
+def exif(data: bytes) -> Dict[str, Any]:
+    """
+    The date ("date", a datetime.date) and GPS coordinates ("latitude" and
+    "longitude", in degrees) in the EXIF metadata of an image, when present.
+    """
+    tiff = _exif_tiff(data)
+    if tiff is None or len(tiff) < 8:
+        return {}
+    order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if order is None:
+        return {}
+    found: Dict[str, Any] = {}
+    try:
+        (first,) = struct.unpack(order + "I", tiff[4:8])
+        ifd0 = _ifd(tiff, first, order)
+        (exif_offset, gps_offset) = (_pointer(ifd0, _EXIF_IFD), _pointer(ifd0, _GPS_IFD))
+        exif_ifd = _ifd(tiff, exif_offset, order) if exif_offset is not None else {}
+        gps = _ifd(tiff, gps_offset, order) if gps_offset is not None else {}
+    except (struct.error, IndexError, TypeError, ValueError):
+        return {}  # truncated or corrupt
+
+    # the time the photo was taken, else when it was stored
+    for value in (exif_ifd.get(_DATE_TIME_ORIGINAL), exif_ifd.get(_DATE_TIME_DIGITIZED),
+                  ifd0.get(_DATE_TIME), gps.get(_GPS_DATE_STAMP)):
+        date = _exif_date(value)
+        if date is not None:
+            found["date"] = date
+            break
+
+    latitude = _degrees(gps.get(_GPS_LATITUDE), gps.get(_GPS_LATITUDE_REF), "S")
+    longitude = _degrees(gps.get(_GPS_LONGITUDE), gps.get(_GPS_LONGITUDE_REF), "W")
+    if latitude is not None and longitude is not None and (latitude, longitude) != (0.0, 0.0):
+        if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            found["latitude"] = latitude
+            found["longitude"] = longitude
+    return found
+
+def _size(size: int) -> str:
+    for unit in ("bytes", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+        size /= 1024
+    return ""
+
+def extract(path: str, name: str, content_type: str = "") -> Dict[str, Any]:
+    """
+    The description and text content of a file, and the date (ISO format)
+    and location ("Paris, France") of images with EXIF metadata.
+    """
+    media = kind(name, content_type)
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        data = f.read()
+
+    content = ""
+    details = []
+    date = location = None
+    if media.startswith(TEXT_TYPES):
+        content = decode_text(data)
+    elif media == "application/pdf":
+        content = pdf_text(data)
+        pages = len(_PAGE.findall(data))
+        details.append(f"{pages} page{'' if pages == 1 else 's'}")
+    elif media.startswith("image/"):
+        dimensions = image_size(data)
+        if dimensions is not None:
+            details.append(f"{dimensions[0]}x{dimensions[1]} pixels")
+        try:
+            metadata = exif(data)
+        except Exception:
+            metadata = {}  # corrupt metadata: the image is still a document
+        if "date" in metadata:
+            date = metadata["date"].isoformat()
+        if "latitude" in metadata:
+            location = geo.gazetteer().describe(metadata["latitude"], metadata["longitude"])
+    content = content[:MAX_CONTENT]
+
+    description = f"{media} file ({', '.join([*details, _size(size)])})"
+    if date is not None:
+        description += f", taken {date}"
+    if location is not None:
+        description += f", location: {location}"
+    first = next((line.strip() for line in content.splitlines() if line.strip()), "")
+    if first:
+        description += f": {first[:120]}"
+    return {"version": VERSION, "description": description, "content": content, "date": date, "location": location}
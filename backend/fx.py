@@ -0,0 +1,150 @@
+"""
+Offline foreign exchange rates.
+
+Rates come from an ECB-style history file: a CSV (optionally zipped)
+with a Date column and one column of EUR reference rates per currency,
+"N/A" where there is no rate. By default the history bundled with the
+currencyconverter package is used; ACCTA_FX_RATES points to another file.
+
+The history is loaded once into per-currency arrays sorted by date.
+The rate at a date is the latest published on or before it (there are no
+rates for weekends and holidays), found by bisection.
+"""
+import bisect
+import csv
+import datetime
+import functools
+import io
+import os
+import threading
+import zipfile
+
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+Date = Union[datetime.date, str]
+
+# Rates are quoted against the euro
+BASE = "EUR"
+
+def default_rates_path() -> Optional[str]:
+    path = os.environ.get("ACCTA_FX_RATES")
+    if path:
+        return path
+    try:
+        import currency_converter
+    except ImportError:
+        return None
+    return os.path.join(os.path.dirname(currency_converter.__file__), "eurofxref-hist.zip")
+
+def _ordinal(date: Date) -> int:
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+    return date.toordinal()
+
+class Series:
+    """The rate history of one currency: parallel arrays sorted by date."""
+    __slots__ = ("days", "rates")
+
+    def __init__(self, points: List[Tuple[int, float]]):
+        points.sort()
+        self.days = array("l", (day for (day, _) in points))
+        self.rates = array("d", (rate for (_, rate) in points))
+
+    def at(self, day: int) -> float:
+        i = bisect.bisect_right(self.days, day) - 1
+        if i < 0:
+            raise ValueError(f"No rate before {datetime.date.fromordinal(self.days[0])}")
+        return self.rates[i]
+
+class FxRates:
+    def __init__(self, series: Dict[str, Series]):
+        self.series = series
+        self.rate = functools.lru_cache(maxsize=65536)(self._rate)
+
+    @classmethod
+    def parse(cls, text: str) -> "FxRates":
+        rows = csv.reader(io.StringIO(text))
+        header = [name.strip() for name in next(rows)]
+        points: Dict[str, List[Tuple[int, float]]] = {name: [] for name in header[1:] if name}
+        for row in rows:
+            if not row:
+                continue
+            day = _ordinal(row[0].strip())
+            for (name, value) in zip(header[1:], row[1:]):
+                value = value.strip()
+                if name and value and value != "N/A":
+                    points[name].append((day, float(value)))
+        return cls({name: Series(p) for (name, p) in points.items() if p})
+
+    @classmethod
+    def load(cls, path: str) -> "FxRates":
+        if path.endswith(".zip"):
+            with zipfile.ZipFile(path) as archive:
+                text = archive.read(archive.namelist()[0]).decode()
+        else:
+            with open(path) as f:
+                text = f.read()
+        return cls.parse(text)
+
+    def currencies(self) -> List[str]:
+        return sorted([BASE, *self.series])
+
+    def _rate(self, currency: str, day: int) -> float:
+        """Units of `currency` per euro on the given day (cached)."""
+        if currency == BASE:
+            return 1.0
+        series = self.series.get(currency)
+        if series is None:
+            raise ValueError(f"Unknown currency: {currency}")
+        return series.at(day)
+
+    def rate_at(self, source: str, target: str, date: Date) -> float:
+        """Units of `target` per unit of `source` at the date."""
+        day = _ordinal(date)
+        return self.rate(target.strip().upper(), day) / self.rate(source.strip().upper(), day)
+
+    def convert(self, amount: float, source: str, target: str, date: Date) -> float:
+        return amount * self.rate_at(source, target, date)
+
+    def convert_many(
+        self,
+        amounts: Sequence[float],
+        sources: Union[str, Sequence[str]],
+        target: str,
+        dates: Union[Date, Sequence[Date]],
+    ) -> List[float]:
+        """
+        Converts a column of amounts into `target` in one call.
+
+        `sources` and `dates` are either one value for the whole column or a column each.
+        The rate of every distinct (currency, date) pair is looked up once.
+        """
+        if isinstance(dates, (str, datetime.date)) and isinstance(sources, str):
+            factor = self.rate_at(sources, target, dates)
+            return [amount * factor for amount in amounts]
+
+        if isinstance(dates, (str, datetime.date)):
+            dates = [dates] * len(amounts)
+        if isinstance(sources, str):
+            factors = {date: self.rate_at(sources, target, date) for date in set(dates)}
+            return [amount * factors[date] for (amount, date) in zip(amounts, dates)]
+
+        pairs = list(zip(sources, dates))
+        factors = {pair: self.rate_at(pair[0], target, pair[1]) for pair in set(pairs)}
+        return [amount * factors[pair] for (amount, pair) in zip(amounts, pairs)]
+
+_rates: Optional[FxRates] = None
+_lock = threading.Lock()
+
+def rates() -> FxRates:
+    """The rate history, loaded on first use."""
+    global _rates
+    if _rates is None:
+        with _lock:
+            if _rates is None:
+                path = default_rates_path()
+                if path is None:
+                    raise RuntimeError("No FX rate history: install currencyconverter or set ACCTA_FX_RATES")
+                _rates = FxRates.load(path)
+    return _rates
@@ -0,0 +1,680 @@
+"""
+Offline reverse geocoding: GPS coordinates to a place, e.g. "Paris, France".
+
+The gazetteer below (capitals, and the larger cities of the countries
+most documents come from) is indexed on first use (see `gazetteer()`)
+in a k-d tree over points on the unit sphere: the nearest place in 3D
+(chord) distance is the nearest along the surface, without the
+singularities of latitude and longitude at the poles and the antimeridian.
+"""
+import math
+import threading
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from country import COUNTRY_CODES
+
+# Mean radius of the Earth (km)
+EARTH_RADIUS = 6371.0088
+
+# Places up to this far away are named as they are, those further away (but
+# within MAX_DISTANCE) with the distance, e.g. "60 km from Lyon, France"
+NEAR_DISTANCE = 40.0
+MAX_DISTANCE = 250.0
+
+# name|alpha2|latitude|longitude
+GAZETTEER = """
+Copenhagen|DK|55.676|12.568
+Aarhus|DK|56.157|10.211
+Odense|DK|55.404|10.403
+Aalborg|DK|57.048|9.919
+Esbjerg|DK|55.476|8.459
+Randers|DK|56.461|10.036
+Kolding|DK|55.490|9.472
+Horsens|DK|55.861|9.850
+Vejle|DK|55.709|9.536
+Roskilde|DK|55.642|12.080
+Herning|DK|56.139|8.973
+Helsingør|DK|56.036|12.612
+Silkeborg|DK|56.170|9.545
+Næstved|DK|55.230|11.761
+Fredericia|DK|55.566|9.753
+Viborg|DK|56.453|9.402
+Køge|DK|55.458|12.182
+Holstebro|DK|56.360|8.616
+Svendborg|DK|55.060|10.607
+Hillerød|DK|55.927|12.311
+Sønderborg|DK|54.909|9.792
+Frederikshavn|DK|57.441|10.537
+Hjørring|DK|57.464|9.982
+Billund|DK|55.731|9.112
+Rønne|DK|55.101|14.701
+Tórshavn|FO|62.009|-6.772
+Nuuk|GL|64.181|-51.694
+Stockholm|SE|59.329|18.069
+Gothenburg|SE|57.709|11.975
+Malmö|SE|55.605|13.004
+Uppsala|SE|59.859|17.639
+Lund|SE|55.705|13.191
+Helsingborg|SE|56.047|12.694
+Umeå|SE|63.826|20.263
+Oslo|NO|59.914|10.752
+Bergen|NO|60.391|5.322
+Trondheim|NO|63.431|10.395
+Stavanger|NO|58.970|5.733
+Tromsø|NO|69.649|18.956
+Longyearbyen|SJ|78.223|15.647
+Helsinki|FI|60.170|24.938
+Espoo|FI|60.205|24.652
+Tampere|FI|61.498|23.761
+Turku|FI|60.452|22.267
+Oulu|FI|65.012|25.465
+Mariehamn|AX|60.097|19.935
+Reykjavík|IS|64.147|-21.942
+Tallinn|EE|59.437|24.754
+Tartu|EE|58.378|26.729
+Riga|LV|56.950|24.105
+Vilnius|LT|54.687|25.280
+Kaunas|LT|54.899|23.904
+Berlin|DE|52.520|13.405
+Hamburg|DE|53.551|9.994
+Munich|DE|48.137|11.576
+Cologne|DE|50.938|6.960
+Frankfurt|DE|50.110|8.682
+Stuttgart|DE|48.776|9.183
+Düsseldorf|DE|51.228|6.774
+Dortmund|DE|51.514|7.466
+Essen|DE|51.456|7.012
+Leipzig|DE|51.340|12.375
+Bremen|DE|53.079|8.802
+Dresden|DE|51.051|13.738
+Hanover|DE|52.376|9.732
+Nuremberg|DE|49.452|11.077
+Kiel|DE|54.323|10.123
+Flensburg|DE|54.794|9.437
+Lübeck|DE|53.866|10.687
+Rostock|DE|54.092|12.099
+Bonn|DE|50.737|7.098
+Mannheim|DE|49.487|8.466
+Karlsruhe|DE|49.007|8.404
+Freiburg|DE|47.999|7.842
+Münster|DE|51.961|7.626
+Aachen|DE|50.776|6.084
+Paris|FR|48.857|2.352
+Marseille|FR|43.296|5.370
+Lyon|FR|45.764|4.836
+Toulouse|FR|43.605|1.444
+Nice|FR|43.710|7.262
+Nantes|FR|47.218|-1.554
+Strasbourg|FR|48.573|7.752
+Montpellier|FR|43.611|3.877
+Bordeaux|FR|44.838|-0.579
+Lille|FR|50.629|3.057
+Rennes|FR|48.117|-1.678
+Grenoble|FR|45.188|5.724
+Brest|FR|48.390|-4.486
+Dijon|FR|47.322|5.041
+Le Havre|FR|49.494|0.108
+Reims|FR|49.258|4.032
+Tours|FR|47.394|0.685
+Clermont-Ferrand|FR|45.778|3.087
+Ajaccio|FR|41.919|8.738
+Monaco|MC|43.738|7.425
+London|GB|51.507|-0.128
+Birmingham|GB|52.486|-1.890
+Manchester|GB|53.481|-2.243
+Liverpool|GB|53.408|-2.992
+Leeds|GB|53.801|-1.549
+Sheffield|GB|53.381|-1.470
+Nottingham|GB|52.954|-1.158
+Bristol|GB|51.455|-2.588
+Southampton|GB|50.910|-1.404
+Brighton|GB|50.823|-0.137
+Cambridge|GB|52.205|0.122
+Oxford|GB|51.752|-1.258
+Newcastle upon Tyne|GB|54.978|-1.618
+Glasgow|GB|55.864|-4.252
+Edinburgh|GB|55.953|-3.188
+Aberdeen|GB|57.150|-2.094
+Inverness|GB|57.478|-4.225
+Cardiff|GB|51.481|-3.179
+Belfast|GB|54.597|-5.930
+Douglas|IM|54.150|-4.482
+Saint Helier|JE|49.186|-2.107
+Saint Peter Port|GG|49.456|-2.537
+Dublin|IE|53.350|-6.260
+Cork|IE|51.898|-8.476
+Galway|IE|53.271|-9.057
+Limerick|IE|52.664|-8.630
+Amsterdam|NL|52.368|4.904
+Rotterdam|NL|51.924|4.478
+The Hague|NL|52.070|4.300
+Utrecht|NL|52.091|5.122
+Eindhoven|NL|51.441|5.470
+Groningen|NL|53.219|6.567
+Maastricht|NL|50.851|5.691
+Brussels|BE|50.850|4.352
+Antwerp|BE|51.219|4.402
+Ghent|BE|51.054|3.717
+Liège|BE|50.633|5.567
+Bruges|BE|51.209|3.225
+Luxembourg|LU|49.612|6.130
+Madrid|ES|40.417|-3.704
+Barcelona|ES|41.387|2.170
+Valencia|ES|39.470|-0.376
+Seville|ES|37.389|-5.984
+Zaragoza|ES|41.649|-0.889
+Málaga|ES|36.721|-4.421
+Bilbao|ES|43.263|-2.935
+Alicante|ES|38.345|-0.481
+Granada|ES|37.177|-3.599
+Valladolid|ES|41.652|-4.724
+A Coruña|ES|43.362|-8.411
+Palma|ES|39.570|2.650
+Ibiza|ES|38.907|1.421
+Las Palmas|ES|28.124|-15.430
+Santa Cruz de Tenerife|ES|28.464|-16.252
+Andorra la Vella|AD|42.507|1.522
+Gibraltar|GI|36.140|-5.354
+Lisbon|PT|38.722|-9.139
+Porto|PT|41.158|-8.629
+Coimbra|PT|40.203|-8.410
+Faro|PT|37.019|-7.930
+Funchal|PT|32.651|-16.908
+Ponta Delgada|PT|37.741|-25.668
+Rome|IT|41.903|12.496
+Vatican City|VA|41.902|12.453
+Milan|IT|45.464|9.190
+Naples|IT|40.852|14.268
+Turin|IT|45.070|7.687
+Genoa|IT|44.405|8.946
+Bologna|IT|44.494|11.343
+Florence|IT|43.770|11.256
+Venice|IT|45.441|12.316
+Verona|IT|45.438|10.992
+Trieste|IT|45.650|13.777
+Pisa|IT|43.723|10.402
+Bari|IT|41.117|16.872
+Palermo|IT|38.116|13.361
+Catania|IT|37.502|15.087
+Cagliari|IT|39.224|9.122
+San Marino|SM|43.936|12.447
+Valletta|MT|35.899|14.514
+Zurich|CH|47.377|8.542
+Geneva|CH|46.204|6.143
+Bern|CH|46.948|7.447
+Basel|CH|47.560|7.589
+Lausanne|CH|46.520|6.633
+Lucerne|CH|47.050|8.309
+Lugano|CH|46.004|8.951
+Vaduz|LI|47.141|9.521
+Vienna|AT|48.208|16.374
+Graz|AT|47.071|15.440
+Linz|AT|48.306|14.286
+Salzburg|AT|47.810|13.055
+Innsbruck|AT|47.269|11.404
+Prague|CZ|50.076|14.438
+Brno|CZ|49.195|16.608
+Ostrava|CZ|49.821|18.263
+Bratislava|SK|48.149|17.107
+Košice|SK|48.717|21.261
+Budapest|HU|47.498|19.040
+Debrecen|HU|47.532|21.627
+Warsaw|PL|52.230|21.012
+Kraków|PL|50.065|19.945
+Łódź|PL|51.759|19.456
+Wrocław|PL|51.108|17.039
+Poznań|PL|52.406|16.925
+Gdańsk|PL|54.352|18.647
+Szczecin|PL|53.429|14.553
+Katowice|PL|50.265|19.024
+Lublin|PL|51.246|22.568
+Ljubljana|SI|46.057|14.506
+Maribor|SI|46.555|15.646
+Zagreb|HR|45.815|15.982
+Split|HR|43.508|16.440
+Rijeka|HR|45.327|14.442
+Dubrovnik|HR|42.650|18.094
+Belgrade|RS|44.787|20.457
+Novi Sad|RS|45.267|19.833
+Sarajevo|BA|43.856|18.413
+Podgorica|ME|42.441|19.263
+Skopje|MK|41.998|21.425
+Tirana|AL|41.328|19.818
+Sofia|BG|42.698|23.322
+Plovdiv|BG|42.136|24.745
+Varna|BG|43.214|27.915
+Bucharest|RO|44.427|26.103
+Cluj-Napoca|RO|46.771|23.624
+Timișoara|RO|45.749|21.227
+Iași|RO|47.159|27.587
+Constanța|RO|44.160|28.634
+Chișinău|MD|47.011|28.863
+Kyiv|UA|50.450|30.524
+Kharkiv|UA|49.994|36.230
+Odesa|UA|46.482|30.723
+Lviv|UA|49.840|24.030
+Dnipro|UA|48.465|35.046
+Minsk|BY|53.904|27.562
+Moscow|RU|55.756|37.617
+Saint Petersburg|RU|59.939|30.316
+Kaliningrad|RU|54.710|20.511
+Kazan|RU|55.796|49.106
+Yekaterinburg|RU|56.838|60.597
+Novosibirsk|RU|55.008|82.935
+Vladivostok|RU|43.116|131.882
+Athens|GR|37.984|23.728
+Thessaloniki|GR|40.640|22.944
+Patras|GR|38.246|21.735
+Heraklion|GR|35.339|25.144
+Rhodes|GR|36.434|28.217
+Nicosia|CY|35.185|33.382
+Limassol|CY|34.707|33.022
+Larnaca|CY|34.917|33.636
+Paphos|CY|34.772|32.430
+Istanbul|TR|41.008|28.978
+Ankara|TR|39.933|32.860
+Izmir|TR|38.424|27.143
+Antalya|TR|36.897|30.713
+Bursa|TR|40.188|29.061
+Tbilisi|GE|41.716|44.783
+Yerevan|AM|40.179|44.499
+Baku|AZ|40.409|49.867
+Astana|KZ|51.169|71.449
+Almaty|KZ|43.238|76.946
+Tashkent|UZ|41.299|69.240
+Bishkek|KG|42.875|74.570
+Dushanbe|TJ|38.560|68.774
+Ashgabat|TM|37.960|58.327
+Kabul|AF|34.555|69.207
+Ulaanbaatar|MN|47.886|106.906
+Jerusalem|IL|31.769|35.216
+Tel Aviv|IL|32.085|34.782
+Ramallah|PS|31.899|35.204
+Beirut|LB|33.894|35.502
+Damascus|SY|33.514|36.277
+Amman|JO|31.954|35.911
+Baghdad|IQ|33.315|44.366
+Tehran|IR|35.689|51.389
+Riyadh|SA|24.713|46.675
+Jeddah|SA|21.485|39.192
+Kuwait City|KW|29.376|47.977
+Manama|BH|26.229|50.586
+Doha|QA|25.285|51.531
+Abu Dhabi|AE|24.453|54.377
+Dubai|AE|25.205|55.271
+Muscat|OM|23.588|58.383
+Sanaa|YE|15.369|44.191
+New Delhi|IN|28.614|77.209
+Mumbai|IN|19.076|72.878
+Bengaluru|IN|12.972|77.595
+Chennai|IN|13.083|80.271
+Kolkata|IN|22.573|88.364
+Hyderabad|IN|17.385|78.487
+Islamabad|PK|33.684|73.048
+Karachi|PK|24.861|67.010
+Lahore|PK|31.550|74.344
+Dhaka|BD|23.811|90.413
+Kathmandu|NP|27.717|85.324
+Thimphu|BT|27.472|89.639
+Colombo|LK|6.927|79.861
+Malé|MV|4.175|73.509
+Beijing|CN|39.904|116.407
+Shanghai|CN|31.230|121.474
+Guangzhou|CN|23.129|113.264
+Shenzhen|CN|22.543|114.058
+Chengdu|CN|30.573|104.067
+Hong Kong|HK|22.320|114.170
+Macau|MO|22.199|113.544
+Taipei|TW|25.033|121.565
+Tokyo|JP|35.676|139.650
+Osaka|JP|34.694|135.502
+Kyoto|JP|35.012|135.768
+Sapporo|JP|43.062|141.354
+Fukuoka|JP|33.590|130.402
+Seoul|KR|37.567|126.978
+Busan|KR|35.180|129.076
+Pyongyang|KP|39.039|125.763
+Bangkok|TH|13.756|100.502
+Phuket|TH|7.880|98.392
+Hanoi|VN|21.028|105.854
+Ho Chi Minh City|VN|10.823|106.630
+Vientiane|LA|17.975|102.633
+Phnom Penh|KH|11.556|104.928
+Yangon|MM|16.867|96.195
+Naypyidaw|MM|19.763|96.079
+Kuala Lumpur|MY|3.139|101.687
+Singapore|SG|1.352|103.820
+Jakarta|ID|-6.209|106.846
+Denpasar|ID|-8.650|115.217
+Manila|PH|14.600|120.984
+Bandar Seri Begawan|BN|4.903|114.940
+Dili|TL|-8.556|125.560
+Sydney|AU|-33.869|151.209
+Melbourne|AU|-37.814|144.963
+Brisbane|AU|-27.470|153.026
+Perth|AU|-31.951|115.861
+Adelaide|AU|-34.929|138.601
+Canberra|AU|-35.281|149.130
+Hobart|AU|-42.882|147.327
+Darwin|AU|-12.463|130.842
+Auckland|NZ|-36.848|174.763
+Wellington|NZ|-41.287|174.776
+Christchurch|NZ|-43.532|172.636
+Port Moresby|PG|-9.443|147.180
+Suva|FJ|-18.141|178.442
+Nouméa|NC|-22.276|166.458
+Port Vila|VU|-17.733|168.322
+Honiara|SB|-9.433|159.950
+Apia|WS|-13.833|-171.767
+Nukuʻalofa|TO|-21.139|-175.204
+Papeete|PF|-17.535|-149.570
+Pago Pago|AS|-14.276|-170.702
+Hagåtña|GU|13.476|144.749
+Palikir|FM|6.917|158.159
+Majuro|MH|7.090|171.380
+Tarawa|KI|1.451|173.033
+Funafuti|TV|-8.520|179.198
+Yaren|NR|-0.547|166.921
+Ngerulmud|PW|7.501|134.624
+Honolulu|US|21.307|-157.858
+Anchorage|US|61.218|-149.900
+New York|US|40.713|-74.006
+Washington|US|38.907|-77.037
+Boston|US|42.360|-71.059
+Philadelphia|US|39.953|-75.165
+Pittsburgh|US|40.441|-79.996
+Charlotte|US|35.227|-80.843
+Atlanta|US|33.749|-84.388
+Miami|US|25.762|-80.192
+Orlando|US|28.538|-81.379
+Tampa|US|27.951|-82.457
+Nashville|US|36.163|-86.781
+New Orleans|US|29.951|-90.072
+Chicago|US|41.878|-87.630
+Detroit|US|42.331|-83.046
+Minneapolis|US|44.978|-93.265
+St. Louis|US|38.627|-90.199
+Kansas City|US|39.100|-94.579
+Houston|US|29.760|-95.370
+Dallas|US|32.777|-96.797
+Austin|US|30.267|-97.743
+San Antonio|US|29.424|-98.494
+Denver|US|39.739|-104.990
+Phoenix|US|33.448|-112.074
+Salt Lake City|US|40.761|-111.891
+Las Vegas|US|36.170|-115.140
+Los Angeles|US|34.052|-118.244
+San Diego|US|32.716|-117.161
+San Francisco|US|37.775|-122.419
+San Jose|US|37.339|-121.895
+Portland|US|45.515|-122.679
+Seattle|US|47.606|-122.332
+Toronto|CA|43.653|-79.383
+Ottawa|CA|45.421|-75.697
+Montreal|CA|45.502|-73.567
+Quebec City|CA|46.813|-71.208
+Halifax|CA|44.649|-63.575
+Winnipeg|CA|49.895|-97.138
+Calgary|CA|51.045|-114.072
+Edmonton|CA|53.546|-113.494
+Vancouver|CA|49.283|-123.121
+Mexico City|MX|19.433|-99.133
+Guadalajara|MX|20.659|-103.349
+Monterrey|MX|25.686|-100.316
+Tijuana|MX|32.515|-117.038
+Cancún|MX|21.162|-86.851
+Guatemala City|GT|14.634|-90.507
+Belmopan|BZ|17.251|-88.759
+San Salvador|SV|13.693|-89.218
+Tegucigalpa|HN|14.072|-87.192
+Managua|NI|12.114|-86.236
+San José|CR|9.928|-84.091
+Panama City|PA|8.983|-79.520
+Havana|CU|23.113|-82.366
+Kingston|JM|18.018|-76.810
+Port-au-Prince|HT|18.594|-72.307
+Santo Domingo|DO|18.486|-69.931
+San Juan|PR|18.466|-66.106
+Nassau|BS|25.048|-77.355
+Hamilton|BM|32.294|-64.781
+Bridgetown|BB|13.098|-59.618
+Port of Spain|TT|10.657|-61.518
+Willemstad|CW|12.109|-68.932
+Oranjestad|AW|12.520|-70.035
+Fort-de-France|MQ|14.616|-61.059
+Pointe-à-Pitre|GP|16.241|-61.534
+Castries|LC|14.010|-60.988
+Saint George's|GD|12.056|-61.749
+Kingstown|VC|13.160|-61.225
+Roseau|DM|15.301|-61.388
+Basseterre|KN|17.302|-62.717
+Saint John's|AG|17.127|-61.846
+Bogotá|CO|4.711|-74.072
+Medellín|CO|6.244|-75.581
+Cali|CO|3.452|-76.532
+Caracas|VE|10.481|-66.904
+Quito|EC|-0.180|-78.468
+Guayaquil|EC|-2.171|-79.922
+Lima|PE|-12.046|-77.043
+Cusco|PE|-13.532|-71.967
+La Paz|BO|-16.490|-68.119
+Santa Cruz de la Sierra|BO|-17.784|-63.181
+Santiago|CL|-33.449|-70.669
+Valparaíso|CL|-33.047|-71.613
+Buenos Aires|AR|-34.604|-58.382
+Córdoba|AR|-31.420|-64.189
+Mendoza|AR|-32.889|-68.845
+Montevideo|UY|-34.901|-56.165
+Asunción|PY|-25.264|-57.576
+São Paulo|BR|-23.551|-46.633
+Rio de Janeiro|BR|-22.907|-43.173
+Brasília|BR|-15.794|-47.882
+Belo Horizonte|BR|-19.917|-43.935
+Salvador|BR|-12.978|-38.502
+Recife|BR|-8.048|-34.877
+Fortaleza|BR|-3.732|-38.527
+Manaus|BR|-3.119|-60.022
+Curitiba|BR|-25.429|-49.271
+Porto Alegre|BR|-30.035|-51.218
+Georgetown|GY|6.801|-58.155
+Paramaribo|SR|5.852|-55.204
+Cayenne|GF|4.922|-52.313
+Stanley|FK|-51.697|-57.852
+Cairo|EG|30.044|31.236
+Alexandria|EG|31.200|29.919
+Tripoli|LY|32.888|13.191
+Tunis|TN|36.806|10.182
+Algiers|DZ|36.754|3.059
+Rabat|MA|34.021|-6.842
+Casablanca|MA|33.573|-7.590
+Marrakesh|MA|31.630|-7.999
+Laayoune|EH|27.154|-13.203
+Nouakchott|MR|18.074|-15.958
+Dakar|SN|14.717|-17.467
+Banjul|GM|13.454|-16.579
+Bissau|GW|11.864|-15.598
+Conakry|GN|9.641|-13.578
+Freetown|SL|8.466|-13.232
+Monrovia|LR|6.301|-10.797
+Abidjan|CI|5.360|-4.008
+Yamoussoukro|CI|6.828|-5.290
+Accra|GH|5.604|-0.187
+Lomé|TG|6.131|1.223
+Porto-Novo|BJ|6.497|2.605
+Lagos|NG|6.524|3.379
+Abuja|NG|9.077|7.399
+Niamey|NE|13.512|2.113
+Ouagadougou|BF|12.371|-1.520
+Bamako|ML|12.639|-8.003
+Praia|CV|14.933|-23.513
+N'Djamena|TD|12.134|15.056
+Khartoum|SD|15.501|32.560
+Juba|SS|4.859|31.571
+Asmara|ER|15.323|38.925
+Addis Ababa|ET|9.030|38.740
+Djibouti|DJ|11.589|43.145
+Mogadishu|SO|2.047|45.318
+Nairobi|KE|-1.292|36.822
+Mombasa|KE|-4.043|39.668
+Kampala|UG|0.348|32.582
+Kigali|RW|-1.944|30.062
+Gitega|BI|-3.428|29.925
+Dodoma|TZ|-6.163|35.752
+Dar es Salaam|TZ|-6.792|39.208
+Zanzibar|TZ|-6.165|39.199
+Yaoundé|CM|3.848|11.502
+Douala|CM|4.051|9.768
+Bangui|CF|4.394|18.558
+Malabo|GQ|3.750|8.784
+Libreville|GA|0.416|9.467
+São Tomé|ST|0.336|6.731
+Brazzaville|CG|-4.263|15.243
+Kinshasa|CD|-4.442|15.266
+Lubumbashi|CD|-11.664|27.483
+Luanda|AO|-8.839|13.289
+Lusaka|ZM|-15.387|28.322
+Harare|ZW|-17.825|31.034
+Lilongwe|MW|-13.963|33.775
+Maputo|MZ|-25.969|32.573
+Windhoek|NA|-22.560|17.066
+Gaborone|BW|-24.628|25.923
+Pretoria|ZA|-25.747|28.229
+Johannesburg|ZA|-26.204|28.047
+Cape Town|ZA|-33.925|18.424
+Durban|ZA|-29.858|31.022
+Mbabane|SZ|-26.305|31.137
+Maseru|LS|-29.310|27.478
+Antananarivo|MG|-18.879|47.508
+Port Louis|MU|-20.161|57.499
+Victoria|SC|-4.620|55.455
+Moroni|KM|-11.702|43.256
+Saint-Denis|RE|-20.882|55.450
+"""
+
+# Countries known by a shorter name than their ISO name
+SHORT_NAMES = {
+    "BN": "Brunei", "CD": "DR Congo", "GB": "United Kingdom", "KP": "North Korea", "KR": "South Korea",
+    "LA": "Laos", "MK": "North Macedonia", "RU": "Russia", "SY": "Syria", "US": "United States",
+    "VA": "Vatican City", "VN": "Vietnam",
+}
+
+def country_name(alpha2: str) -> str:
+    """The common name of a country: "France", "United Kingdom", "Bolivia", ..."""
+    if alpha2 in SHORT_NAMES:
+        return SHORT_NAMES[alpha2]
+    name = COUNTRY_CODES[alpha2].name
+    return name.split(" (")[0].split(",")[0]
+
+@dataclass(frozen=True)
+class Place:
+    name: str
+    country: str  # alpha2 code
+    latitude: float
+    longitude: float
+
+    def label(self) -> str:
+        return f"{self.name}, {country_name(self.country)}"
+
+Point = Tuple[float, float, float]
+
+def unit_vector(latitude: float, longitude: float) -> Point:
+    (lat, lon) = (math.radians(latitude), math.radians(longitude))
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+def chord_to_km(chord: float) -> float:
+    """The distance along the surface between points a chord (of the unit sphere) apart."""
+    return 2 * EARTH_RADIUS * math.asin(min(chord / 2, 1.0))
+
+class KDTree:
+    """
+    A k-d tree of 3D points, stored implicitly: the points are ordered so
+    that the node of a range is its middle, splitting the range on the
+    axis of its depth, with the smaller coordinates to its left.
+    """
+    def __init__(self, points: Sequence[Point]):
+        self.order = list(range(len(points)))
+        self.points = list(points)
+        self._build(0, len(self.order), 0)
+        self.nodes = [self.points[i] for i in self.order]
+
+    def _build(self, lo: int, hi: int, axis: int):
+        if hi - lo <= 1:
+            return
+        self.order[lo:hi] = sorted(self.order[lo:hi], key=lambda i: self.points[i][axis])
+        mid = (lo + hi) // 2
+        self._build(lo, mid, (axis + 1) % 3)
+        self._build(mid + 1, hi, (axis + 1) % 3)
+
+    def nearest(self, point: Point) -> Tuple[int, float]:
+        """(index, squared distance) of the point nearest to the given one."""
+        if not self.nodes:
+            raise ValueError("The tree is empty")
+        nodes = self.nodes
+        best = [-1, math.inf]
+
+        def search(lo: int, hi: int, axis: int):
+            mid = (lo + hi) // 2
+            node = nodes[mid]
+            dx = point[0] - node[0]
+            dy = point[1] - node[1]
+            dz = point[2] - node[2]
+            distance = dx * dx + dy * dy + dz * dz
+            if distance < best[1]:
+                best[0] = mid
+                best[1] = distance
+            diff = point[axis] - node[axis]
+            (near, far) = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            following = (axis + 1) % 3
+            if near[0] < near[1]:
+                search(near[0], near[1], following)
+            # the other side can only be closer when the splitting plane is
+            if far[0] < far[1] and diff * diff < best[1]:
+                search(far[0], far[1], following)
+
+        search(0, len(nodes), 0)
+        return (self.order[best[0]], best[1])
+
+class Gazetteer:
+    def __init__(self, places: Sequence[Place]):
+        self.places = list(places)
+        self.tree = KDTree([unit_vector(place.latitude, place.longitude) for place in self.places])
+
+    def nearest(self, latitude: float, longitude: float) -> Tuple[Place, float]:
+        """The nearest place and its distance (km)."""
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError(f"Invalid coordinates: {latitude}, {longitude}")
+        (index, distance) = self.tree.nearest(unit_vector(latitude, longitude))
+        return (self.places[index], chord_to_km(math.sqrt(distance)))
+
+    def describe(self, latitude: float, longitude: float) -> Optional[str]:
+        """
+        The coordinates as a human readable place, e.g. "Paris, France" or
+        "60 km from Lyon, France", None when no place is within MAX_DISTANCE.
+        """
+        (place, distance) = self.nearest(latitude, longitude)
+        if distance <= NEAR_DISTANCE:
+            return place.label()
+        if distance <= MAX_DISTANCE:
+            return f"{distance:.0f} km from {place.label()}"
+        return None
+
+def parse(text: str) -> List[Place]:
+    places = []
+    for line in text.strip().splitlines():
+        (name, alpha2, latitude, longitude) = line.split("|")
+        places.append(Place(name, alpha2, float(latitude), float(longitude)))
+    return places
+
+_gazetteer: Optional[Gazetteer] = None
+_lock = threading.Lock()
+
+def gazetteer() -> Gazetteer:
+    """The bundled gazetteer, indexed on first use."""
+    global _gazetteer
+    if _gazetteer is None:
+        with _lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer(parse(GAZETTEER))
+    return _gazetteer
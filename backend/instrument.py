@@ -0,0 +1,159 @@
+"""
+Instrumentation of State access.
+
+InstrumentedState wraps any State (StoreMemory, Transient, StoreSqlite, ...)
+and counts, per method and per caller, the calls, the rows scanned,
+the rows returned and the wall time. Calls the State makes on itself
+(e.g. check_transaction_ids listing every bank's transactions) are counted too,
+with the outer method as their caller, which exposes the hidden O(N) scans.
+
+A session attaches a StateProfile to its transaction (see create_agent);
+profiling is switched on per session through /api/profile/{session_id}
+or for every session with ACCTA_PROFILE_STATE=1.
+"""
+import os
+import sys
+import threading
+import time
+
+from typing import Dict, List, Optional, Tuple
+
+# Profile the State of every new session
+PROFILE_STATE = os.environ.get("ACCTA_PROFILE_STATE", "") not in ("", "0")
+
+# Frames of these modules are skipped when looking for the caller
+_WRAPPER_MODULES = {__name__, "tracing"}
+
+def _rows(result) -> int:
+    if isinstance(result, (list, tuple, dict, set)):
+        return len(result)
+    return 0
+
+def _caller() -> str:
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_globals.get("__name__") in _WRAPPER_MODULES:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__')}.{getattr(code, 'co_qualname', code.co_name)}"
+
+class MethodStats:
+    __slots__ = ("calls", "scanned", "returned", "time")
+
+    def __init__(self):
+        self.calls = 0
+        self.scanned = 0
+        self.returned = 0
+        self.time = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "rows_scanned": self.scanned,
+            "rows_returned": self.returned,
+            "time": self.time,
+        }
+
+class StateProfile:
+    """The State statistics of one session."""
+    def __init__(self, enabled: bool = PROFILE_STATE):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.stats: Dict[Tuple[str, str], MethodStats] = {}
+
+    def record(self, method: str, caller: str, scanned: int, returned: int, elapsed: float):
+        with self.lock:
+            entry = self.stats.get((method, caller))
+            if entry is None:
+                entry = self.stats[(method, caller)] = MethodStats()
+            entry.calls += 1
+            entry.scanned += scanned
+            entry.returned += returned
+            entry.time += elapsed
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+    def report(self) -> Dict[str, List[Dict]]:
+        """Totals per method and per (method, caller), most rows scanned first."""
+        with self.lock:
+            items = [(key, entry.to_dict()) for (key, entry) in self.stats.items()]
+
+        methods: Dict[str, Dict] = {}
+        for ((method, _), entry) in items:
+            total = methods.setdefault(method, {"method": method, "calls": 0, "rows_scanned": 0, "rows_returned": 0, "time": 0.0})
+            for key in ("calls", "rows_scanned", "rows_returned", "time"):
+                total[key] += entry[key]
+
+        callers = [{"method": method, "caller": caller, **entry} for ((method, caller), entry) in items]
+
+        def order(row):
+            return (row["rows_scanned"], row["time"])
+        return {
+            "methods": sorted(methods.values(), key=order, reverse=True),
+            "callers": sorted(callers, key=order, reverse=True),
+        }
+
+class _Frame:
+    __slots__ = ("method", "scanned", "nested")
+
+    def __init__(self, method: str):
+        self.method = method
+        self.scanned = 0
+        self.nested = False
+
+class InstrumentedState:
+    """
+    Wraps a State and records every method call in a StateProfile.
+
+    The methods of the wrapped State run with the wrapper as `self`,
+    so the calls they make on themselves are instrumented as well.
+    Attribute reads and writes go to the wrapped State.
+    A call scans the rows returned by the innermost calls beneath it,
+    or its own rows when it makes no further State calls.
+    """
+    def __init__(self, inner, profile: Optional[StateProfile] = None):
+        object.__setattr__(self, "inner", inner)
+        object.__setattr__(self, "profile", profile or StateProfile(enabled=True))
+        object.__setattr__(self, "local", threading.local())
+
+    def __setattr__(self, name: str, value):
+        setattr(self.inner, name, value)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.inner, name)
+        if name.startswith("_") or not callable(attr) or not self.profile.enabled:
+            return attr
+
+        method = getattr(type(self.inner), name, None)
+        if method is None:
+            return attr
+
+        def call(*args, **kwargs):
+            stack = getattr(self.local, "stack", None)
+            if stack is None:
+                stack = self.local.stack = []
+            parent = stack[-1] if stack else None
+            caller = parent.method if parent else _caller()
+
+            frame = _Frame(name)
+            stack.append(frame)
+            result = None
+            start = time.perf_counter()
+            try:
+                result = method(self, *args, **kwargs)
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+
+                # also recorded when the call raises (e.g. a failed check)
+                returned = _rows(result)
+                scanned = frame.scanned if frame.nested else returned
+                if parent is not None:
+                    parent.nested = True
+                    parent.scanned += scanned
+                self.profile.record(name, caller, scanned, returned, elapsed)
+        return call
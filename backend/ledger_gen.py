@@ -0,0 +1,286 @@
+"""
+Synthetic ledger generation.
+
+Generates realistic ledgers of any size, deterministically from a seed:
+banks with transactions, suppliers, clients, invoices, receipts with
+OCR-like text and expenses reconciling part of the transactions.
+
+    from ledger_gen import generate_ledger
+    st = generate_ledger(transactions=100_000, seed=1)
+
+or, to seed a database for serve-prod:
+
+    python ledger_gen.py --transactions 1000000 --out ledger.db
+"""
+import argparse
+import datetime
+import random
+import uuid
+
+from typing import List, Optional
+
+from state import (
+    State, StoreMemory, CompanyData, Bank, BankTransaction,
+    Client, Supplier, Document, Invoice, Expense
+)
+
+# (name, category, typical amount)
+SUPPLIERS = [
+    ("United Airlines", "flight", 450.0),
+    ("Delta Air Lines", "flight", 380.0),
+    ("Marriott Hotels", "hotel", 220.0),
+    ("Hilton Worldwide", "hotel", 190.0),
+    ("Hertz Car Rental", "car rental", 140.0),
+    ("Uber Technologies", "ride", 32.0),
+    ("Shell Oil", "fuel", 65.0),
+    ("Office Depot", "office supplies", 85.0),
+    ("Staples", "office supplies", 60.0),
+    ("Amazon Web Services", "cloud hosting", 310.0),
+    ("Adobe Systems", "software subscription", 55.0),
+    ("Microsoft", "software subscription", 120.0),
+    ("Starbucks", "coffee", 12.0),
+    ("Olive Garden", "restaurant", 78.0),
+    ("Home Depot", "hardware", 150.0),
+    ("FedEx", "shipping", 42.0),
+    ("Verizon Wireless", "phone bill", 95.0),
+    ("Comcast Business", "internet", 110.0),
+    ("WeWork", "office rent", 1800.0),
+    ("Dell Technologies", "computer equipment", 1300.0),
+]
+
+BANKS = [
+    ("Bank of America", "USD"),
+    ("Chase Business", "USD"),
+    ("Danske Bank", "DKK"),
+    ("Deutsche Bank", "EUR"),
+    ("Barclays", "GBP"),
+]
+
+COUNTRIES = ["US", "DK", "DE", "GB", "FR", "NL", "SE"]
+
+CLIENTS = [
+    "Globex", "Initech", "Umbrella", "Stark Industries", "Wayne Enterprises",
+    "Hooli", "Vandelay Industries", "Soylent", "Cyberdyne", "Tyrell",
+]
+
+STREETS = ["Main St", "Oak Ave", "Market St", "Park Rd", "High St", "Church Ln", "Elm St"]
+
+class Generator:
+    def __init__(self, seed: int, end: datetime.date, days: int):
+        self.rng = random.Random(seed)
+        self.end = end
+        self.days = days
+
+    def uuid(self) -> uuid.UUID:
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def date(self) -> datetime.date:
+        return self.end - datetime.timedelta(days=self.rng.randrange(self.days))
+
+    def address(self) -> str:
+        return f"{self.rng.randint(1, 999)} {self.rng.choice(STREETS)}"
+
+    def phone(self) -> str:
+        return f"555-{self.rng.randint(0, 9999):04d}"
+
+    def amount(self, typical: float) -> float:
+        return round(typical * self.rng.uniform(0.5, 1.5), 2)
+
+    def suppliers(self, count: int) -> List[Supplier]:
+        suppliers = []
+        for i in range(count):
+            (name, _, _) = SUPPLIERS[i % len(SUPPLIERS)]
+            if i >= len(SUPPLIERS):
+                name = f"{name} #{i // len(SUPPLIERS) + 1}"
+            suppliers.append(Supplier(
+                id=self.uuid(),
+                name=name,
+                address=self.address(),
+                vat_number=f"{self.rng.randrange(10 ** 8, 10 ** 9)}",
+                email=f"billing@{name.split()[0].lower()}.com",
+                phone=self.phone(),
+                country=self.rng.choice(COUNTRIES),
+            ))
+        return suppliers
+
+    def clients(self, count: int) -> List[Client]:
+        clients = []
+        for i in range(count):
+            name = CLIENTS[i % len(CLIENTS)]
+            if i >= len(CLIENTS):
+                name = f"{name} {i // len(CLIENTS) + 1}"
+            clients.append(Client(
+                id=self.uuid(),
+                name=name,
+                address=self.address(),
+                vat_number=f"{self.rng.randrange(10 ** 8, 10 ** 9)}",
+                email=f"ap@{name.split()[0].lower()}.com",
+                phone=self.phone(),
+                country=self.rng.choice(COUNTRIES),
+            ))
+        return clients
+
+    def receipt(self, supplier: Supplier, category: str, amount: float, date: datetime.date) -> Document:
+        """A receipt whose content reads like OCR output (upper case, stray characters)."""
+        lines = [
+            supplier.name.upper(),
+            supplier.address.upper(),
+            f"TEL {supplier.phone}",
+            f"DATE: {date.strftime('%m/%d/%Y')}  TIME: {self.rng.randint(0, 23):02d}:{self.rng.randint(0, 59):02d}",
+            f"RECEIPT NO. {self.rng.randrange(10 ** 6, 10 ** 7)}",
+            f"{category.upper():<24}{amount * 0.8:>10.2f}",
+            f"TAX{'':<21}{amount * 0.2:>10.2f}",
+            f"TOTAL{'':<19}{amount:>10.2f}",
+            self.rng.choice(["VISA ****1234", "MASTERCARD ****9876", "AMEX ****3005"]),
+            self.rng.choice(["THANK YOU FOR YOUR BUSINESS", "THANK Y0U! PLEASE COME AGAIN", "CUSTOMER COPY"]),
+        ]
+        return Document(
+            id=self.uuid(),
+            name=f"receipt_{supplier.name.split()[0].lower()}_{date.isoformat()}.pdf",
+            description=f"{category.capitalize()} receipt from {supplier.name} for {amount:.2f}",
+            content="\n".join(lines),
+        )
+
+def generate_ledger(
+    banks: int = 2,
+    transactions: int = 1000,
+    suppliers: int = 50,
+    clients: int = 20,
+    invoices: int = 100,
+    receipts: float = 0.9,
+    reconciled: float = 0.5,
+    seed: int = 0,
+    end: Optional[datetime.date] = None,
+    days: int = 365,
+    state: Optional[State] = None,
+) -> State:
+    """
+    Generates a ledger with `transactions` transactions spread over `banks` banks.
+
+    `receipts` is the fraction of the expenses (negative transactions) with a receipt,
+    and `reconciled` the fraction of those already reconciled by an expense.
+    The same arguments always produce the same ledger.
+    """
+    gen = Generator(seed, end or datetime.date(2025, 1, 1), days)
+    st = state if state is not None else StoreMemory()
+
+    st.set_company(
+        CompanyData(
+            id=gen.uuid(),
+            name="Acme Inc.",
+            address="123 Main St, Anytown USA",
+            phone="555-1234",
+            email="info@acmeinc.com",
+            vat_number="123456789",
+            country="US",
+        )
+    )
+
+    all_suppliers = gen.suppliers(max(suppliers, 1))
+    for supplier in all_suppliers:
+        st.store_supplier(supplier)
+
+    all_clients = gen.clients(clients)
+    for client in all_clients:
+        st.store_client(client)
+
+    for _ in range(invoices):
+        if not all_clients:
+            break
+        created = gen.date()
+        st.store_invoice(Invoice(
+            id=gen.uuid(),
+            client=gen.rng.choice(all_clients).id,
+            amount=gen.amount(2500.0),
+            currency="USD",
+            created=created,
+            due_date=created + datetime.timedelta(days=gen.rng.choice([14, 30, 60])),
+            description=gen.rng.choice(["Consulting services", "Software license", "Support contract", "Hardware"]),
+        ))
+
+    for b in range(banks):
+        (name, currency) = BANKS[b % len(BANKS)]
+        bank = Bank(
+            id=gen.uuid(),
+            name=name if b < len(BANKS) else f"{name} {b}",
+            currency=currency,
+            iban=f"DK{gen.rng.randrange(10 ** 15, 10 ** 16)}",
+        )
+
+        # the first bank gets the remainder
+        count = transactions // banks + (transactions % banks if b == 0 else 0)
+        txs = []
+        for _ in range(count):
+            date = gen.date()
+
+            # one in ten transactions is a customer payment
+            if gen.rng.random() < 0.1 and all_clients:
+                client = gen.rng.choice(all_clients)
+                txs.append(BankTransaction(
+                    id=gen.uuid(),
+                    amount=gen.amount(2500.0),
+                    date=date,
+                    description=f"PAYMENT FROM {client.name.upper()}",
+                ))
+                continue
+
+            i = gen.rng.randrange(len(all_suppliers))
+            supplier = all_suppliers[i]
+            (_, category, typical) = SUPPLIERS[i % len(SUPPLIERS)]
+            amount = gen.amount(typical)
+            tx = BankTransaction(
+                id=gen.uuid(),
+                amount=-amount,
+                date=date,
+                description=f"{supplier.name.upper()} {gen.rng.randrange(10 ** 5, 10 ** 6)}",
+            )
+            txs.append(tx)
+
+            if gen.rng.random() >= receipts:
+                continue
+            doc = gen.receipt(supplier, category, amount, date)
+            st.store_document(doc)
+
+            if gen.rng.random() < reconciled:
+                st.store_expense(Expense(
+                    id=gen.uuid(),
+                    bank_txs=[tx.id],
+                    docs_ids=[doc.id],
+                    supplier_id=supplier.id,
+                    description=f"{category.capitalize()} from {supplier.name}",
+                    vat_type=gen.rng.choice(["VAT", "NO_VAT"]),
+                ))
+
+        txs.sort(key=lambda tx: tx.date)
+        st.set_bank(bank, txs)
+
+    return st
+
+def main():
+    from store_sqlite import StoreSqlite
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic ledger database")
+    parser.add_argument("--out", required=True, help="SQLite database to write")
+    parser.add_argument("--banks", type=int, default=2, help="Number of banks")
+    parser.add_argument("--transactions", type=int, default=1000, help="Number of bank transactions")
+    parser.add_argument("--suppliers", type=int, default=50, help="Number of suppliers")
+    parser.add_argument("--clients", type=int, default=20, help="Number of clients")
+    parser.add_argument("--invoices", type=int, default=100, help="Number of invoices")
+    parser.add_argument("--reconciled", type=float, default=0.5, help="Fraction of receipts already reconciled")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    st = generate_ledger(
+        banks=args.banks,
+        transactions=args.transactions,
+        suppliers=args.suppliers,
+        clients=args.clients,
+        invoices=args.invoices,
+        reconciled=args.reconciled,
+        seed=args.seed,
+    )
+    StoreSqlite(args.out).copy_from(st)
+    print(f"Wrote {args.transactions} transactions and {len(st.list_documents())} documents to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Load test of the websocket endpoint.
+
+Starts the server with the scripted stub model (see stub_model.py),
+so no network access or API key is needed, and drives /ws/agent
+with many concurrent simulated clients:
+
+    python loadtest.py --clients 200 --messages 3
+
+Reports connection setup time, time to first delta, response latency,
+frame rate, and the memory and CPU use of the server process.
+Use --url to target a server which is already running (e.g. serve-prod):
+the server side resource use is then not measured.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+from typing import Dict, List, Optional
+
+import websockets
+
+from tracing import percentile
+from transport import SUBPROTOCOL_JSON, SUBPROTOCOL_MSGPACK
+
+# messages ending a run
+FINAL_TYPES = {"complete", "error", "run_cancelled"}
+
+class ClientStats:
+    def __init__(self):
+        self.setup: Optional[float] = None
+        self.first_delta: List[float] = []
+        self.latency: List[float] = []
+        self.gaps: List[float] = []
+        self.frames = 0
+        self.bytes = 0
+        self.errors: List[str] = []
+
+class ServerProcess:
+    """The server under test, started with the stub model."""
+    def __init__(self, port: int, env: Dict[str, str]):
+        self.port = port
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env={**os.environ, "ACCTA_LOG_LEVEL": "WARNING", **env, "ACCTA_MODEL": "stub"},
+        )
+
+    def wait_ready(self, timeout: float = 60.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"Server exited with status {self.proc.returncode}")
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{self.port}/api/health", timeout=1)
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError("Server did not become ready")
+
+    def rss(self) -> int:
+        """Resident memory in bytes."""
+        with open(f"/proc/{self.proc.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def cpu(self) -> float:
+        """User and system CPU time in seconds."""
+        with open(f"/proc/{self.proc.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+def decode(frame, binary: bool) -> Dict:
+    if binary:
+        import msgpack
+        return msgpack.unpackb(frame, raw=False)
+    return json.loads(frame)
+
+async def client(
+    url: str,
+    subprotocol: str,
+    messages: int,
+    connected: asyncio.Event,
+    ready: asyncio.Event,
+    stats: ClientStats,
+):
+    """One simulated user: connects, waits for the others, then sends `messages` messages in turn."""
+    binary = subprotocol == SUBPROTOCOL_MSGPACK
+    start = time.perf_counter()
+    try:
+        async with websockets.connect(url, subprotocols=[subprotocol], max_size=None) as ws:
+            while decode(await ws.recv(), binary).get("type") != "session_init":
+                pass
+            stats.setup = time.perf_counter() - start
+            connected.set()
+            await ready.wait()
+
+            for i in range(messages):
+                sent = time.perf_counter()
+                last = sent
+                first = True
+                await ws.send(json.dumps({"message": f"Please reconcile my expenses ({i})"}))
+                while True:
+                    frame = await ws.recv()
+                    now = time.perf_counter()
+                    stats.frames += 1
+                    stats.bytes += len(frame)
+                    stats.gaps.append(now - last)
+                    last = now
+
+                    message = decode(frame, binary)
+                    if first and message.get("type") == "text_delta":
+                        stats.first_delta.append(now - sent)
+                        first = False
+                    if message.get("type") == "error":
+                        stats.errors.append(message.get("message", ""))
+                    if message.get("type") in FINAL_TYPES:
+                        break
+                stats.latency.append(time.perf_counter() - sent)
+    except Exception as e:
+        stats.errors.append(f"{type(e).__name__}: {e}")
+        connected.set()
+
+async def run(args, server: Optional[ServerProcess]) -> Dict:
+    subprotocol = SUBPROTOCOL_MSGPACK if args.protocol == "msgpack" else SUBPROTOCOL_JSON
+    url = args.url or f"ws://127.0.0.1:{server.port}/ws/agent"
+    clients = [ClientStats() for _ in range(args.clients)]
+    connected = [asyncio.Event() for _ in clients]
+    ready = asyncio.Event()
+
+    idle_rss = server.rss() if server else 0
+    tasks = []
+    for (stats, event) in zip(clients, connected):
+        tasks.append(asyncio.create_task(client(url, subprotocol, args.messages, event, ready, stats)))
+        await asyncio.sleep(args.ramp / max(args.clients, 1))
+    await asyncio.gather(*[event.wait() for event in connected])
+    connected_rss = server.rss() if server else 0
+
+    # every client is connected: start talking
+    peak_rss = connected_rss
+    cpu_start = server.cpu() if server else 0.0
+    start = time.perf_counter()
+    ready.set()
+    pending = set(tasks)
+    while pending:
+        (_, pending) = await asyncio.wait(pending, timeout=0.5)
+        if server:
+            peak_rss = max(peak_rss, server.rss())
+    elapsed = time.perf_counter() - start
+    cpu = (server.cpu() - cpu_start) if server else 0.0
+
+    def summary(values: List[float]) -> Dict:
+        if not values:
+            return {}
+        return {"p50": percentile(values, 0.5), "p99": percentile(values, 0.99), "max": max(values)}
+
+    frames = sum(stats.frames for stats in clients)
+    errors = [error for stats in clients for error in stats.errors]
+    result = {
+        "clients": args.clients,
+        "messages": args.messages,
+        "elapsed": elapsed,
+        "setup": summary([stats.setup for stats in clients if stats.setup is not None]),
+        "first_delta": summary([t for stats in clients for t in stats.first_delta]),
+        "latency": summary([t for stats in clients for t in stats.latency]),
+        "frame_gap": summary([t for stats in clients for t in stats.gaps]),
+        "frames": frames,
+        "frames_per_second": frames / elapsed,
+        "bytes": sum(stats.bytes for stats in clients),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+    }
+    if server:
+        result["server"] = {
+            "rss_idle": idle_rss,
+            "rss_connected": connected_rss,
+            "rss_peak": peak_rss,
+            "memory_per_session": (connected_rss - idle_rss) / max(args.clients, 1),
+            "cpu_seconds": cpu,
+            "cpu_utilization": cpu / elapsed,
+        }
+    return result
+
+def print_report(result: Dict):
+    def ms(summary: Dict) -> str:
+        if not summary:
+            return "n/a"
+        return f"p50 {summary['p50'] * 1e3:8.1f} ms  p99 {summary['p99'] * 1e3:8.1f} ms  max {summary['max'] * 1e3:8.1f} ms"
+
+    print(f"{result['clients']} clients x {result['messages']} messages in {result['elapsed']:.1f} s")
+    print(f"  connection setup   {ms(result['setup'])}")
+    print(f"  time to 1st delta  {ms(result['first_delta'])}")
+    print(f"  response latency   {ms(result['latency'])}")
+    print(f"  gap between frames {ms(result['frame_gap'])}")
+    print(f"  frames             {result['frames']} ({result['frames_per_second']:.0f}/s, {result['bytes'] / 1024 / 1024:.1f} MiB)")
+    print(f"  errors             {result['errors']}")
+    for error in result["error_samples"]:
+        print(f"    {error}")
+    server = result.get("server")
+    if server:
+        print(f"  server memory      {server['rss_idle'] / 1024 / 1024:.1f} MiB idle, {server['rss_peak'] / 1024 / 1024:.1f} MiB peak,"
+              f" {server['memory_per_session'] / 1024:.1f} KiB per session")
+        print(f"  server CPU         {server['cpu_seconds']:.1f} s ({server['cpu_utilization'] * 100:.0f}% of a core)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the websocket endpoint with a stub model")
+    parser.add_argument("--clients", type=int, default=100, help="Concurrent clients")
+    parser.add_argument("--messages", type=int, default=3, help="Messages sent by every client")
+    parser.add_argument("--ramp", type=float, default=1.0, help="Seconds over which the clients connect")
+    parser.add_argument("--protocol", choices=["json", "msgpack"], default="json", help="Websocket subprotocol")
+    parser.add_argument("--url", help="Target a running server instead (ws://host:port/ws/agent)")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the started server")
+    parser.add_argument("--deltas", type=int, default=100, help="Text deltas per reply")
+    parser.add_argument("--interval", type=float, default=0.01, help="Seconds between deltas")
+    parser.add_argument("--first-delay", type=float, default=0.2, help="Seconds before the model responds")
+    parser.add_argument("--tools", default="", help="Tools called before every reply (see stub_model.py)")
+    parser.add_argument("--json", help="Save the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    if not args.url:
+        server = ServerProcess(args.port, {
+            "ACCTA_STUB_DELTAS": str(args.deltas),
+            "ACCTA_STUB_INTERVAL": str(args.interval),
+            "ACCTA_STUB_FIRST_DELAY": str(args.first_delay),
+            "ACCTA_STUB_TOOLS": args.tools,
+        })
+    try:
+        if server:
+            server.wait_ready()
+        result = asyncio.run(run(args, server))
+    finally:
+        if server:
+            server.stop()
+
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Logging setup for the server.
+
+Records are handed to a background thread through a queue,
+so formatting and writing never happen on the event loop.
+Configured through the environment:
+
+- ACCTA_LOG_LEVEL:  TRACE, DEBUG, INFO (default), WARNING, ...
+- ACCTA_LOG_FORMAT: "text" (default) or "json"
+- ACCTA_LOG_SAMPLE: keep one in N of the per-token records (default 100)
+
+Per-token records (e.g. text deltas) are logged with `extra=SAMPLED`.
+"""
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+from typing import Optional
+
+# Level for very verbose logging
+TRACE = 5
+logging.addLevelName(TRACE, "TRACE")
+
+def trace(self, message, *args, **kwargs):
+    if self.isEnabledFor(TRACE):
+        self._log(TRACE, message, args, **kwargs)
+
+logging.Logger.trace = trace
+
+# The session the current task is serving
+session_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("session_id", default=None)
+
+SAMPLED = {"sampled": True}
+
+class SessionFilter(logging.Filter):
+    """Tags records with the session id of the current task."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.session_id = session_id.get()
+        return True
+
+class SampleFilter(logging.Filter):
+    """Lets through one in `rate` records marked as sampled."""
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = max(rate, 1)
+        self.count = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False):
+            return True
+        self.count += 1
+        return (self.count - 1) % self.rate == 0
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "session_id", None):
+            entry["session_id"] = record.session_id
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(levelname)s:%(name)s:%(session)s%(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        sid = getattr(record, "session_id", None)
+        record.session = f"[{sid[:8]}] " if sid else ""
+        return super().format(record)
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Only interpolates the message arguments in the calling thread
+    (they may be mutated later), everything else is left to the listener.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    sample_rate: Optional[int] = None,
+    stream = None,
+):
+    """Routes all logging through a queue to a listener thread writing to stderr."""
+    global _listener
+
+    level = level or os.environ.get("ACCTA_LOG_LEVEL", "INFO")
+    fmt = fmt or os.environ.get("ACCTA_LOG_FORMAT", "text")
+    sample_rate = sample_rate or int(os.environ.get("ACCTA_LOG_SAMPLE", 100))
+
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    records = queue.SimpleQueue()
+    handler = LazyQueueHandler(records)
+    handler.addFilter(SessionFilter())
+    handler.addFilter(SampleFilter(sample_rate))
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(logging.getLevelName(level.upper()))
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    """Flushes and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
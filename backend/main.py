@@ -1,3 +1,4 @@
+import os
 import asyncio
 import argparse
 import uvicorn
@@ -17,10 +18,15 @@ def get_cli_session():
     return _cli_session
 
 def get_cli_agent():
-    """Get the global CLI agent with fresh state."""
+    """Get the global CLI agent with fresh state: the ACCTA_LEDGER_DB ledger, else the test state."""
     global _cli_agent
     if _cli_agent is None:
-        _cli_agent = create_agent()
+        ledger_db = os.environ.get("ACCTA_LEDGER_DB")
+        if ledger_db:
+            from store_sqlite import StoreSqlite
+            _cli_agent = create_agent(initial_state=StoreSqlite(ledger_db))
+        else:
+            _cli_agent = create_agent()
     return _cli_agent
 
 async def run_single_message(user_input: str):
@@ -89,21 +95,64 @@ async def run_cli():
             print("\nGoodbye!")
             break
 
-def run_server(host: str = "0.0.0.0", port: int = 8000):
-    uvicorn.run("api:app", host=host, port=port, reload=True)
+def run_server(host: str = "0.0.0.0", port: int = 8000, ws_deflate: bool = True):
+    uvicorn.run("api:app", host=host, port=port, reload=True, ws_per_message_deflate=ws_deflate)
+
+def run_server_prod(
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    workers: int = os.cpu_count() or 1,
+    ledger_db: str = "ledger.db",
+    ws_deflate: bool = True
+):
+    """
+    Serve with several worker processes sharing one on-disk ledger.
+
+    A websocket session lives for the duration of its connection,
+    which is handled from start to end by the worker that accepted it:
+    so sessions are pinned to a worker without any routing layer.
+    """
+    from store_sqlite import StoreSqlite
+
+    st = StoreSqlite(ledger_db)
+    if st.is_empty():
+        from test_state import create_test_state
+        print(f"Seeding {ledger_db} with the test ledger")
+        st.copy_from(create_test_state())
+
+    # read by the workers when they import the app
+    os.environ["ACCTA_LEDGER_DB"] = os.path.abspath(ledger_db)
+    uvicorn.run(
+        "api:app",
+        host=host,
+        port=port,
+        workers=workers,
+        ws_per_message_deflate=ws_deflate
+    )
 
 def main():
     parser = argparse.ArgumentParser(description="ACCTA Agent")
-    parser.add_argument("--mode", choices=["cli", "server"], default="cli", help="Run mode")
+    parser.add_argument("--mode", choices=["cli", "server", "serve-prod"], default="cli", help="Run mode")
     parser.add_argument("--host", default="0.0.0.0", help="Server host")
     parser.add_argument("--port", type=int, default=8000, help="Server port")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (serve-prod)")
+    parser.add_argument("--ledger-db", default="ledger.db", help="Shared ledger database (serve-prod)")
+    parser.add_argument("--no-ws-deflate", action="store_true", help="Disable permessage-deflate compression of websocket frames")
 
     args = parser.parse_args()
 
     if args.mode == "cli":
         asyncio.run(run_cli())
     elif args.mode == "server":
-        run_server(args.host, args.port)
+        run_server(args.host, args.port, ws_deflate=not args.no_ws_deflate)
+    elif args.mode == "serve-prod":
+        run_server_prod(
+            args.host,
+            args.port,
+            workers=args.workers,
+            ledger_db=args.ledger_db,
+            ws_deflate=not args.no_ws_deflate
+        )
 
 if __name__ == "__main__":
     main()
@@ -1,5 +1,5 @@
 """Pydantic dataclasses for WebSocket messages"""
-from typing import Any, List
+from typing import Any, List, Optional
 from pydantic.dataclasses import dataclass
 from dataclasses import field
 
@@ -48,6 +48,11 @@ class CompleteMessage(BaseMessage):
     type: str = field(default="complete", init=False)
 
 
+@dataclass
+class RunCancelledMessage(BaseMessage):
+    type: str = field(default="run_cancelled", init=False)
+
+
 # Tool-related messages
 @dataclass
 class ToolCalledMessage(BaseMessage):
@@ -98,4 +103,26 @@ class ActionClearMessage(BaseMessage):
 @dataclass
 class ActionsStateMessage(BaseMessage):
     actions: List[Any]
-    type: str = field(default="actions_state", init=False)
\ No newline at end of file
+    type: str = field(default="actions_state", init=False)
+
+
+# Document upload messages
+@dataclass
+class DocumentProgressMessage(BaseMessage):
+    upload_id: str
+    name: str
+    stage: str  # "stored", "queued", "extracting", "done", "duplicate" or "failed"
+    document_id: Optional[str] = None
+    action_id: Optional[str] = None
+    error: Optional[str] = None
+    type: str = field(default="document_progress", init=False)
+
+
+# Transport messages
+@dataclass
+class ChunkMessage(BaseMessage):
+    chunk_id: str
+    index: int
+    count: int
+    data: Any
+    type: str = field(default="chunk", init=False)
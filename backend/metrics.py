@@ -0,0 +1,184 @@
+"""
+In-process metrics, exported in the Prometheus text format by /api/metrics.
+
+With several worker processes (serve-prod) every worker keeps its own metrics.
+"""
+import asyncio
+import bisect
+import threading
+import time
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets (in seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for (k, v) in pairs
+    )
+    return "{" + body + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError("Metrics must implement the samples method.")
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = _labels(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self.values.get(_labels(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for (k, v) in items]
+
+class Gauge(Metric):
+    """A value which is either set directly or read from a callback at export time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, help)
+        self.values: Dict[Labels, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels: str):
+        with self.lock:
+            self.values[_labels(labels)] = value
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            return [f"{self.name} {_format_value(self.callback())}"]
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for (k, v) in items]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: (bucket counts, sum, count)
+        self.values: Dict[Labels, List] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = _labels(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            items = [(k, (list(counts), total, count)) for (k, (counts, total, count)) in self.values.items()]
+        lines = []
+        for (key, (counts, total, count)) in items:
+            cumulative = 0
+            for (bound, n) in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, help: str) -> Counter:
+    return REGISTRY.register(Counter(name, help))
+
+def gauge(name: str, help: str, callback: Optional[Callable[[], float]] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, callback))
+
+def histogram(name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, buckets))
+
+# Agent runs
+RUN_DURATION = histogram("accta_run_duration_seconds", "Duration of agent runs, by outcome")
+TIME_TO_FIRST_DELTA = histogram("accta_time_to_first_delta_seconds", "Time from the user message to the first text delta")
+
+# Tools
+TOOL_DURATION = histogram("accta_tool_duration_seconds", "Execution time of tool bodies")
+TOOL_ERRORS = counter("accta_tool_errors_total", "Tool calls which raised an exception")
+
+TOOL_CACHE_HITS = counter("accta_tool_cache_hits_total", "Query tool calls answered from the session cache")
+TOOL_CACHE_MISSES = counter("accta_tool_cache_misses_total", "Query tool calls not found in the session cache")
+TOOL_CACHE_EVICTIONS = counter("accta_tool_cache_evictions_total", "Cached tool results evicted to stay within the byte budget")
+
+def _cache_hit_ratio() -> float:
+    hits = sum(TOOL_CACHE_HITS.values.values())
+    lookups = hits + sum(TOOL_CACHE_MISSES.values.values())
+    return hits / lookups if lookups else 0.0
+
+gauge("accta_tool_cache_hit_ratio", "Fraction of query tool calls answered from the cache", _cache_hit_ratio)
+
+# Websocket frames
+FRAMES_SENT = counter("accta_frames_sent_total", "Websocket frames sent, by message type")
+BYTES_SENT = counter("accta_bytes_sent_total", "Websocket payload bytes sent, by message type")
+OUTBOX_MERGED = counter("accta_outbox_merged_total", "Text deltas merged because a client fell behind")
+OUTBOX_DROPPED = counter("accta_outbox_dropped_total", "Tool outputs replaced by a placeholder because a client fell behind")
+
+# Document uploads
+UPLOAD_BYTES = counter("accta_upload_bytes_total", "Bytes of uploaded files written to disk")
+UPLOAD_DUPLICATES = counter("accta_upload_duplicates_total", "Uploaded files whose content was already stored")
+EXTRACT_DURATION = histogram("accta_extract_duration_seconds", "Time from queueing a document for extraction to its result, by outcome")
+
+# Event loop
+LOOP_LAG = histogram("accta_event_loop_lag_seconds", "How late the event loop wakes up from a sleep")
+
+async def monitor_loop_lag(interval: float = 0.5):
+    """Samples the event loop lag until cancelled."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(time.perf_counter() - start - interval, 0.0))
@@ -0,0 +1,184 @@
+"""
+Per-connection send queue.
+
+Every websocket has a single writer task which drains an `Outbox`.
+The outbox is bounded by the number of encoded bytes waiting to be sent;
+when a client falls behind:
+
+1. consecutive text deltas are merged into a single frame,
+2. queued tool outputs are replaced by a short placeholder,
+3. producers wait for the writer to catch up (backpressure).
+
+Messages are encoded when they are queued, so the budget tracks
+the actual size of the frames held in memory.
+"""
+import asyncio
+import logging
+
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from fastapi import WebSocket
+
+from messages import BaseMessage, TextDeltaMessage, ToolOutputMessage
+from metrics import BYTES_SENT, FRAMES_SENT, OUTBOX_DROPPED, OUTBOX_MERGED
+from transport import Codec, Frame, frame_size
+
+logger = logging.getLogger(__name__)
+
+MAX_QUEUED_BYTES = 1024 * 1024
+
+DROPPED_OUTPUT = "[output omitted: the client is not keeping up]"
+
+class Entry:
+    def __init__(self, message: BaseMessage, frames: List[Frame]):
+        self.message = message
+        self.frames = frames
+        self.size = sum(frame_size(frame) for frame in frames)
+
+class Outbox:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        codec: Codec,
+        max_bytes: int = MAX_QUEUED_BYTES
+    ):
+        self.websocket = websocket
+        self.codec = codec
+        self.max_bytes = max_bytes
+        self.entries: Deque[Entry] = deque()
+        # bytes of queued frames, including the entry currently being written
+        self.queued_bytes = 0
+        self.closed = False
+        self.readable = asyncio.Event()
+        self.writable = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+
+        # metrics
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.merged = 0
+        self.dropped = 0
+        self.high_water_bytes = 0
+
+    def start(self):
+        self.writer = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        """Stops the writer, discarding anything not yet sent."""
+        self.closed = True
+        self.writable.set()
+        if self.writer is not None:
+            self.writer.cancel()
+            try:
+                await self.writer
+            except (asyncio.CancelledError, Exception):
+                pass
+        self.entries.clear()
+        self.queued_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": len(self.entries),
+            "queued_bytes": self.queued_bytes,
+            "high_water_bytes": self.high_water_bytes,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "merged": self.merged,
+            "dropped": self.dropped,
+        }
+
+    def _append(self, entry: Entry):
+        self.entries.append(entry)
+        self.queued_bytes += entry.size
+        self.high_water_bytes = max(self.high_water_bytes, self.queued_bytes)
+        self.readable.set()
+
+    def _merge(self, message: BaseMessage) -> bool:
+        """Merges a text delta into a text delta at the tail of the queue."""
+        if not isinstance(message, TextDeltaMessage) or not self.entries:
+            return False
+        tail = self.entries[-1]
+        if not isinstance(tail.message, TextDeltaMessage):
+            return False
+        merged = TextDeltaMessage(delta=tail.message.delta + message.delta)
+        self.entries.pop()
+        self.queued_bytes -= tail.size
+        self._append(Entry(merged, self.codec.frames(merged)))
+        self.merged += 1
+        OUTBOX_MERGED.inc()
+        return True
+
+    def _shed(self) -> bool:
+        """Replaces the oldest queued tool output by a placeholder."""
+        placeholder = ToolOutputMessage(output=DROPPED_OUTPUT)
+        for (i, entry) in enumerate(self.entries):
+            if isinstance(entry.message, ToolOutputMessage) and entry.message.output != DROPPED_OUTPUT:
+                stub = Entry(placeholder, self.codec.frames(placeholder))
+                if stub.size >= entry.size:
+                    continue
+                self.entries[i] = stub
+                self.queued_bytes -= entry.size - stub.size
+                self.dropped += 1
+                OUTBOX_DROPPED.inc()
+                return True
+        return False
+
+    def put_nowait(self, message: BaseMessage):
+        """
+        Queues a message without waiting.
+        Used by synchronous producers: the budget may be exceeded if nothing can be shed.
+        """
+        if self.closed or self._merge(message):
+            return
+        self._append(Entry(message, self.codec.frames(message)))
+        while self.queued_bytes > self.max_bytes and self._shed():
+            pass
+
+    async def put(self, message: BaseMessage):
+        """Queues a message, waiting for the writer if the queue is over budget."""
+        if self.closed or self._merge(message):
+            return
+        entry = Entry(message, self.codec.frames(message))
+        while self.queued_bytes and self.queued_bytes + entry.size > self.max_bytes:
+            if self._shed():
+                continue
+            self.writable.clear()
+            await self.writable.wait()
+            if self.closed:
+                return
+            # a delta may have become mergeable while waiting
+            if self._merge(message):
+                return
+        self._append(entry)
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self.readable.wait()
+                if not self.entries:
+                    self.readable.clear()
+                    continue
+
+                # taken off the queue before sending:
+                # merging and shedding only ever touch entries which have not been written yet.
+                entry = self.entries.popleft()
+                for frame in entry.frames:
+                    if self.codec.binary:
+                        await self.websocket.send_bytes(frame)
+                    else:
+                        await self.websocket.send_text(frame)
+                    self.frames_sent += 1
+                    self.bytes_sent += frame_size(frame)
+
+                FRAMES_SENT.inc(len(entry.frames), type=entry.message.type)
+                BYTES_SENT.inc(entry.size, type=entry.message.type)
+
+                self.queued_bytes -= entry.size
+                self.writable.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug("Writer stopped: %s", e)
+            self.closed = True
+            self.writable.set()
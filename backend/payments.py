@@ -0,0 +1,315 @@
+"""
+Matching of invoices to incoming payments.
+
+A PaymentIndex tracks how much is outstanding on every invoice and how
+much of every incoming (positive) bank transaction is not yet allocated
+to an invoice, given the settlements recorded so far. The unallocated
+credit is kept hashed and sorted by amount per currency, and the unpaid
+invoices sorted by due date, so matching and listing unpaid invoices are
+lookups, bisections and slices instead of scans over the ledger.
+
+Amounts are kept in cents. An invoice is only matched to transactions of
+banks in its currency.
+"""
+import bisect
+import datetime
+import uuid
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from aging import AgingIndex
+
+if TYPE_CHECKING:
+    from state import BankTransaction, Invoice, Settlement, State
+
+# Other open invoices of the client considered for a payment of several invoices
+MAX_COMBINED = 8
+
+# Largest transactions looked at for partial payments
+MAX_CANDIDATES = 200
+
+def cents(amount: float) -> int:
+    return round(amount * 100)
+
+class PaymentIndex:
+    def __init__(self):
+        self.invoices: Dict[uuid.UUID, "Invoice"] = {}
+        # invoice id -> cents not yet paid
+        self.outstanding: Dict[uuid.UUID, int] = {}
+        # (due date ordinal, invoice id) of every invoice with something outstanding
+        self.unpaid: List[Tuple[int, uuid.UUID]] = []
+        # invoices with something outstanding per client and currency, by due date
+        self.aging = AgingIndex()
+        # incoming transaction id -> (currency, transaction)
+        self.credits: Dict[uuid.UUID, Tuple[str, "BankTransaction"]] = {}
+        # incoming transaction id -> cents not yet allocated to an invoice
+        self.unallocated: Dict[uuid.UUID, int] = {}
+        # currency -> sorted (unallocated cents, date ordinal, transaction id), for unallocated > 0
+        self.by_amount: Dict[str, List[Tuple[int, int, uuid.UUID]]] = {}
+        # (currency, unallocated cents) -> transaction ids, for exact matches
+        self.by_cents: Dict[Tuple[str, int], Set[uuid.UUID]] = {}
+        self.settlements: Dict[uuid.UUID, "Settlement"] = {}
+
+    @classmethod
+    def build(cls, st: "State") -> "PaymentIndex":
+        """The index of a state: a scan over every transaction, invoice and settlement."""
+        index = cls()
+        for bank in st.list_banks():
+            for tx in st.list_transactions(bank.id):
+                if tx.amount > 0:
+                    index.credits[tx.id] = (bank.currency, tx)
+                    index.unallocated[tx.id] = cents(tx.amount)
+        for invoice in st.list_invoices():
+            index.invoices[invoice.id] = invoice
+            index.outstanding[invoice.id] = cents(invoice.amount)
+        for settlement in st.list_settlements():
+            index.settlements[settlement.id] = settlement
+            amount = cents(settlement.amount)
+            if settlement.invoice_id in index.outstanding:
+                index.outstanding[settlement.invoice_id] -= amount
+            if settlement.bank_tx in index.unallocated:
+                index.unallocated[settlement.bank_tx] -= amount
+
+        # sorted once, then maintained
+        index.unpaid = sorted(
+            (index.invoices[id].due_date.toordinal(), id)
+            for (id, outstanding) in index.outstanding.items() if outstanding > 0
+        )
+        for (_, id) in index.unpaid:
+            invoice = index.invoices[id]
+            index.aging.update(invoice.client, invoice.currency, invoice.due_date, id, 0, index.outstanding[id])
+        for (tx_id, unallocated) in index.unallocated.items():
+            if unallocated > 0:
+                (currency, tx) = index.credits[tx_id]
+                index.by_amount.setdefault(currency, []).append((unallocated, tx.date.toordinal(), tx_id))
+                index.by_cents.setdefault((currency, unallocated), set()).add(tx_id)
+        for entries in index.by_amount.values():
+            entries.sort()
+        return index
+
+    def copy(self) -> "PaymentIndex":
+        """An independent copy, for changes on top of this index."""
+        index = PaymentIndex()
+        index.invoices = dict(self.invoices)
+        index.outstanding = dict(self.outstanding)
+        index.unpaid = list(self.unpaid)
+        index.aging = self.aging.copy()
+        index.credits = self.credits  # never modified
+        index.unallocated = dict(self.unallocated)
+        index.by_amount = {currency: list(entries) for (currency, entries) in self.by_amount.items()}
+        index.by_cents = {key: set(ids) for (key, ids) in self.by_cents.items()}
+        index.settlements = dict(self.settlements)
+        return index
+
+    def _set_outstanding(self, invoice_id: uuid.UUID, value: int):
+        invoice = self.invoices[invoice_id]
+        due = invoice.due_date.toordinal()
+        old = self.outstanding[invoice_id]
+        if old > 0:
+            del self.unpaid[bisect.bisect_left(self.unpaid, (due, invoice_id))]
+        self.outstanding[invoice_id] = value
+        if value > 0:
+            bisect.insort(self.unpaid, (due, invoice_id))
+        self.aging.update(invoice.client, invoice.currency, invoice.due_date, invoice_id, old, value)
+
+    def _set_unallocated(self, tx_id: uuid.UUID, value: int):
+        (currency, tx) = self.credits[tx_id]
+        entries = self.by_amount.setdefault(currency, [])
+        day = tx.date.toordinal()
+        old = self.unallocated[tx_id]
+        if old > 0:
+            del entries[bisect.bisect_left(entries, (old, day, tx_id))]
+            self.by_cents[(currency, old)].discard(tx_id)
+        self.unallocated[tx_id] = value
+        if value > 0:
+            bisect.insort(entries, (value, day, tx_id))
+            self.by_cents.setdefault((currency, value), set()).add(tx_id)
+
+    def add_invoice(self, invoice: "Invoice"):
+        """Adds (or replaces) an invoice, keeping what has been paid on it."""
+        old = self.invoices.get(invoice.id)
+        if old is None:
+            self.invoices[invoice.id] = invoice
+            self.outstanding[invoice.id] = 0
+            self._set_outstanding(invoice.id, cents(invoice.amount))
+            return
+        paid = cents(old.amount) - self.outstanding[invoice.id]
+        self._set_outstanding(invoice.id, 0)
+        self.invoices[invoice.id] = invoice
+        self._set_outstanding(invoice.id, cents(invoice.amount) - paid)
+
+    def _allocate(self, settlement: "Settlement", sign: int):
+        amount = sign * cents(settlement.amount)
+        if settlement.invoice_id in self.outstanding:
+            self._set_outstanding(settlement.invoice_id, self.outstanding[settlement.invoice_id] - amount)
+        if settlement.bank_tx in self.unallocated:
+            self._set_unallocated(settlement.bank_tx, self.unallocated[settlement.bank_tx] - amount)
+
+    def settle(self, settlement: "Settlement"):
+        """Records (or replaces) a settlement."""
+        old = self.settlements.get(settlement.id)
+        if old is not None:
+            self._allocate(old, -1)
+        self.settlements[settlement.id] = settlement
+        self._allocate(settlement, 1)
+
+    def check_settlement(self, invoice_id: uuid.UUID, tx_id: uuid.UUID, amount: Optional[float]) -> float:
+        """
+        Checks that a transaction can pay (part of) an invoice,
+        returns the amount to settle: by default as much as possible.
+        """
+        invoice = self.invoices.get(invoice_id)
+        if invoice is None:
+            raise ValueError(f"Invalid invoice ID: {invoice_id}")
+        if tx_id not in self.credits:
+            raise ValueError(f"Transaction ID {tx_id} is not an incoming payment")
+        (currency, _) = self.credits[tx_id]
+        if currency != invoice.currency:
+            raise ValueError(f"Transaction ID {tx_id} is in {currency}, the invoice is in {invoice.currency}")
+
+        outstanding = self.outstanding[invoice_id]
+        unallocated = self.unallocated[tx_id]
+        if outstanding <= 0:
+            raise ValueError(f"Invoice ID {invoice_id} is already paid")
+        if unallocated <= 0:
+            raise ValueError(f"Transaction ID {tx_id} is already allocated to other invoices")
+        if amount is None:
+            return min(outstanding, unallocated) / 100
+        if cents(amount) <= 0:
+            raise ValueError("The settled amount must be positive")
+        if cents(amount) > outstanding:
+            raise ValueError(f"Only {outstanding / 100:.2f} {invoice.currency} is outstanding on invoice ID {invoice_id}")
+        if cents(amount) > unallocated:
+            raise ValueError(f"Only {unallocated / 100:.2f} {currency} of transaction ID {tx_id} is unallocated")
+        return amount
+
+    def paid(self, invoice_id: uuid.UUID) -> float:
+        return (cents(self.invoices[invoice_id].amount) - self.outstanding[invoice_id]) / 100
+
+    def unpaid_invoices(self) -> List[Tuple["Invoice", float, float]]:
+        """(invoice, paid, outstanding) of the invoices not fully paid, by due date."""
+        return [
+            (self.invoices[id], self.paid(id), self.outstanding[id] / 100)
+            for (_, id) in self.unpaid
+        ]
+
+    def aging_report(self, as_of: datetime.date, client: Optional[uuid.UUID] = None) -> List[Dict]:
+        """Outstanding per client and currency in buckets of days overdue at the date."""
+        rows = []
+        for (key_client, currency, buckets) in self.aging.report(as_of, client):
+            rows.append({
+                "client": key_client,
+                "currency": currency,
+                "buckets": {name: amount / 100 for (name, amount) in buckets.items()},
+                "total": sum(buckets.values()) / 100,
+            })
+        return rows
+
+    def overdue_invoices(self, as_of: datetime.date, client: Optional[uuid.UUID] = None) -> List[Tuple["Invoice", int, float]]:
+        """(invoice, days overdue, outstanding) of the invoices due before the date, most overdue first."""
+        day = as_of.toordinal()
+        if client is None:
+            due = self.unpaid[:bisect.bisect_left(self.unpaid, (day,))]
+        else:
+            due = sorted(
+                (group.dues[i], group.ids[i])
+                for ((key_client, _), group) in self.aging.groups.items() if key_client == client
+                for i in range(bisect.bisect_left(group.dues, day))
+            )
+        return [(self.invoices[id], day - due_day, self.outstanding[id] / 100) for (due_day, id) in due]
+
+    def credits_between(self, currency: str, low: int, high: int, last: Optional[int] = None) -> List[Tuple[int, int, uuid.UUID]]:
+        """
+        Incoming transactions with between `low` and `high` cents unallocated (inclusive),
+        by amount: only the `last` (largest) ones if given.
+        """
+        entries = self.by_amount.get(currency, [])
+        start = bisect.bisect_left(entries, (low,))
+        end = bisect.bisect_left(entries, (high + 1,))
+        if last is not None:
+            start = max(start, end - last)
+        return entries[start:end]
+
+    def _proposal(self, kind: str, tx_id: uuid.UUID, allocations: List[Tuple[uuid.UUID, int]], named: bool) -> Dict:
+        (currency, tx) = self.credits[tx_id]
+        return {
+            "kind": kind,
+            "bank_tx": tx_id,
+            "date": tx.date,
+            "amount": self.unallocated[tx_id] / 100,
+            "currency": currency,
+            "description": tx.description,
+            "mentions_client": named,
+            "allocations": [{"invoice_id": id, "amount": amount / 100} for (id, amount) in allocations],
+        }
+
+    def propose(self, invoice_id: uuid.UUID, client_name: str = "", limit: int = 5) -> List[Dict]:
+        """
+        Incoming transactions which could pay the invoice, most likely first:
+
+        - "exact": the unallocated amount equals what is outstanding,
+        - "combined": it equals what is outstanding on this and other open invoices of the client,
+        - "partial": it pays part of the invoice (only when the description mentions the client).
+
+        Transactions dated before the invoice was created are not proposed.
+        Within a kind, transactions mentioning the client and closer to the due date come first.
+        """
+        invoice = self.invoices[invoice_id]
+        outstanding = self.outstanding[invoice_id]
+        if outstanding <= 0:
+            return []
+        created = invoice.created.toordinal()
+        due = invoice.due_date.toordinal()
+        name = client_name.strip().lower()
+
+        def named(tx_id: uuid.UUID) -> bool:
+            return bool(name) and name in self.credits[tx_id][1].description.lower()
+
+        def rank(entry: Tuple[int, int, uuid.UUID]):
+            return (not named(entry[2]), abs(entry[1] - due))
+
+        def matching(amount: int) -> List[Tuple[int, int, uuid.UUID]]:
+            ids = self.by_cents.get((invoice.currency, amount), ())
+            return [(amount, self.credits[id][1].date.toordinal(), id) for id in ids]
+
+        proposals = []
+        exact = [entry for entry in matching(outstanding) if entry[1] >= created]
+        for (amount, _, tx_id) in sorted(exact, key=rank)[:limit]:
+            proposals.append(self._proposal("exact", tx_id, [(invoice_id, amount)], named(tx_id)))
+
+        # other open invoices of the client in the currency, nearest due date first
+        others = [
+            (id, self.outstanding[id]) for id in self.aging.open_invoices(invoice.client, invoice.currency)
+            if id != invoice_id
+        ]
+        others = sorted(others, key=lambda other: abs(self.invoices[other[0]].due_date.toordinal() - due))[:MAX_COMBINED]
+        if others:
+            combinations = subset_sums(others)
+            combined = [
+                entry
+                for total in combinations
+                for entry in matching(outstanding + total)
+                if entry[1] >= created
+            ]
+            for (amount, _, tx_id) in sorted(combined, key=rank)[:limit]:
+                allocations = [(invoice_id, outstanding), *(others[i] for i in combinations[amount - outstanding])]
+                proposals.append(self._proposal("combined", tx_id, allocations, named(tx_id)))
+
+        if name:
+            candidates = self.credits_between(invoice.currency, 1, outstanding - 1, last=MAX_CANDIDATES)
+            partial = [entry for entry in candidates if entry[1] >= created and named(entry[2])]
+            for (amount, _, tx_id) in sorted(partial, key=rank)[:limit]:
+                proposals.append(self._proposal("partial", tx_id, [(invoice_id, amount)], True))
+
+        return proposals
+
+def subset_sums(items: List[Tuple[uuid.UUID, int]]) -> Dict[int, Tuple[int, ...]]:
+    """Every total of one or more of the (id, amount) items, with the positions of the fewest items adding up to it."""
+    reachable: Dict[int, Tuple[int, ...]] = {0: ()}
+    for (i, (_, amount)) in enumerate(items):
+        for (total, chosen) in list(reachable.items()):
+            total += amount
+            if total not in reachable or len(reachable[total]) > len(chosen) + 1:
+                reachable[total] = chosen + (i,)
+    del reachable[0]
+    return reachable
@@ -0,0 +1,271 @@
+"""
+Reference data: countries, their currencies and VAT number formats.
+
+The indexes are built on first use (see `reference()`):
+alpha-2, alpha-3 and numeric code maps, and a trie of the case-folded
+names and common aliases of the countries ("USA", "UK", "South Korea", ...)
+for exact, prefix and fuzzy (edit distance) lookup.
+"""
+import re
+import threading
+import unicodedata
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from country import COUNTRIES, Country
+
+# Currency (ISO 4217) of every country, Antarctica has none
+CURRENCIES = dict(pair.split(":") for pair in """
+    AF:AFN AL:ALL DZ:DZD AS:USD AD:EUR AO:AOA AI:XCD AG:XCD AR:ARS AM:AMD AW:AWG AU:AUD AT:EUR AZ:AZN
+    BS:BSD BH:BHD BD:BDT BB:BBD BY:BYN BE:EUR BZ:BZD BJ:XOF BM:BMD BT:BTN BO:BOB BQ:USD BA:BAM BW:BWP
+    BV:NOK BR:BRL IO:USD BN:BND BG:EUR BF:XOF BI:BIF CV:CVE KH:KHR CM:XAF CA:CAD KY:KYD CF:XAF TD:XAF
+    CL:CLP CN:CNY CX:AUD CC:AUD CO:COP KM:KMF CD:CDF CG:XAF CK:NZD CR:CRC HR:EUR CU:CUP CW:XCG CY:EUR
+    CZ:CZK CI:XOF DK:DKK DJ:DJF DM:XCD DO:DOP EC:USD EG:EGP SV:USD GQ:XAF ER:ERN EE:EUR SZ:SZL ET:ETB
+    FK:FKP FO:DKK FJ:FJD FI:EUR FR:EUR GF:EUR PF:XPF TF:EUR GA:XAF GM:GMD GE:GEL DE:EUR GH:GHS GI:GIP
+    GR:EUR GL:DKK GD:XCD GP:EUR GU:USD GT:GTQ GG:GBP GN:GNF GW:XOF GY:GYD HT:HTG HM:AUD VA:EUR HN:HNL
+    HK:HKD HU:HUF IS:ISK IN:INR ID:IDR IR:IRR IQ:IQD IE:EUR IM:GBP IL:ILS IT:EUR JM:JMD JP:JPY JE:GBP
+    JO:JOD KZ:KZT KE:KES KI:AUD KP:KPW KR:KRW KW:KWD KG:KGS LA:LAK LV:EUR LB:LBP LS:LSL LR:LRD LY:LYD
+    LI:CHF LT:EUR LU:EUR MO:MOP MG:MGA MW:MWK MY:MYR MV:MVR ML:XOF MT:EUR MH:USD MQ:EUR MR:MRU MU:MUR
+    YT:EUR MX:MXN FM:USD MD:MDL MC:EUR MN:MNT ME:EUR MS:XCD MA:MAD MZ:MZN MM:MMK NA:NAD NR:AUD NP:NPR
+    NL:EUR NC:XPF NZ:NZD NI:NIO NE:XOF NG:NGN NU:NZD NF:AUD MP:USD NO:NOK OM:OMR PK:PKR PW:USD PS:ILS
+    PA:PAB PG:PGK PY:PYG PE:PEN PH:PHP PN:NZD PL:PLN PT:EUR PR:USD QA:QAR MK:MKD RO:RON RU:RUB RW:RWF
+    RE:EUR BL:EUR SH:SHP KN:XCD LC:XCD MF:EUR PM:EUR VC:XCD WS:WST SM:EUR ST:STN SA:SAR SN:XOF RS:RSD
+    SC:SCR SL:SLE SG:SGD SX:XCG SK:EUR SI:EUR SB:SBD SO:SOS ZA:ZAR GS:GBP SS:SSP ES:EUR LK:LKR SD:SDG
+    SR:SRD SJ:NOK SE:SEK CH:CHF SY:SYP TW:TWD TJ:TJS TZ:TZS TH:THB TL:USD TG:XOF TK:NZD TO:TOP TT:TTD
+    TN:TND TR:TRY TM:TMT TC:USD TV:AUD UG:UGX UA:UAH AE:AED GB:GBP UM:USD US:USD UY:UYU UZ:UZS VU:VUV
+    VE:VES VN:VND VG:USD VI:USD WF:XPF EH:MAD YE:YER ZM:ZMW ZW:ZWG AX:EUR
+""".split())
+
+@dataclass(frozen=True)
+class VatFormat:
+    prefix: str  # written before the number, e.g. "EL" for Greece
+    pattern: str  # of the number without the prefix
+    example: str
+
+# VAT number formats of the EU member states (as used by VIES) and a few neighbours
+VAT_FORMATS = {
+    "AT": VatFormat("AT", r"U\d{8}", "ATU12345678"),
+    "BE": VatFormat("BE", r"[01]\d{9}", "BE0123456789"),
+    "BG": VatFormat("BG", r"\d{9,10}", "BG123456789"),
+    "CH": VatFormat("CHE", r"\d{9}(MWST|MVA|TVA|IVA)?", "CHE123456789MWST"),
+    "CY": VatFormat("CY", r"\d{8}[A-Z]", "CY12345678X"),
+    "CZ": VatFormat("CZ", r"\d{8,10}", "CZ12345678"),
+    "DE": VatFormat("DE", r"\d{9}", "DE123456789"),
+    "DK": VatFormat("DK", r"\d{8}", "DK12345678"),
+    "EE": VatFormat("EE", r"\d{9}", "EE123456789"),
+    "ES": VatFormat("ES", r"[A-Z0-9]\d{7}[A-Z0-9]", "ESX1234567X"),
+    "FI": VatFormat("FI", r"\d{8}", "FI12345678"),
+    "FR": VatFormat("FR", r"[0-9A-HJ-NP-Z]{2}\d{9}", "FR12345678901"),
+    "GB": VatFormat("GB", r"\d{9}|\d{12}|GD[0-4]\d{2}|HA[5-9]\d{2}", "GB123456789"),
+    "GR": VatFormat("EL", r"\d{9}", "EL123456789"),
+    "HR": VatFormat("HR", r"\d{11}", "HR12345678901"),
+    "HU": VatFormat("HU", r"\d{8}", "HU12345678"),
+    "IE": VatFormat("IE", r"\d{7}[A-W][A-I]?|\d[A-Z+*]\d{5}[A-W]", "IE1234567WA"),
+    "IT": VatFormat("IT", r"\d{11}", "IT12345678901"),
+    "LT": VatFormat("LT", r"\d{9}|\d{12}", "LT123456789"),
+    "LU": VatFormat("LU", r"\d{8}", "LU12345678"),
+    "LV": VatFormat("LV", r"\d{11}", "LV12345678901"),
+    "MT": VatFormat("MT", r"\d{8}", "MT12345678"),
+    "NL": VatFormat("NL", r"\d{9}B\d{2}", "NL123456789B01"),
+    "NO": VatFormat("NO", r"\d{9}(MVA)?", "NO123456789MVA"),
+    "PL": VatFormat("PL", r"\d{10}", "PL1234567890"),
+    "PT": VatFormat("PT", r"\d{9}", "PT123456789"),
+    "RO": VatFormat("RO", r"\d{2,10}", "RO1234567890"),
+    "SE": VatFormat("SE", r"\d{10}01", "SE123456789001"),
+    "SI": VatFormat("SI", r"\d{8}", "SI12345678"),
+    "SK": VatFormat("SK", r"\d{10}", "SK1234567890"),
+}
+
+# Common names which are not the (short) ISO names
+ALIASES = {
+    "US": ["USA", "US", "United States", "America", "U.S.", "U.S.A."],
+    "GB": ["UK", "United Kingdom", "Great Britain", "Britain", "England", "Scotland", "Wales", "Northern Ireland"],
+    "KR": ["South Korea", "Republic of Korea"],
+    "KP": ["North Korea"],
+    "RU": ["Russia"],
+    "IR": ["Iran"],
+    "SY": ["Syria"],
+    "LA": ["Laos"],
+    "VN": ["Vietnam"],
+    "MD": ["Moldova"],
+    "TZ": ["Tanzania"],
+    "VE": ["Venezuela"],
+    "BO": ["Bolivia"],
+    "CZ": ["Czech Republic"],
+    "NL": ["Holland"],
+    "VA": ["Vatican", "Vatican City"],
+    "CD": ["DR Congo", "DRC", "Democratic Republic of the Congo", "Congo-Kinshasa"],
+    "CG": ["Republic of the Congo", "Congo-Brazzaville"],
+    "CI": ["Ivory Coast"],
+    "CV": ["Cape Verde"],
+    "SZ": ["Swaziland"],
+    "MK": ["Macedonia", "North Macedonia"],
+    "TR": ["Turkiye"],
+    "FM": ["Micronesia"],
+    "PS": ["Palestine"],
+    "TW": ["Taiwan"],
+    "AE": ["UAE", "Emirates"],
+    "MM": ["Burma"],
+    "TL": ["East Timor"],
+    "BN": ["Brunei"],
+    "GR": ["Hellas"],
+}
+
+def normalize(text: str) -> str:
+    """Case-folded, without accents, punctuation or a leading "the"."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char)).casefold()
+    text = " ".join(re.sub(r"[^\w]+", " ", text).split())
+    return text[4:] if text.startswith("the ") else text
+
+def _names(country: Country) -> List[str]:
+    names = [country.name, re.sub(r"\s*[(\[].*?[)\]]", "", country.name)]
+    return names + ALIASES.get(country.alpha2, [])
+
+class _Node:
+    __slots__ = ("children", "values")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.values: List[Country] = []
+
+class Trie:
+    def __init__(self):
+        self.root = _Node()
+
+    def insert(self, key: str, value: Country):
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, _Node())
+        if value not in node.values:
+            node.values.append(value)
+
+    def get(self, key: str) -> List[Country]:
+        node = self.root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.values
+
+    def prefix(self, key: str) -> List[Country]:
+        """Values of every key starting with `key`, shortest keys first."""
+        node = self.root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        found: List[Country] = []
+        level = [node]
+        while level:
+            for node in level:
+                found.extend(value for value in node.values if value not in found)
+            level = [child for node in level for child in node.children.values()]
+        return found
+
+    def fuzzy(self, key: str, max_distance: int) -> List[Tuple[int, Country]]:
+        """(edit distance, value) of the keys within `max_distance` edits of `key`, closest first."""
+        found: Dict[str, Tuple[int, Country]] = {}
+
+        def walk(node: _Node, char: str, previous: List[int]):
+            row = [previous[0] + 1]
+            for i in range(1, len(key) + 1):
+                row.append(min(row[i - 1] + 1, previous[i] + 1, previous[i - 1] + (key[i - 1] != char)))
+            if row[-1] <= max_distance:
+                for value in node.values:
+                    if value.alpha2 not in found or found[value.alpha2][0] > row[-1]:
+                        found[value.alpha2] = (row[-1], value)
+            # no key below can get closer than the best of this row
+            if min(row) <= max_distance:
+                for (next_char, child) in node.children.items():
+                    walk(child, next_char, row)
+
+        first = list(range(len(key) + 1))
+        for (char, child) in self.root.children.items():
+            walk(child, char, first)
+        return sorted(found.values(), key=lambda match: (match[0], match[1].name))
+
+class ReferenceData:
+    def __init__(self, countries: Iterable[Country]):
+        countries = list(countries)
+        self.by_alpha2 = {country.alpha2: country for country in countries}
+        self.by_alpha3 = {country.alpha3: country for country in countries}
+        self.by_numeric = {country.numberic: country for country in countries}
+        self.names = Trie()
+        for country in countries:
+            for name in _names(country):
+                self.names.insert(normalize(name), country)
+        self.vat_patterns = {
+            alpha2: re.compile(f"(?:{fmt.pattern})") for (alpha2, fmt) in VAT_FORMATS.items()
+        }
+
+    def country(self, value: str) -> Optional[Country]:
+        """The country with the code (alpha-2, alpha-3 or numeric), name or alias, if unambiguous."""
+        value = value.strip()
+        code = value.upper()
+        if code in self.by_alpha2:
+            return self.by_alpha2[code]
+        if code in self.by_alpha3:
+            return self.by_alpha3[code]
+        if code.isdigit():
+            return self.by_numeric.get(int(code))
+        matches = self.names.get(normalize(value))
+        return matches[0] if len(matches) == 1 else None
+
+    def search(self, text: str, limit: int = 10) -> List[Country]:
+        """Countries by name: exact, then prefix, then fuzzy matches."""
+        key = normalize(text)
+        found = list(self.names.get(key))
+        for country in self.names.prefix(key):
+            if country not in found:
+                found.append(country)
+        if len(found) < limit and len(key) >= 3:
+            for (_, country) in self.names.fuzzy(key, 1 if len(key) < 6 else 2):
+                if country not in found:
+                    found.append(country)
+        return found[:limit]
+
+    def currency(self, country: str) -> Optional[str]:
+        found = self.country(country)
+        return CURRENCIES.get(found.alpha2) if found else None
+
+    def vat_format(self, country: str) -> Optional[VatFormat]:
+        found = self.country(country)
+        return VAT_FORMATS.get(found.alpha2) if found else None
+
+    def validate(self, records: Iterable) -> List[Dict]:
+        """
+        Checks the country of records such as clients, suppliers
+        or the company, in one call (see vat.validate_many for their
+        VAT numbers). Repeated countries are checked once.
+        """
+        checked: Dict[str, Tuple[Optional[str], List[str]]] = {}
+        results = []
+        for record in records:
+            value = getattr(record, "country", "") or ""
+            if value not in checked:
+                checked[value] = self._check(value)
+            (alpha2, problems) = checked[value]
+            results.append({"id": getattr(record, "id", None), "country": alpha2, "problems": list(problems)})
+        return results
+
+    def _check(self, value: str) -> Tuple[Optional[str], List[str]]:
+        country = self.country(value)
+        if country is None:
+            return (None, [f"Unknown country: {value!r}"])
+        if value != country.alpha2:
+            return (country.alpha2, [f"Country {value!r} should be stored as {country.alpha2!r}"])
+        return (country.alpha2, [])
+
+_reference: Optional[ReferenceData] = None
+_lock = threading.Lock()
+
+def reference() -> ReferenceData:
+    """The reference data, indexed on first use."""
+    global _reference
+    if _reference is None:
+        with _lock:
+            if _reference is None:
+                _reference = ReferenceData(COUNTRIES)
+    return _reference
@@ -0,0 +1,335 @@
+"""
+Recording and replay of agent runs.
+
+With ACCTA_RECORD=<directory> every session records the model side of its
+runs: the user messages, the tool outputs the model was given and the
+stream events the model returned (with their timing), one gzipped JSONL
+file per conversation. The ledger the session started from is recorded
+with it: the path of ACCTA_LEDGER_DB, or else a copy of the session's
+(test) ledger in `<recording>.ledger.db`, as its ids are random.
+
+A recording is replayed with the real tools but without the LLM:
+ACCTA_MODEL=replay:<file> makes new agents answer from the recording.
+This module runs such replays and measures them, to compare builds:
+
+    python replay.py ws recording.jsonl.gz      # through websocket_endpoint
+    python replay.py cli recording.jsonl.gz     # through run_single_message
+
+reporting the server-side time, CPU time, memory allocations, output bytes
+and the tool outputs which differ from the recorded ones. Both replay
+against the recorded ledger, so that tool outputs (and the ids in the
+recorded tool arguments) match.
+"""
+import argparse
+import asyncio
+import contextlib
+import gzip
+import io
+import json
+import os
+import time
+import tracemalloc
+import typing
+import uuid
+
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from agents.items import ModelResponse, TResponseStreamEvent
+from agents.models.interface import Model
+from agents.usage import Usage
+from openai.types.responses import Response
+from pydantic import BaseModel
+
+from log import session_id
+from state import State
+from store_sqlite import StoreSqlite
+
+FORMAT_VERSION = 1
+
+def _event_classes() -> Dict[str, type]:
+    union = typing.get_args(TResponseStreamEvent)[0]
+    classes = {}
+    for cls in typing.get_args(union):
+        for literal in typing.get_args(cls.model_fields["type"].annotation):
+            classes[literal] = cls
+    return classes
+
+EVENT_CLASSES = _event_classes()
+
+def plain(item: Any) -> Any:
+    """An input or output item as JSON data."""
+    if isinstance(item, BaseModel):
+        return item.model_dump(mode="json", exclude_unset=True)
+    return item
+
+def new_input(input: Any) -> List[Dict]:
+    """The items added since the model last answered: the user message or tool outputs."""
+    if isinstance(input, str):
+        return [{"role": "user", "content": input}]
+    items = []
+    for item in reversed(input):
+        item = plain(item)
+        if not (item.get("role") == "user" or item.get("type") == "function_call_output"):
+            break
+        items.append(item)
+    return items[::-1]
+
+def user_messages(records: List[Dict]) -> List[str]:
+    """The user messages of a recording, in order."""
+    messages = []
+    for record in records:
+        for item in record["input"]:
+            if item.get("role") == "user":
+                content = item["content"]
+                if isinstance(content, list):
+                    content = "".join(part.get("text", "") for part in content)
+                messages.append(content)
+    return messages
+
+def read(path: str) -> Tuple[Dict, List[Dict]]:
+    """The header and the model calls of a recording."""
+    with gzip.open(path, "rt") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a recording (version {FORMAT_VERSION})")
+    return (lines[0], lines[1:])
+
+def load(path: str) -> List[Dict]:
+    return read(path)[1]
+
+def recorded_ledger(path: str) -> Optional[str]:
+    """The ledger database the recorded session started from, if it was recorded."""
+    ledger = read(path)[0].get("ledger")
+    if ledger is None:
+        return None
+    ledger = os.path.join(os.path.dirname(os.path.abspath(path)), ledger)
+    if not os.path.exists(ledger):
+        raise ValueError(f"The ledger of {path} is missing: {ledger}")
+    return ledger
+
+class RecordingModel(Model):
+    """Passes calls on to a model, appending every call to the session's recording."""
+    def __init__(self, inner: Model, directory: str, state: Optional[State] = None):
+        self.inner = inner
+        self.path = os.path.join(directory, f"{session_id.get() or uuid.uuid4()}-{int(time.time())}.jsonl.gz")
+        os.makedirs(directory, exist_ok=True)
+        header = {"version": FORMAT_VERSION, "created": time.time()}
+        ledger_db = os.environ.get("ACCTA_LEDGER_DB")
+        if ledger_db:
+            header["ledger"] = os.path.abspath(ledger_db)
+        elif state is not None:
+            snapshot = self.path[:-len(".jsonl.gz")] + ".ledger.db"
+            StoreSqlite(snapshot).copy_from(state)
+            header["ledger"] = os.path.basename(snapshot)
+        self._write(header)
+
+    def _write(self, record: Dict):
+        # one gzip member per record: the file stays readable if the process dies
+        with gzip.open(self.path, "at") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs) -> ModelResponse:
+        response = await self.inner.get_response(
+            system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs
+        )
+        self._write({"input": new_input(input), "output": [plain(item) for item in response.output]})
+        return response
+
+    async def stream_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs) -> AsyncIterator[Any]:
+        start = time.perf_counter()
+        events = []
+        try:
+            async for event in self.inner.stream_response(
+                system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs
+            ):
+                events.append([round(time.perf_counter() - start, 4), plain(event)])
+                yield event
+        finally:
+            self._write({"input": new_input(input), "events": events})
+
+class ReplayModel(Model):
+    """
+    Answers the model calls of a session with the recorded responses, in order.
+
+    Tool outputs which differ from the recorded ones are collected in `mismatches`.
+    With `realtime` the recorded timing of the events is reproduced.
+    """
+    def __init__(self, path: str, realtime: bool = False):
+        self.records = load(path)
+        self.realtime = realtime
+        self.position = 0
+        self.mismatches: List[Dict] = []
+
+    def next_record(self, input: Any) -> Dict:
+        if self.position >= len(self.records):
+            raise RuntimeError("The recording has no more model calls")
+        record = self.records[self.position]
+        self.position += 1
+
+        recorded = {item["call_id"]: item.get("output") for item in record["input"] if item.get("type") == "function_call_output"}
+        for item in new_input(input):
+            if item.get("type") == "function_call_output" and recorded.get(item["call_id"]) != item.get("output"):
+                self.mismatches.append({
+                    "call_id": item["call_id"],
+                    "recorded": recorded.get(item["call_id"]),
+                    "replayed": item.get("output"),
+                })
+        return record
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs) -> ModelResponse:
+        record = self.next_record(input)
+        if "output" in record:
+            output = record["output"]
+        else:
+            # recorded as a stream: answer with the output of the completed response
+            completed = next(event for (_, event) in record["events"] if event["type"] == "response.completed")
+            output = completed["response"]["output"]
+        response = Response.model_validate({
+            "id": "resp_replay", "created_at": 0, "model": "replay", "object": "response",
+            "output": output, "parallel_tool_calls": False, "tool_choice": "auto", "tools": [],
+        })
+        return ModelResponse(output=response.output, usage=Usage(), response_id=None)
+
+    async def stream_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs) -> AsyncIterator[Any]:
+        record = self.next_record(input)
+        start = time.perf_counter()
+        for (offset, data) in record.get("events", []):
+            if self.realtime:
+                delay = offset - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield EVENT_CLASSES[data["type"]].model_validate(data)
+
+def replay_models() -> List[ReplayModel]:
+    import api
+    # the server's agents use this module as imported by agent.py, not __main__
+    import replay
+    return [agent.model for agent in api.manager.websocket_agents.values() if isinstance(agent.model, replay.ReplayModel)]
+
+class Measurement:
+    """Wall time, CPU time and allocations of the enclosed code."""
+    def __enter__(self):
+        tracemalloc.start()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.process_time() - self.cpu
+        snapshot = tracemalloc.take_snapshot()
+        (_, self.peak) = tracemalloc.get_traced_memory()
+        self.allocated = sum(stat.size for stat in snapshot.statistics("filename"))
+        tracemalloc.stop()
+
+def use_ledger(ledger: Optional[str]):
+    """Makes new sessions (of the server and the CLI) start from the ledger database."""
+    if ledger is None:
+        print("The recording has no ledger: replaying against ACCTA_LEDGER_DB or the test state")
+        return
+    os.environ["ACCTA_LEDGER_DB"] = ledger
+    import api
+    api.LEDGER_DB = ledger
+    api._ledger = None
+
+def replay_ws(path: str) -> Dict:
+    """Replays a recording through websocket_endpoint, in process."""
+    from fastapi.testclient import TestClient
+    import api
+
+    use_ledger(recorded_ledger(path))
+    messages = user_messages(load(path))
+    latencies = []
+    output_bytes = 0
+    frames = 0
+    with TestClient(api.app) as client:
+        with Measurement() as measured:
+            with client.websocket_connect("/ws/agent") as ws:
+                ws.receive_text()  # session_init
+                for message in messages:
+                    sent = time.perf_counter()
+                    ws.send_text(json.dumps({"message": message}))
+                    while True:
+                        frame = ws.receive_text()
+                        frames += 1
+                        output_bytes += len(frame.encode())
+                        if json.loads(frame).get("type") in ("complete", "error"):
+                            break
+                    latencies.append(time.perf_counter() - sent)
+                mismatches = [m for model in replay_models() for m in model.mismatches]
+
+    return {
+        "messages": len(messages),
+        "latency": latencies,
+        "frames": frames,
+        "output_bytes": output_bytes,
+        "mismatches": mismatches,
+        "wall": measured.wall,
+        "cpu": measured.cpu,
+        "peak_memory": measured.peak,
+        "allocated": measured.allocated,
+    }
+
+def replay_cli(path: str) -> Dict:
+    """Replays a recording through the CLI's run_single_message."""
+    import main
+
+    use_ledger(recorded_ledger(path))
+    main._cli_agent = None
+    model = main.get_cli_agent().model
+    messages = user_messages(model.records)
+    latencies = []
+    output = io.StringIO()
+
+    async def run():
+        for message in messages:
+            sent = time.perf_counter()
+            await main.run_single_message(message)
+            latencies.append(time.perf_counter() - sent)
+
+    with Measurement() as measured:
+        with contextlib.redirect_stdout(output):
+            asyncio.run(run())
+
+    return {
+        "messages": len(messages),
+        "latency": latencies,
+        "output_bytes": len(output.getvalue().encode()),
+        "mismatches": model.mismatches,
+        "wall": measured.wall,
+        "cpu": measured.cpu,
+        "peak_memory": measured.peak,
+        "allocated": measured.allocated,
+    }
+
+def main():
+    import agent
+
+    parser = argparse.ArgumentParser(description="Replay a recorded conversation without the LLM")
+    parser.add_argument("mode", choices=["ws", "cli"], help="Replay through the websocket endpoint or the CLI")
+    parser.add_argument("path", help="Recording (.jsonl.gz)")
+    parser.add_argument("--realtime", action="store_true", help="Reproduce the recorded model timing")
+    parser.add_argument("--json", help="Save the results to this file")
+    args = parser.parse_args()
+
+    # agents created by the server answer from the recording
+    agent.MODEL = f"replay:{args.path}"
+    agent.REPLAY_REALTIME = args.realtime
+
+    result = replay_ws(args.path) if args.mode == "ws" else replay_cli(args.path)
+
+    print(f"{result['messages']} messages replayed through {args.mode}")
+    print(f"  server time    {result['wall'] * 1e3:.1f} ms ({', '.join(f'{t * 1e3:.1f}' for t in result['latency'])} ms per message)")
+    print(f"  CPU time       {result['cpu'] * 1e3:.1f} ms")
+    print(f"  memory         {result['peak_memory'] / 1024:.1f} KiB peak traced, {result['allocated'] / 1024:.1f} KiB still allocated")
+    print(f"  output         {result['output_bytes']} bytes")
+    print(f"  tool outputs   {len(result['mismatches'])} differ from the recording")
+    for mismatch in result["mismatches"][:5]:
+        print(f"    {mismatch['call_id']}: {str(mismatch['recorded'])[:60]!r} -> {str(mismatch['replayed'])[:60]!r}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
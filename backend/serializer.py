@@ -0,0 +1,30 @@
+"""Cached per-type encoders for WebSocket messages"""
+from typing import Dict, Type
+
+from pydantic import TypeAdapter
+
+from messages import BaseMessage
+
+# one compiled serializer per message class,
+# built the first time that message type is sent.
+_adapters: Dict[Type[BaseMessage], TypeAdapter] = {}
+
+
+def adapter(cls: Type[BaseMessage]) -> TypeAdapter:
+    """Returns the (cached) TypeAdapter for the given message class."""
+    try:
+        return _adapters[cls]
+    except KeyError:
+        _adapters[cls] = TypeAdapter(cls)
+        return _adapters[cls]
+
+
+def encode(message: BaseMessage) -> bytes:
+    """Serializes a message to UTF-8 encoded JSON."""
+    return adapter(type(message)).dump_json(message)
+
+
+
+def encode_python(message: BaseMessage) -> Dict:
+    """Serializes a message to JSON compatible python primitives."""
+    return adapter(type(message)).dump_python(message, mode="json")
@@ -2,8 +2,14 @@ from pydantic.dataclasses import dataclass
 
 import uuid
 import datetime
+import itertools
 
-from typing import List
+from typing import List, Optional
+
+from aggregates import SpendCube, contributions, report
+from blobs import BlobText
+from balance import BalanceIndex
+from payments import PaymentIndex
 
 @dataclass
 class CompanyData:
@@ -53,7 +59,9 @@ class Document(Obj):
     id: uuid.UUID
     name: str
     description: str # AI extracted
-    content: str # OCR'd full text content
+    content: BlobText # OCR'd full text content, in the blob store
+    date: Optional[datetime.date] = None # e.g. when a photo was taken (EXIF)
+    location: Optional[str] = None # e.g. "Paris, France", where a photo was taken (EXIF GPS)
 
 
 @dataclass
@@ -73,6 +81,13 @@ class Invoice(Obj):
     due_date: datetime.date
     description: str
 
+@dataclass
+class Settlement(Obj):
+    id: uuid.UUID
+    invoice_id: uuid.UUID
+    bank_tx: uuid.UUID
+    amount: float # in the currency of the invoice and the bank
+
 @dataclass
 class Bank:
     id: uuid.UUID
@@ -105,6 +120,9 @@ class State:
     def list_suppliers(self) -> List[Supplier]:
         raise NotImplementedError("A state must implement the list_suppliers method.")
 
+    def list_settlements(self) -> List[Settlement]:
+        raise NotImplementedError("A state must implement the list_settlements method.")
+
     def list_unused_documents(self) -> List[Document]:
         """
         These basic implementations have horrible running time.
@@ -196,6 +214,71 @@ class State:
         if client_id not in valid_client_ids:
             raise ValueError(f"Invalid client ID: {client_id}")
 
+    def spend_cubes(self) -> List[SpendCube]:
+        """
+        Cubes whose cells add up to the spend of all expenses.
+        The basic implementation builds a cube from scratch on every call.
+        """
+        return [SpendCube.build(self)]
+
+    def spend_report(
+        self,
+        group_by: List[str],
+        supplier: Optional[uuid.UUID] = None,
+        vat_type: Optional[str] = None,
+        bank: Optional[uuid.UUID] = None,
+        from_month: Optional[str] = None,
+        to_month: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Spend of the expenses grouped by some of: supplier, vat_type, month and bank.
+        """
+        return report(self.spend_cubes(), group_by, supplier, vat_type, bank, from_month, to_month)
+
+    def balance_index(self, bank_id: uuid.UUID) -> BalanceIndex:
+        """
+        The running balance of a bank.
+        The basic implementation sorts the transactions on every call.
+        """
+        return BalanceIndex(self.list_transactions(bank_id))
+
+    def balance_at(self, bank_id: uuid.UUID, date: datetime.date) -> float:
+        """
+        The balance of a bank at the end of the date.
+        """
+        return self.balance_index(bank_id).balance_at(date)
+
+    def balance_extremes(self, bank_id: uuid.UUID, start: datetime.date, end: datetime.date):
+        """
+        The lowest and highest balance of a bank over a period, as (balance, date) pairs.
+        """
+        return self.balance_index(bank_id).extremes(start, end)
+
+    def payment_index(self) -> PaymentIndex:
+        """
+        What is outstanding on the invoices and unallocated on the incoming payments.
+        The basic implementation builds the index on every call.
+        """
+        return PaymentIndex.build(self)
+
+    def list_unpaid_invoices(self):
+        """
+        (invoice, paid, outstanding) of the invoices not fully paid, by due date.
+        """
+        return self.payment_index().unpaid_invoices()
+
+    def receivables_aging(self, as_of: datetime.date, client_id: Optional[uuid.UUID] = None) -> List[dict]:
+        """
+        Outstanding per client and currency in buckets of days overdue: 1-30, 31-60, 61-90 and 90+.
+        """
+        return self.payment_index().aging_report(as_of, client_id)
+
+    def list_overdue_invoices(self, as_of: datetime.date, client_id: Optional[uuid.UUID] = None):
+        """
+        (invoice, days overdue, outstanding) of the invoices due before the date, most overdue first.
+        """
+        return self.payment_index().overdue_invoices(as_of, client_id)
+
     def store_client(
         self,
         obj: Client
@@ -220,6 +303,12 @@ class State:
     ):
         raise NotImplementedError("A state must implement the update_expense method.")
 
+    def store_settlement(
+        self,
+        obj: Settlement
+    ):
+        raise NotImplementedError("A state must implement the store_settlement method.")
+
 
 class StoreMemory(State):
     """
@@ -244,6 +333,13 @@ class StoreMemory(State):
         self.expenses = {}
         self.transactions = {}
         self.invoices = {}
+        self.settlements = {}
+        # built on the first report, then maintained by store_expense
+        self.spend_cube: Optional[SpendCube] = None
+        # built on the first query, then maintained by store_invoice and store_settlement
+        self.payments: Optional[PaymentIndex] = None
+        # balance indexes per bank, built on the first query
+        self.balances = {}
 
     def set_bank(
         self,
@@ -252,6 +348,16 @@ class StoreMemory(State):
     ):
         self.banks[bank.id] = bank
         self.transactions[bank.id] = txs
+        self.spend_cube = None
+        self.balances.pop(bank.id, None)
+        self.payments = None
+
+    def add_transaction(self, bank_id: uuid.UUID, tx: BankTransaction):
+        self.transactions.setdefault(bank_id, []).append(tx)
+        self.spend_cube = None
+        self.payments = None
+        if bank_id in self.balances:
+            self.balances[bank_id].insert(tx)
 
     def set_company(self, company: CompanyData):
         self.company_data = company
@@ -283,6 +389,24 @@ class StoreMemory(State):
     def list_invoices(self) -> List[Invoice]:
         return list(self.invoices.values())
 
+    def list_settlements(self) -> List[Settlement]:
+        return list(self.settlements.values())
+
+    def payment_index(self) -> PaymentIndex:
+        if self.payments is None:
+            self.payments = PaymentIndex.build(self)
+        return self.payments
+
+    def spend_cubes(self) -> List[SpendCube]:
+        if self.spend_cube is None:
+            self.spend_cube = SpendCube.build(self)
+        return [self.spend_cube]
+
+    def balance_index(self, bank_id: uuid.UUID) -> BalanceIndex:
+        if bank_id not in self.balances:
+            self.balances[bank_id] = BalanceIndex(self.list_transactions(bank_id))
+        return self.balances[bank_id]
+
     def store_supplier(
         self,
         obj: Supplier
@@ -306,12 +430,24 @@ class StoreMemory(State):
         obj: Expense
     ):
         self.expenses[obj.id] = obj
+        if self.spend_cube is not None:
+            self.spend_cube.add(obj)
 
     def store_invoice(
         self,
         obj: Invoice
     ):
         self.invoices[obj.id] = obj
+        if self.payments is not None:
+            self.payments.add_invoice(obj)
+
+    def store_settlement(
+        self,
+        obj: Settlement
+    ):
+        self.settlements[obj.id] = obj
+        if self.payments is not None:
+            self.payments.settle(obj)
 
 def merge(objs, overwrites):
     objs_dict = {obj.id: obj for obj in objs}
@@ -319,16 +455,26 @@ def merge(objs, overwrites):
         objs_dict[obj.id] = obj
     return list(objs_dict.values())
 
+# Versions of transient states: unique across all transients,
+# so a replaced transient never reuses the version of its predecessor
+_versions = itertools.count(1)
+
 class Transient(State):
     def __init__(self, state: State):
         self.state = state
+        self.version = next(_versions)
         self.suppliers = {}
         self.clients = {}
         self.documents = {}
         self.expenses = {}
         self.invoices = {}
+        self.settlements = {}
         self.transactions = {}
         self.company_data = None
+        # copy of the payment index of the state with our changes (made on the first query)
+        self.payments: Optional[PaymentIndex] = None
+        # changes of the expenses to the spend cubes of the state (built on the first report)
+        self.spend_delta: Optional[SpendCube] = None
 
     def company(self):
         if self.company_data:
@@ -351,6 +497,21 @@ class Transient(State):
             self.suppliers
         )
 
+    def list_settlements(self) -> List[Settlement]:
+        return merge(
+            self.state.list_settlements(),
+            self.settlements
+        )
+
+    def payment_index(self) -> PaymentIndex:
+        if self.payments is None:
+            self.payments = self.state.payment_index().copy()
+            for invoice in self.invoices.values():
+                self.payments.add_invoice(invoice)
+            for settlement in self.settlements.values():
+                self.payments.settle(settlement)
+        return self.payments
+
     def list_clients(self) -> List[Client]:
         return merge(
             self.state.list_clients(),
@@ -375,32 +536,71 @@ class Transient(State):
             self.transactions
         )
 
+    def spend_cubes(self) -> List[SpendCube]:
+        base = self.state.spend_cubes()
+        if self.spend_delta is None:
+            self.spend_delta = base[0].delta()
+            for expense in self.expenses.values():
+                self._add_spend(expense, base)
+        return base + [self.spend_delta]
+
+    def balance_index(self, bank_id: uuid.UUID) -> BalanceIndex:
+        if self.transactions:
+            return super().balance_index(bank_id)
+        return self.state.balance_index(bank_id)
+
+    def _add_spend(self, expense: Expense, base: List[SpendCube]):
+        if expense.id not in self.spend_delta.contributions:
+            # replaces an expense of the state: cancel what it added
+            replaced = contributions(base, expense.id)
+            if replaced:
+                self.spend_delta.retract(replaced)
+        self.spend_delta.add(expense)
+
     def store_supplier(
         self,
         obj: Supplier
     ):
         self.suppliers[obj.id] = obj
+        self.version = next(_versions)
 
     def store_client(
         self,
         obj: Client
     ):
         self.clients[obj.id] = obj
+        self.version = next(_versions)
 
     def store_document(
         self,
         obj: Document
     ):
         self.documents[obj.id] = obj
+        self.version = next(_versions)
 
     def store_expense(
         self,
         obj: Expense
     ):
         self.expenses[obj.id] = obj
+        if self.spend_delta is not None:
+            self._add_spend(obj, self.state.spend_cubes())
+        self.version = next(_versions)
 
     def store_invoice(
         self,
         obj: Invoice
     ):
         self.invoices[obj.id] = obj
+        if self.payments is not None:
+            self.payments.add_invoice(obj)
+        self.version = next(_versions)
+
+    def store_settlement(
+        self,
+        obj: Settlement
+    ):
+        self.settlements[obj.id] = obj
+        if self.payments is not None:
+            self.payments.settle(obj)
+        self.version = next(_versions)
@@ -0,0 +1,275 @@
+"""
+SQLite backed ledger storage.
+
+Unlike StoreMemory the ledger lives in a file,
+so it can be shared between the worker processes of the server.
+Document bodies live in the blob store of the ledger, next to its database
+(see blobs.py): rows reference them by hash.
+"""
+import contextlib
+import sqlite3
+import threading
+import uuid
+
+from typing import List, Optional, Type, TypeVar
+
+from pydantic import TypeAdapter
+
+from aggregates import SpendCube
+from blobs import ledger_blobs
+from balance import BalanceIndex
+from payments import PaymentIndex
+from state import (
+    State, CompanyData, Bank, BankTransaction,
+    Client, Supplier, Document, Invoice, Expense, Settlement
+)
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS company (id INTEGER PRIMARY KEY CHECK (id = 0), data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS banks (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS transactions (id TEXT PRIMARY KEY, bank_id TEXT NOT NULL, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS transactions_bank ON transactions (bank_id);
+CREATE TABLE IF NOT EXISTS clients (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS suppliers (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS expenses (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS invoices (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS settlements (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+"""
+
+class StoreSqlite(State):
+    """
+    A ledger stored in an SQLite database file.
+
+    Every thread reads through its own connection (tools run on a thread pool),
+    and the database runs in WAL mode so readers in other processes
+    are not blocked by writers.
+
+    Writes go through a single connection, under the lock of the indexes
+    shared by all threads: its data_version only changes when another
+    process has committed, which is when the indexes are dropped.
+    Writes of this store keep them up to date themselves.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.blobs = ledger_blobs(path)
+        self.local = threading.local()
+        self.adapters = {}
+        # indexes derived from the ledger, rebuilt when the database has changed
+        self.spend_cube: Optional[SpendCube] = None
+        self.balances = {}
+        self.payments: Optional[PaymentIndex] = None
+        self.index_lock = threading.Lock()
+        self.writer = self._connect(check_same_thread=False)
+        self.data_version: Optional[int] = None
+        with self._write() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30, **kwargs)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def db(self) -> sqlite3.Connection:
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = self._connect()
+        return db
+
+    @contextlib.contextmanager
+    def _write(self):
+        """A transaction of the writer connection, with the indexes locked and up to date."""
+        with self.index_lock:
+            self._refresh()
+            try:
+                with self.writer as db:
+                    yield db
+            except BaseException:
+                self._drop_indexes()  # they may have been updated with what was rolled back
+                raise
+
+    def _adapter(self, cls: Type[T]) -> TypeAdapter:
+        if cls not in self.adapters:
+            self.adapters[cls] = TypeAdapter(cls)
+        return self.adapters[cls]
+
+    def _load(self, cls: Type[T], rows) -> List[T]:
+        adapter = self._adapter(cls)
+        return [adapter.validate_json(data, context={"blobs": self.blobs}) for (data,) in rows]
+
+    def _dump(self, cls: Type[T], obj: T) -> str:
+        # document bodies are copied to the blob store of the ledger, rows only reference them
+        return self._adapter(cls).dump_json(obj, context={"blob_refs": True, "blobs": self.blobs}).decode()
+
+    def _list(self, table: str, cls: Type[T]) -> List[T]:
+        return self._load(cls, self.db().execute(f"SELECT data FROM {table} ORDER BY rowid"))
+
+    def _store(self, db: sqlite3.Connection, table: str, cls: Type[T], obj: T):
+        db.execute(
+            f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)",
+            (str(obj.id), self._dump(cls, obj))
+        )
+
+    def set_bank(
+        self,
+        bank: Bank,
+        txs: List[BankTransaction]
+    ):
+        with self._write() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO banks (id, data) VALUES (?, ?)",
+                (str(bank.id), self._dump(Bank, bank))
+            )
+            db.execute("DELETE FROM transactions WHERE bank_id = ?", (str(bank.id),))
+            db.executemany(
+                "INSERT INTO transactions (id, bank_id, data) VALUES (?, ?, ?)",
+                [(str(tx.id), str(bank.id), self._dump(BankTransaction, tx)) for tx in txs]
+            )
+            self.spend_cube = None
+            self.balances.pop(bank.id, None)
+            self.payments = None
+
+    def set_company(self, company: CompanyData):
+        with self._write() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO company (id, data) VALUES (0, ?)",
+                (self._dump(CompanyData, company),)
+            )
+
+    def company(self) -> CompanyData:
+        row = self.db().execute("SELECT data FROM company WHERE id = 0").fetchone()
+        if row is None:
+            raise ValueError(f"No company stored in {self.path}")
+        return self._adapter(CompanyData).validate_json(row[0])
+
+    def is_empty(self) -> bool:
+        return self.db().execute("SELECT 1 FROM company").fetchone() is None
+
+    def list_transactions(self, bank_id: uuid.UUID) -> List[BankTransaction]:
+        rows = self.db().execute(
+            "SELECT data FROM transactions WHERE bank_id = ? ORDER BY rowid",
+            (str(bank_id),)
+        )
+        return self._load(BankTransaction, rows)
+
+    def list_banks(self) -> List[Bank]:
+        return self._list("banks", Bank)
+
+    def list_suppliers(self) -> List[Supplier]:
+        return self._list("suppliers", Supplier)
+
+    def list_clients(self) -> List[Client]:
+        return self._list("clients", Client)
+
+    def list_documents(self) -> List[Document]:
+        return self._list("documents", Document)
+
+    def list_expenses(self) -> List[Expense]:
+        return self._list("expenses", Expense)
+
+    def list_invoices(self) -> List[Invoice]:
+        return self._list("invoices", Invoice)
+
+    def list_settlements(self) -> List[Settlement]:
+        return self._list("settlements", Settlement)
+
+    def _refresh(self):
+        """Drops the indexes if another process has committed since we last looked (under index_lock)."""
+        version = self.writer.execute("PRAGMA data_version").fetchone()[0]
+        if self.data_version != version:
+            self.data_version = version
+            self._drop_indexes()
+
+    def _drop_indexes(self):
+        self.spend_cube = None
+        self.balances = {}
+        self.payments = None
+
+    def spend_cubes(self) -> List[SpendCube]:
+        with self.index_lock:
+            self._refresh()
+            if self.spend_cube is None:
+                self.spend_cube = SpendCube.build(self)
+            return [self.spend_cube]
+
+    def balance_index(self, bank_id: uuid.UUID) -> BalanceIndex:
+        with self.index_lock:
+            self._refresh()
+            if bank_id not in self.balances:
+                self.balances[bank_id] = BalanceIndex(self.list_transactions(bank_id))
+            return self.balances[bank_id]
+
+    def payment_index(self) -> PaymentIndex:
+        with self.index_lock:
+            self._refresh()
+            if self.payments is None:
+                self.payments = PaymentIndex.build(self)
+            return self.payments
+
+    def store_supplier(
+        self,
+        obj: Supplier
+    ):
+        with self._write() as db:
+            self._store(db, "suppliers", Supplier, obj)
+
+    def store_client(
+        self,
+        obj: Client
+    ):
+        with self._write() as db:
+            self._store(db, "clients", Client, obj)
+
+    def store_document(
+        self,
+        obj: Document
+    ):
+        with self._write() as db:
+            self._store(db, "documents", Document, obj)
+
+    def store_expense(
+        self,
+        obj: Expense
+    ):
+        with self._write() as db:
+            self._store(db, "expenses", Expense, obj)
+            if self.spend_cube is not None:
+                self.spend_cube.add(obj)
+
+    def store_invoice(
+        self,
+        obj: Invoice
+    ):
+        with self._write() as db:
+            self._store(db, "invoices", Invoice, obj)
+            if self.payments is not None:
+                self.payments.add_invoice(obj)
+
+    def store_settlement(
+        self,
+        obj: Settlement
+    ):
+        with self._write() as db:
+            self._store(db, "settlements", Settlement, obj)
+            if self.payments is not None:
+                self.payments.settle(obj)
+
+    def copy_from(self, st: State):
+        """Copies an entire ledger into this store."""
+        self.set_company(st.company())
+        for bank in st.list_banks():
+            self.set_bank(bank, st.list_transactions(bank.id))
+        for client in st.list_clients():
+            self.store_client(client)
+        for supplier in st.list_suppliers():
+            self.store_supplier(supplier)
+        for doc in st.list_documents():
+            self.store_document(doc)
+        for expense in st.list_expenses():
+            self.store_expense(expense)
+        for invoice in st.list_invoices():
+            self.store_invoice(invoice)
+        for settlement in st.list_settlements():
+            self.store_settlement(settlement)
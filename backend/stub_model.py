@@ -0,0 +1,163 @@
+"""
+A local, deterministic stand-in for the OpenAI model.
+
+Every user message is answered with a scripted sequence of tool calls
+followed by a streamed text reply, with configurable timing. Used for
+load testing and development without network access or API spend.
+
+Select it for the server with ACCTA_MODEL=stub, tuned through:
+
+- ACCTA_STUB_DELTAS:      text deltas per reply (default 100)
+- ACCTA_STUB_INTERVAL:    seconds between deltas (default 0.01)
+- ACCTA_STUB_FIRST_DELAY: seconds before the first event of a response (default 0.2)
+- ACCTA_STUB_TOOLS:       comma separated tools called before replying,
+                          with JSON arguments after a colon (default none), e.g.
+                          tool_query_supplier:{"name_query":"air"},tool_query_list_invoices
+"""
+import asyncio
+import json
+import os
+import re
+import time
+
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from agents.items import ModelResponse
+from agents.models.interface import Model
+from agents.usage import Usage
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseCreatedEvent,
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseTextDeltaEvent,
+    ResponseTextDoneEvent,
+)
+
+WORDS = (
+    "The bank transaction from United Airlines matches the receipt for the flight to Chicago, "
+    "so I have reconciled it as a travel expense with VAT. Two hotel stays remain unreconciled "
+    "because no receipts were found for them. "
+).split()
+
+TOOL_NAME = re.compile(r"\s*(\w+)\s*(:)?")
+SEPARATOR = re.compile(r"\s*,?\s*")
+
+def parse_tools(spec: str) -> List[Tuple[str, str]]:
+    """Parses 'name:{json},name' into (name, arguments) pairs."""
+    tools = []
+    decoder = json.JSONDecoder()
+    pos = 0
+    while pos < len(spec):
+        match = TOOL_NAME.match(spec, pos)
+        if match is None:
+            raise ValueError(f"Invalid tool list at: {spec[pos:]!r}")
+        pos = match.end()
+        arguments = "{}"
+        if match.group(2):
+            (args, pos) = decoder.raw_decode(spec, pos)
+            arguments = json.dumps(args)
+        tools.append((match.group(1), arguments))
+        pos = SEPARATOR.match(spec, pos).end()
+    return tools
+
+class StubModel(Model):
+    def __init__(
+        self,
+        deltas: int = 100,
+        interval: float = 0.01,
+        first_delay: float = 0.2,
+        tools: Optional[List[Tuple[str, str]]] = None,
+    ):
+        self.deltas = deltas
+        self.interval = interval
+        self.first_delay = first_delay
+        self.tools = tools or []
+
+    @classmethod
+    def from_env(cls) -> "StubModel":
+        return cls(
+            deltas=int(os.environ.get("ACCTA_STUB_DELTAS", 100)),
+            interval=float(os.environ.get("ACCTA_STUB_INTERVAL", 0.01)),
+            first_delay=float(os.environ.get("ACCTA_STUB_FIRST_DELAY", 0.2)),
+            tools=parse_tools(os.environ.get("ACCTA_STUB_TOOLS", "")),
+        )
+
+    def next_tool(self, input: Any) -> Optional[Tuple[str, str]]:
+        """The next scripted tool call, given the tool outputs since the last user message."""
+        if isinstance(input, str):
+            return self.tools[0] if self.tools else None
+        outputs = 0
+        for item in reversed(input):
+            item_type = item.get("type") if isinstance(item, dict) else getattr(item, "type", None)
+            role = item.get("role") if isinstance(item, dict) else getattr(item, "role", None)
+            if role == "user":
+                break
+            if item_type == "function_call_output":
+                outputs += 1
+        return self.tools[outputs] if outputs < len(self.tools) else None
+
+    def text(self) -> List[str]:
+        return [WORDS[i % len(WORDS)] + " " for i in range(self.deltas)]
+
+    def response(self, output: List[Any]) -> Response:
+        return Response(
+            id=f"resp_stub_{time.monotonic_ns()}",
+            created_at=time.time(),
+            model="stub",
+            object="response",
+            output=output,
+            parallel_tool_calls=False,
+            tool_choice="auto",
+            tools=[],
+        )
+
+    def output(self, input: Any) -> List[Any]:
+        tool = self.next_tool(input)
+        if tool is not None:
+            (name, arguments) = tool
+            return [ResponseFunctionToolCall(
+                id=f"fc_stub_{time.monotonic_ns()}",
+                call_id=f"call_stub_{time.monotonic_ns()}",
+                name=name,
+                arguments=arguments,
+                type="function_call",
+                status="completed",
+            )]
+        return [ResponseOutputMessage(
+            id="msg_stub",
+            content=[ResponseOutputText(text="".join(self.text()), annotations=[], type="output_text")],
+            role="assistant",
+            status="completed",
+            type="message",
+        )]
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs) -> ModelResponse:
+        await asyncio.sleep(self.first_delay + self.interval * self.deltas)
+        return ModelResponse(output=self.output(input), usage=Usage(), response_id=None)
+
+    async def stream_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs) -> AsyncIterator[Any]:
+        await asyncio.sleep(self.first_delay)
+        output = self.output(input)
+        seq = 0
+        yield ResponseCreatedEvent(response=self.response([]), sequence_number=seq, type="response.created")
+
+        if isinstance(output[0], ResponseOutputMessage):
+            text = self.text()
+            for delta in text:
+                seq += 1
+                yield ResponseTextDeltaEvent(
+                    content_index=0, delta=delta, item_id="msg_stub", logprobs=[], output_index=0,
+                    sequence_number=seq, type="response.output_text.delta",
+                )
+                await asyncio.sleep(self.interval)
+            seq += 1
+            yield ResponseTextDoneEvent(
+                content_index=0, item_id="msg_stub", logprobs=[], output_index=0,
+                sequence_number=seq, text="".join(text), type="response.output_text.done",
+            )
+
+        seq += 1
+        yield ResponseCompletedEvent(response=self.response(output), sequence_number=seq, type="response.completed")
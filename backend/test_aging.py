@@ -0,0 +1,59 @@
+"""Receivables aging (see aging.py), against a scan of the open invoices."""
+import datetime
+
+import pytest
+
+from aging import BUCKETS
+from ledger_gen import generate_ledger
+
+@pytest.fixture(scope="module")
+def ledger():
+    return generate_ledger(transactions=2000, invoices=300, seed=5)
+
+def bucket(days_overdue: int) -> str:
+    for (name, days) in BUCKETS:
+        if days_overdue >= days:
+            return name
+    return "not_due"
+
+def scan(st, as_of: datetime.date):
+    """{(client, currency): {bucket: cents}} of the open invoices."""
+    index = st.payment_index()
+    report = {}
+    for invoice in st.list_invoices():
+        outstanding = index.outstanding[invoice.id]
+        if outstanding > 0:
+            buckets = report.setdefault((invoice.client, invoice.currency), dict.fromkeys([*dict(BUCKETS), "not_due"], 0))
+            buckets[bucket((as_of - invoice.due_date).days)] += outstanding
+    return report
+
+def as_of_dates(st):
+    """Dates on and around the bucket boundaries of some invoices."""
+    dues = sorted({invoice.due_date for invoice in st.list_invoices()})[::60]
+    return [due + datetime.timedelta(days=days) for due in dues for days in (-1, 0, 1, 30, 31, 60, 61, 90, 91)]
+
+def test_bucket_boundaries():
+    assert [bucket(days) for days in (-5, 0, 1, 30, 31, 60, 61, 90, 91)] == [
+        "not_due", "not_due", "1-30", "1-30", "31-60", "31-60", "61-90", "61-90", "90+",
+    ]
+
+def test_aging_report(ledger):
+    for as_of in as_of_dates(ledger):
+        expected = scan(ledger, as_of)
+        rows = ledger.receivables_aging(as_of)
+        assert {(row["client"], row["currency"]): row["buckets"] for row in rows} == {
+            key: {name: cents / 100 for (name, cents) in buckets.items()} for (key, buckets) in expected.items()
+        }
+
+def test_overdue_invoices_match_the_buckets(ledger):
+    # an invoice is overdue exactly when it is in an overdue bucket
+    clients = [client.id for client in ledger.list_clients()]
+    for as_of in as_of_dates(ledger):
+        for client in [None, *clients[:3]]:
+            overdue = ledger.list_overdue_invoices(as_of, client)
+            assert all(days >= 1 for (_, days, _) in overdue)
+            aged = sum(
+                amount for row in ledger.receivables_aging(as_of, client)
+                for (name, amount) in row["buckets"].items() if name != "not_due"
+            )
+            assert sum(outstanding for (_, _, outstanding) in overdue) == pytest.approx(aged)
@@ -0,0 +1,44 @@
+"""EXIF metadata of uploaded images (see extract.exif)."""
+import datetime
+import random
+import struct
+
+import pytest
+
+from bench import exif_jpeg
+from extract import exif, extract
+
+def tiff(*entries, data: bytes = b"") -> bytes:
+    """A little-endian TIFF with one IFD of (tag, type, count, 4 inline bytes) entries, then the data."""
+    ifd = struct.pack("<H", len(entries)) + b"".join(struct.pack("<HHI4s", *entry) for entry in entries)
+    return b"II*\x00" + struct.pack("<I", 8) + ifd + b"\x00\x00\x00\x00" + data
+
+def test_exif():
+    assert exif(exif_jpeg("2024:03:05 14:02:11", 48.8566, -2.3522)) == {
+        "date": datetime.date(2024, 3, 5), "latitude": pytest.approx(48.8566), "longitude": pytest.approx(-2.3522),
+    }
+
+@pytest.mark.parametrize("kind", ["ascii", "rational", "undefined"])  # instead of a LONG offset
+def test_exif_pointer_of_another_type(kind):
+    for tag in (0x8769, 0x8825):
+        if kind == "rational":  # out of line, after the single entry IFD at 8
+            data = tiff((tag, 5, 1, struct.pack("<I", 8 + 2 + 12 + 4)), data=struct.pack("<II", 26, 1))
+        else:
+            data = tiff((tag, 2 if kind == "ascii" else 7, 4, b"abc\x00"))
+        assert exif(data) == {}
+
+def test_exif_mutations():
+    data = exif_jpeg("2024:03:05 14:02:11", 48.8566, 2.3522)
+    rng = random.Random(1)
+    for _ in range(5000):
+        mutated = bytearray(data)
+        for _ in range(rng.randint(1, 4)):
+            mutated[rng.randrange(4, len(data))] = rng.randrange(256)
+        exif(bytes(mutated))  # never raises
+
+def test_extract_malformed_exif(tmp_path):
+    path = tmp_path / "receipt.tiff"
+    path.write_bytes(tiff((0x8825, 2, 4, b"abc\x00")))
+    result = extract(str(path), "receipt.tiff")
+    assert result["description"].startswith("image/tiff file")
+    assert (result["date"], result["location"]) == (None, None)
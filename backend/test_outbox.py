@@ -0,0 +1,34 @@
+"""Per-connection send queue (see outbox.py)."""
+import asyncio
+
+from messages import ToolOutputMessage
+from outbox import Outbox
+from transport import JsonCodec
+
+class Websocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, frame: str):
+        self.frames.append(frame)
+
+def test_bytes_of_text_frames():
+    message = ToolOutputMessage(output="Zürich – 東京 🧾 " * 10000)
+
+    async def run():
+        websocket = Websocket()
+        outbox = Outbox(websocket, JsonCodec(max_frame_size=1024))
+        outbox.start()
+        await outbox.put(message)
+        while outbox.entries:
+            await asyncio.sleep(0)
+        stats = outbox.stats()
+        await outbox.close()
+        return (websocket.frames, stats)
+
+    (frames, stats) = asyncio.run(run())
+    size = sum(len(frame.encode()) for frame in frames)
+    assert size > sum(len(frame) for frame in frames)
+    assert stats["bytes_sent"] == size
+    assert stats["high_water_bytes"] == size
+    assert stats["queued_bytes"] == 0
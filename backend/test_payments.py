@@ -0,0 +1,158 @@
+"""The payment index (see payments.py): incremental updates against PaymentIndex.build."""
+import datetime
+import random
+import uuid
+
+import pytest
+
+from ledger_gen import generate_ledger
+from payments import PaymentIndex, subset_sums
+from state import Bank, BankTransaction, Client, Invoice, Settlement, StoreMemory, Transient
+
+DAY = datetime.date(2024, 3, 1)
+
+def snapshot(index: PaymentIndex):
+    """Everything an index answers from, comparable between an updated and a rebuilt index."""
+    return {
+        "outstanding": index.outstanding,
+        "unpaid": index.unpaid,
+        "unallocated": index.unallocated,
+        "by_amount": index.by_amount,
+        "by_cents": {key: ids for (key, ids) in index.by_cents.items() if ids},
+        "aging": {key: (group.dues, group.ids, group.amounts) for (key, group) in index.aging.groups.items()},
+        "settlements": index.settlements,
+    }
+
+def invoice(client: uuid.UUID, amount: float, currency: str = "EUR", due_in: int = 30) -> Invoice:
+    return Invoice(
+        id=uuid.uuid4(), client=client, amount=amount, currency=currency,
+        created=DAY, due_date=DAY + datetime.timedelta(days=due_in), description="Consulting",
+    )
+
+def credit(amount: float, description: str = "Transfer", days: int = 10) -> BankTransaction:
+    return BankTransaction(id=uuid.uuid4(), amount=amount, date=DAY + datetime.timedelta(days=days), description=description)
+
+@pytest.fixture
+def ledger():
+    st = StoreMemory()
+    client = Client(id=uuid.uuid4(), name="Acme", address="", vat_number="", email="", phone="", country="FR")
+    st.store_client(client)
+    invoices = [invoice(client.id, 1000.0), invoice(client.id, 250.0, due_in=40), invoice(client.id, 400.0, due_in=20),
+                invoice(client.id, 90.0, currency="USD")]
+    for inv in invoices:
+        st.store_invoice(inv)
+    credits = [credit(1000.0), credit(650.0, "ACME invoices"), credit(300.0, "Acme part"), credit(-50.0), credit(90.0)]
+    st.set_bank(Bank(id=uuid.uuid4(), name="EUR", currency="EUR", iban=""), credits[:4])
+    st.set_bank(Bank(id=uuid.uuid4(), name="USD", currency="USD", iban=""), credits[4:])
+    return {"state": st, "client": client, "invoices": invoices, "credits": credits}
+
+def settlement(invoice: Invoice, tx: BankTransaction, amount: float, id: uuid.UUID = None) -> Settlement:
+    return Settlement(id=id or uuid.uuid4(), invoice_id=invoice.id, bank_tx=tx.id, amount=amount)
+
+def test_settle_replace_and_copy(ledger):
+    st = ledger["state"]
+    (inv, _, _, _) = ledger["invoices"]
+    (tx, _, _, _, _) = ledger["credits"]
+    base = st.payment_index()
+    before = snapshot(PaymentIndex.build(st))
+
+    transient = Transient(st)
+    first = settlement(inv, tx, 300.0)
+    transient.store_settlement(first)
+    assert transient.payment_index().outstanding[inv.id] == 70000
+    transient.store_settlement(settlement(inv, tx, 120.0, id=first.id))  # replaces it
+    index = transient.payment_index()
+    assert (index.outstanding[inv.id], index.unallocated[tx.id]) == (88000, 88000)
+    assert snapshot(index) == snapshot(PaymentIndex.build(transient))
+
+    # the index of the base ledger is untouched
+    assert st.payment_index() is base
+    assert snapshot(base) == before
+
+def test_add_invoice_keeps_what_is_paid(ledger):
+    st = ledger["state"]
+    (inv, _, _, _) = ledger["invoices"]
+    (tx, _, _, _, _) = ledger["credits"]
+    st.store_settlement(settlement(inv, tx, 400.0))
+    index = st.payment_index()
+
+    st.store_invoice(Invoice(**{**vars(inv), "amount": 1500.0, "due_date": DAY + datetime.timedelta(days=5)}))
+    assert (index.paid(inv.id), index.outstanding[inv.id]) == (400.0, 110000)
+    st.store_invoice(Invoice(**{**vars(inv), "amount": 400.0}))  # now fully paid
+    assert inv.id not in [id for (_, id) in index.unpaid]
+    assert snapshot(index) == snapshot(PaymentIndex.build(st))
+
+def test_check_settlement(ledger):
+    index = ledger["state"].payment_index()
+    (inv, _, small, usd) = ledger["invoices"]
+    (tx, _, part, debit, usd_tx) = ledger["credits"]
+
+    assert index.check_settlement(inv.id, tx.id, None) == 1000.0
+    assert index.check_settlement(small.id, part.id, None) == 300.0  # what the transaction can pay
+    assert index.check_settlement(inv.id, tx.id, 999.99) == 999.99
+    for (invoice_id, tx_id, amount, error) in [
+        (uuid.uuid4(), tx.id, None, "Invalid invoice ID"),
+        (inv.id, debit.id, None, "not an incoming payment"),
+        (inv.id, usd_tx.id, None, "is in USD"),
+        (usd.id, tx.id, None, "is in EUR"),
+        (inv.id, tx.id, 0.0, "must be positive"),
+        (inv.id, tx.id, 1000.01, "is outstanding"),
+        (inv.id, part.id, 300.01, "is unallocated"),
+    ]:
+        with pytest.raises(ValueError, match=error):
+            index.check_settlement(invoice_id, tx_id, amount)
+
+    index.settle(settlement(inv, tx, 1000.0))
+    with pytest.raises(ValueError, match="already paid"):
+        index.check_settlement(inv.id, part.id, None)
+    with pytest.raises(ValueError, match="already allocated"):
+        index.check_settlement(small.id, tx.id, None)
+
+def test_subset_sums():
+    items = [(uuid.uuid4(), amount) for amount in (100, 200, 300)]
+    sums = subset_sums(items)
+    assert set(sums) == {100, 200, 300, 400, 500, 600}
+    assert sums[300] == (2,)  # the fewest items
+    assert sums[600] == (0, 1, 2)
+
+def test_propose(ledger):
+    index = ledger["state"].payment_index()
+    (inv, other, small, _) = ledger["invoices"]
+    (tx, combined, part, _, _) = ledger["credits"]
+
+    proposals = index.propose(inv.id, "Acme")
+    assert [(p["kind"], p["bank_tx"]) for p in proposals[:1]] == [("exact", tx.id)]
+    assert {(p["kind"], p["bank_tx"]) for p in proposals[1:]} == {("partial", combined.id), ("partial", part.id)}
+    # 650 pays the 250 and 400 invoices, 300 part of the 400 one (its description names the client)
+    proposals = index.propose(small.id, "Acme")
+    assert [(p["kind"], p["bank_tx"]) for p in proposals] == [("combined", combined.id), ("partial", part.id)]
+    assert {a["invoice_id"]: a["amount"] for a in proposals[0]["allocations"]} == {small.id: 400.0, other.id: 250.0}
+    assert [p["kind"] for p in index.propose(small.id)] == ["combined"]  # partial payments need the client name
+
+def test_random_changes_match_a_rebuild():
+    st = generate_ledger(transactions=1000, invoices=100, seed=2)
+    base = snapshot(PaymentIndex.build(st))
+    transient = Transient(st)
+    rng = random.Random(2)
+    settlements = []
+    for _ in range(200):
+        index = transient.payment_index()
+        if settlements and rng.random() < 0.2:
+            # replace an earlier settlement with a smaller one
+            old = rng.choice(settlements)
+            transient.store_settlement(Settlement(id=old.id, invoice_id=old.invoice_id, bank_tx=old.bank_tx, amount=0.01))
+        elif rng.random() < 0.2:
+            inv = rng.choice(transient.list_invoices())
+            transient.store_invoice(Invoice(**{**vars(inv), "amount": round(inv.amount * rng.uniform(0.5, 1.5), 2)}))
+        else:
+            (_, invoice_id) = rng.choice(index.unpaid)
+            currency = index.invoices[invoice_id].currency
+            payments = [tx_id for (_, _, tx_id) in index.by_amount.get(currency, [])]
+            if not payments:
+                continue
+            tx_id = rng.choice(payments)
+            amount = index.check_settlement(invoice_id, tx_id, None)
+            settlements.append(Settlement(id=uuid.uuid4(), invoice_id=invoice_id, bank_tx=tx_id, amount=amount))
+            transient.store_settlement(settlements[-1])
+    assert snapshot(transient.payment_index()) == snapshot(PaymentIndex.build(transient))
+    assert snapshot(st.payment_index()) == base
@@ -0,0 +1,174 @@
+"""
+The state benchmarks of bench.py as a pytest suite.
+
+Every test checks the result of the State operation it times on synthetic
+ledgers (see ledger_gen.py) of each scale, then reports its time per call,
+which pytest prints after the results:
+
+    pytest test_state_bench.py
+    ACCTA_BENCH_SCALES=1000,100000 pytest test_state_bench.py
+"""
+import asyncio
+import os
+import re
+import uuid
+
+import pytest
+
+import bench
+from agent import Transaction, create_agent, new_transaction
+from cache import ToolCache
+from ledger_gen import generate_ledger
+from state import Transient
+
+SCALES = [int(scale) for scale in os.environ.get("ACCTA_BENCH_SCALES", "1000,10000").split(",")]
+
+@pytest.fixture(scope="module", params=SCALES, ids=lambda scale: f"{scale}tx")
+def ledger(request):
+    bench._current = "state"
+    return {"scale": request.param, **bench.state_ledger(request.param)}
+
+@pytest.fixture(params=["memory", "transient"])
+def view(request, ledger):
+    """The ledger itself, or a transaction on it without any action yet."""
+    st = ledger["state"]
+    return (request.param, st if request.param == "memory" else Transient(st))
+
+def timed(ledger, name: str, fn, **kwargs) -> float:
+    seconds = bench.autorange(fn, **kwargs)
+    bench.report(f"{ledger['scale']}/{name}", seconds)
+    return seconds
+
+def ids(entries) -> list:
+    return [entry.id for entry in entries]
+
+def test_generate_ledger_is_deterministic():
+    (first, second) = (generate_ledger(transactions=200, seed=3), generate_ledger(transactions=200, seed=3))
+    for bank in first.list_banks():
+        assert first.list_transactions(bank.id) == second.list_transactions(bank.id)
+    assert ids(first.list_documents()) == ids(second.list_documents())
+    assert first.list_expenses() == second.list_expenses()
+    assert ids(generate_ledger(transactions=200, seed=4).list_documents()) != ids(first.list_documents())
+
+def test_ledger_size(ledger):
+    st = ledger["state"]
+    assert sum(len(st.list_transactions(bank.id)) for bank in st.list_banks()) == ledger["scale"]
+    assert len(st.list_invoices()) == ledger["scale"] // 10
+
+def test_list_documents(ledger, view):
+    (label, state) = view
+    assert ids(state.list_documents()) == ids(ledger["state"].list_documents())
+    timed(ledger, f"{label}/list_documents", state.list_documents)
+
+def test_list_expenses(ledger, view):
+    (label, state) = view
+    assert state.list_expenses() == ledger["state"].list_expenses()
+    timed(ledger, f"{label}/list_expenses", state.list_expenses)
+
+def test_list_transactions(ledger, view):
+    (label, state) = view
+    bank = ledger["bank"]
+    transactions = state.list_transactions(bank.id)
+    assert ledger["free_tx"] in transactions and ledger["expensed_tx"] in transactions
+    timed(ledger, f"{label}/list_transactions", lambda: state.list_transactions(bank.id))
+
+def test_list_unused_documents(ledger, view):
+    (label, state) = view
+    used = {doc_id for expense in state.list_expenses() for doc_id in expense.docs_ids}
+    expected = [doc.id for doc in state.list_documents() if doc.id not in used]
+    assert ids(state.list_unused_documents()) == expected
+    assert ledger["free_doc"].id in expected and ledger["used_doc"].id not in expected
+    timed(ledger, f"{label}/list_unused_documents", state.list_unused_documents)
+
+def test_list_unreconciled_transactions(ledger, view):
+    (label, state) = view
+    bank = ledger["bank"]
+    expensed = {tx_id for expense in state.list_expenses() for tx_id in expense.bank_txs}
+    unreconciled = ids(state.list_unreconciled_transactions(bank.id))
+    assert not expensed & set(unreconciled)
+    assert ledger["free_tx"].id in unreconciled
+    timed(ledger, f"{label}/list_unreconciled_transactions", lambda: state.list_unreconciled_transactions(bank.id))
+
+def test_checks(ledger, view):
+    (label, state) = view
+    (free_tx, free_doc, client) = (ledger["free_tx"], ledger["free_doc"], ledger["client"])
+    checks = {
+        "check_transaction_ids": lambda: state.check_transaction_ids([free_tx.id]),
+        "check_document_ids": lambda: state.check_document_ids([free_doc.id]),
+        "check_transactions_not_expensed": lambda: state.check_transactions_not_expensed([free_tx.id]),
+        "check_documents_not_expensed": lambda: state.check_documents_not_expensed([free_doc.id]),
+        "check_client_id": lambda: state.check_client_id(client.id),
+    }
+    for (name, check) in checks.items():
+        check()  # passes
+        timed(ledger, f"{label}/{name}", check)
+
+    with pytest.raises(ValueError):
+        state.check_transaction_ids([uuid.uuid4()])
+    with pytest.raises(ValueError):
+        state.check_document_ids([uuid.uuid4()])
+    with pytest.raises(ValueError):
+        state.check_transactions_not_expensed([ledger["expensed_tx"].id])
+    with pytest.raises(ValueError):
+        state.check_documents_not_expensed([ledger["used_doc"].id])
+    with pytest.raises(ValueError):
+        state.check_client_id(uuid.uuid4())
+
+@pytest.mark.parametrize("name", ["update_supplier", "update_client", "new_invoice", "expense"])
+def test_apply(ledger, name):
+    st = ledger["state"]
+    action = bench.state_actions(ledger)[name]
+    transient = Transient(st)
+    action.apply(transient)
+
+    if name == "update_supplier":
+        supplier = next(s for s in transient.list_suppliers() if s.id == ledger["supplier"].id)
+        assert (supplier.country, supplier.vat_number) == ("DK", "DK24256790")
+    elif name == "update_client":
+        client = next(c for c in transient.list_clients() if c.id == ledger["client"].id)
+        assert (client.country, client.vat_number) == ("DK", "DK24256790")
+    elif name == "new_invoice":
+        assert action.invoice_id in ids(transient.list_invoices())
+        assert action.invoice_id not in ids(st.list_invoices())
+    else:
+        with pytest.raises(ValueError):
+            transient.check_transactions_not_expensed([ledger["free_tx"].id])
+        assert ledger["free_doc"].id not in ids(transient.list_unused_documents())
+        st.check_transactions_not_expensed([ledger["free_tx"].id])  # the ledger is untouched
+
+    timed(ledger, f"apply/{name}", lambda: action.apply(Transient(st)))
+
+def test_undo(ledger):
+    st = ledger["state"]
+    actions = bench.state_actions(ledger)
+    tx = Transaction(st)
+    for action in [actions["expense"], actions["update_client"], actions["new_invoice"]]:
+        tx.add_action(action)
+
+    # undoing the expense replays the other two: the transaction is free again
+    tx.tool_action_undo(tx.actions[0][0])
+    assert [action for (_, action) in tx.actions] == [actions["update_client"], actions["new_invoice"]]
+    tx.transient.check_transactions_not_expensed([ledger["free_tx"].id])
+    assert actions["new_invoice"].invoice_id in ids(tx.transient.list_invoices())
+
+    # undo the first of 9 actions: the other 8 are replayed
+    for action in [actions["update_supplier"], actions["update_client"], actions["new_invoice"]] * 3:
+        tx.add_action(action)
+
+    def undo():
+        tx.tool_action_undo(tx.actions[0][0])
+        tx.add_action(actions["update_supplier"])
+    timed(ledger, "undo", undo)
+
+def test_tool_query_for_document(ledger):
+    st = ledger["state"]
+    pattern = re.compile("(hotel)|(marriott)", re.IGNORECASE)
+    expected = [doc.id for doc in st.list_documents() if pattern.search(doc.description) or pattern.search(str(doc.content))]
+    assert expected
+
+    tx = new_transaction(initial_state=st)
+    tx.cache = ToolCache(max_bytes=0)  # time the search, not the cache
+    agent = create_agent(transaction=tx)
+    search = lambda: asyncio.run(bench.invoke_tool(agent, "tool_query_for_document", {"search_regex": pattern.pattern}))
+    assert ids(search()) == expected
+    timed(ledger, "tool_query_for_document", search, budget=0.2)
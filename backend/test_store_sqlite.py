@@ -0,0 +1,64 @@
+"""The indexes of an SQLite ledger, shared by the threads of a process (see StoreSqlite)."""
+import dataclasses
+import sqlite3
+import threading
+import uuid
+
+import pytest
+
+from aggregates import SpendCube
+from payments import PaymentIndex
+from store_sqlite import StoreSqlite
+from test_state import create_test_state
+
+@pytest.fixture
+def ledger(tmp_path):
+    st = StoreSqlite(str(tmp_path / "ledger.db"))
+    st.copy_from(create_test_state())
+    return st
+
+@pytest.fixture
+def builds(monkeypatch):
+    counts = {"spend": 0, "payments": 0}
+    (spend, payments) = (SpendCube.build.__func__, PaymentIndex.build.__func__)
+
+    def count(name, build):
+        def counted(cls, st):
+            counts[name] += 1
+            return build(cls, st)
+        return classmethod(counted)
+    monkeypatch.setattr(SpendCube, "build", count("spend", spend))
+    monkeypatch.setattr(PaymentIndex, "build", count("payments", payments))
+    return counts
+
+def in_threads(fn, count: int = 4):
+    threads = [threading.Thread(target=fn) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def test_threads_share_the_indexes(ledger, builds):
+    ledger.spend_cubes()
+    in_threads(ledger.spend_cubes)
+    in_threads(ledger.payment_index)
+    assert builds == {"spend": 1, "payments": 1}
+
+def test_writes_update_the_indexes(ledger, builds):
+    (cube, payments) = (ledger.spend_cubes()[0], ledger.payment_index())
+    expense = dataclasses.replace(ledger.list_expenses()[0], id=uuid.uuid4())
+    invoice = dataclasses.replace(ledger.list_invoices()[0], id=uuid.uuid4())
+    in_threads(lambda: ledger.store_expense(expense), 1)
+    in_threads(lambda: ledger.store_invoice(invoice), 1)
+    in_threads(lambda: (ledger.spend_cubes(), ledger.payment_index()))
+    assert builds == {"spend": 1, "payments": 1}
+    assert ledger.spend_cubes()[0] is cube and ledger.payment_index() is payments
+    assert invoice.id in payments.invoices
+
+def test_writes_of_another_process_drop_the_indexes(ledger, builds):
+    ledger.spend_cubes()
+    with sqlite3.connect(ledger.path) as other:
+        other.execute("DELETE FROM expenses")
+    assert ledger.spend_cubes()[0] is not None
+    assert builds["spend"] == 2
+    assert ledger.list_expenses() == []
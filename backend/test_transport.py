@@ -0,0 +1,43 @@
+"""Frames of the agent websocket (see transport.py)."""
+import json
+
+import msgpack
+import pytest
+
+from messages import ToolOutputMessage
+from serializer import encode, encode_python
+from transport import JsonCodec, MsgpackCodec
+
+MESSAGES = {
+    "quotes": ToolOutputMessage(output='"\\\\"' * 40000),
+    "control": ToolOutputMessage(output="\x01\n" * 30000),
+    "unicode": ToolOutputMessage(output="Zürich – 東京 🧾 " * 10000),
+    "small": ToolOutputMessage(output="ok"),
+}
+
+@pytest.mark.parametrize("max_frame_size", [1024, 64 * 1024])
+@pytest.mark.parametrize("name", MESSAGES)
+def test_json_frames(name, max_frame_size):
+    message = MESSAGES[name]
+    frames = JsonCodec(max_frame_size=max_frame_size).frames(message)
+    assert all(len(frame.encode()) <= max_frame_size for frame in frames)
+    if len(frames) > 1:
+        chunks = [json.loads(frame) for frame in frames]
+        assert [chunk["index"] for chunk in chunks] == list(range(len(frames)))
+        assert "".join(chunk["data"] for chunk in chunks).encode() == encode(message)
+    else:
+        assert frames[0].encode() == encode(message)
+
+@pytest.mark.parametrize("max_frame_size", [1024, 64 * 1024])
+@pytest.mark.parametrize("name", MESSAGES)
+def test_msgpack_frames(name, max_frame_size):
+    message = MESSAGES[name]
+    frames = MsgpackCodec(max_frame_size=max_frame_size).frames(message)
+    assert all(len(frame) <= max_frame_size for frame in frames)
+    if len(frames) > 1:
+        data = b"".join(msgpack.unpackb(frame)["data"] for frame in frames)
+        assert msgpack.unpackb(data) == encode_python(message)
+
+def test_frame_size_too_small():
+    with pytest.raises(ValueError):
+        JsonCodec(max_frame_size=100)
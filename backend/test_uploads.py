@@ -0,0 +1,58 @@
+"""Receiving multipart uploads (see uploads.receive)."""
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from uploads import UploadTooLarge, extract_document, receive, shutdown
+
+BOUNDARY = "accta-test-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+END = f"--{BOUNDARY}--\r\n".encode()
+
+def part(name: str, data: bytes) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="files"; filename="{name}"\r\n'
+        "Content-Type: text/plain\r\n\r\n"
+    ).encode() + data + b"\r\n"
+
+async def chunks(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+def upload(directory, *chunks_: bytes, max_bytes: int = 1024):
+    return asyncio.run(receive(chunks(*chunks_), CONTENT_TYPE, str(directory), max_bytes))
+
+def test_receive(tmp_path):
+    body = part("a.txt", b"first") + part("b.txt", b"second") + part("c.txt", b"first") + END
+    stored = upload(tmp_path, body[:10], body[10:])
+    assert [(f.name, f.size, f.duplicate) for f in stored] == [("a.txt", 5, False), ("b.txt", 6, False), ("c.txt", 5, True)]
+    assert stored[0].sha256 == hashlib.sha256(b"first").hexdigest()
+    assert sorted(os.listdir(tmp_path)) == sorted({f.sha256 for f in stored})
+
+def test_too_large_after_a_stored_file(tmp_path):
+    # the file is complete (and stored) when the trailing data exceeds the limit
+    with pytest.raises(UploadTooLarge):
+        upload(tmp_path, part("a.txt", b"first") + END, b"x" * 2048, max_bytes=1024)
+    assert os.listdir(tmp_path) == [hashlib.sha256(b"first").hexdigest()]
+
+def test_too_large_in_a_file(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        upload(tmp_path, part("a.txt", b"x" * 512)[:-2], b"x" * 1024, max_bytes=1024)
+    assert os.listdir(tmp_path) == []
+
+def test_shared_extraction_reports_its_start(tmp_path):
+    # a concurrent upload of the same file shares the extraction, and its start
+    (stored,) = upload(tmp_path, part("a.txt", b"hotel receipt") + END)
+    started = []
+
+    async def run():
+        try:
+            return await asyncio.gather(*(extract_document(stored, lambda i=i: started.append(i)) for i in range(2)))
+        finally:
+            shutdown()
+    (first, second) = asyncio.run(run())
+    assert sorted(started) == [0, 1]
+    assert first == second and str(first.content) == "hotel receipt"
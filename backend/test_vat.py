@@ -0,0 +1,52 @@
+"""Offline VAT number validation (see vat.py)."""
+import pytest
+
+import vat
+
+# published valid numbers, one or more per country with a check digit
+VALID = [
+    "ATU13585627", "BE 428759497", "BG 175074752", "CHE-107.787.577", "CHE-100.155.212",
+    "CZ 25123891", "CZ 7103192745", "CZ 640903926", "DE136695976", "DK 13585628",
+    "EE 100594102", "FI 20774740", "FR 23334175221", "GB 980 7806 84", "EL 094259216",
+    "HR 33392005961", "HU-12892312", "IE 6433435F", "IE 6433435OA", "IE 8D79739I",
+    "IT 00743110157", "LT 119511515", "LT 100001919017", "LT 100004801610", "LU 150 274 42",
+    "LV 4000 3521 600", "MT 1167-9112", "NL004495445B01", "NO 995 525 828", "PL 8567346215",
+    "PT 501 964 843", "RO 185 472 90", "SE 123456789701", "SI 5022 3054", "SK 202 274 96 19",
+]
+
+# the same numbers with another last digit (of their body)
+WRONG_CHECK_DIGIT = [
+    "ATU13585620", "BE428759490", "BG175074750", "CHE107787570", "CHE100155210",
+    "CZ25123890", "CZ7103192740", "DE136695970", "DK13585620", "EE100594100",
+    "FI20774741", "FR23334175220", "GB980780680", "EL094259210", "HR33392005960",
+    "HU12892310", "IE6433430F", "IE6433430OA", "IE8D79730I", "IT00743110150",
+    "LT119511510", "LT100001919010", "LU15027440", "LV40003521601", "MT11679110",
+    "NO995525820", "PL8567346210", "PT501964840", "RO18547291", "SE123456789001",
+    "SI50223050", "SK2022749610",
+]
+
+@pytest.mark.parametrize("number", VALID)
+def test_valid(number):
+    result = vat.validate(number)
+    assert (result.valid, result.reason) == (True, "")
+
+@pytest.mark.parametrize("number", WRONG_CHECK_DIGIT)
+def test_wrong_check_digit(number):
+    result = vat.validate(number)
+    assert (result.valid, result.reason) == (False, "Wrong check digit")
+
+@pytest.mark.parametrize("number, country, normalized", [
+    ("136695976", "DE", "DE136695976"),       # without the prefix
+    ("428759497", "Belgium", "BE0428759497"),  # and without the leading zero
+    ("094259216", "GR", "EL094259216"),        # Greece has the prefix EL
+    ("4495445B01", "NL", "NL004495445B01"),
+])
+def test_normalized(number, country, normalized):
+    assert vat.validate(number, country).number == normalized
+
+def test_invalid():
+    assert vat.validate("DE12345", "DE").reason.startswith("Does not have the format of DE")
+    assert vat.validate("NL004495445B00").valid is False
+    assert vat.validate("12345", "US").valid is None  # no known format
+    with pytest.raises(ValueError, match="Wrong check digit"):
+        vat.check("DE136695970")
@@ -0,0 +1,198 @@
+"""
+Per-tool tracing.
+
+When enabled, every tool call records a span: timestamps, argument and
+result sizes, the exception (if any) and the State methods it called.
+Spans are kept in an in-memory ring buffer and, optionally, appended to a
+rotating JSONL file. Tracing can be switched on and off at runtime
+(see /api/tracing) or at startup with ACCTA_TRACE=1; the trace file is
+only set at startup, with ACCTA_TRACE_FILE.
+
+Rank the tools of a trace file by cost with:
+
+    python tracing.py report trace.jsonl
+"""
+import argparse
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+# The span of the tool call running in the current context
+current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    def __init__(self, tool: str, session_id: Optional[str], arguments: Dict):
+        self.tool = tool
+        self.session_id = session_id
+        self.start = time.time()
+        self.duration = 0.0
+        self.arg_bytes = len(json.dumps(arguments, default=str))
+        self.result_rows: Optional[int] = None
+        self.result_bytes = 0
+        self.error: Optional[str] = None
+        self.state_calls: Dict[str, int] = collections.Counter()
+
+    def set_result(self, result: Any):
+        if isinstance(result, (list, tuple, dict, set)):
+            self.result_rows = len(result)
+        self.result_bytes = len(str(result)) if result is not None else 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "tool": self.tool,
+            "session_id": self.session_id,
+            "start": self.start,
+            "end": self.start + self.duration,
+            "duration": self.duration,
+            "arg_bytes": self.arg_bytes,
+            "result_rows": self.result_rows,
+            "result_bytes": self.result_bytes,
+            "error": self.error,
+            "state_calls": dict(self.state_calls),
+        }
+
+class Tracer:
+    def __init__(
+        self,
+        enabled: bool = False,
+        path: Optional[str] = None,
+        buffer_size: int = 10000,
+        max_file_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.enabled = enabled
+        self.path = path
+        self.max_file_bytes = max_file_bytes
+        self.buffer: Deque[Dict] = collections.deque(maxlen=buffer_size)
+        self.lock = threading.Lock()
+
+    def configure(self, enabled: bool):
+        """Switches tracing on or off, the trace file (if any) stays as configured."""
+        with self.lock:
+            self.enabled = enabled
+
+    @contextlib.contextmanager
+    def span(self, tool: str, session_id: Optional[str], arguments: Dict):
+        """Traces the enclosed tool call (yields None when tracing is off)."""
+        if not self.enabled:
+            yield None
+            return
+
+        span = Span(tool, session_id, arguments)
+        token = current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            current_span.reset(token)
+            self.record(span.to_dict())
+
+    def record(self, entry: Dict):
+        with self.lock:
+            self.buffer.append(entry)
+            if self.path:
+                self._write(entry)
+
+    def _write(self, entry: Dict):
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_file_bytes:
+            os.replace(self.path, self.path + ".1")
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def spans(self) -> List[Dict]:
+        with self.lock:
+            return list(self.buffer)
+
+TRACER = Tracer(
+    enabled=os.environ.get("ACCTA_TRACE", "") not in ("", "0"),
+    path=os.environ.get("ACCTA_TRACE_FILE"),
+)
+
+class TracedState:
+    """
+    Wraps a State and counts the methods called on it
+    by the tool call being traced.
+    Only used while tracing is on (see Transaction.transient):
+    every attribute goes through __getattr__.
+    """
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.inner, name)
+        if current_span.get() is None or name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            span = current_span.get()
+            if span is not None:
+                span.state_calls[name] += 1
+            return attr(*args, **kwargs)
+        return call
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+def report(spans: Iterable[Dict]) -> List[Dict]:
+    """Aggregates spans per tool, most expensive (in total) first."""
+    per_tool = collections.defaultdict(list)
+    for span in spans:
+        per_tool[span["tool"]].append(span)
+
+    rows = []
+    for (tool, entries) in per_tool.items():
+        durations = [span["duration"] for span in entries]
+        state_calls = collections.Counter()
+        for span in entries:
+            state_calls.update(span["state_calls"])
+        rows.append({
+            "tool": tool,
+            "calls": len(entries),
+            "errors": sum(1 for span in entries if span["error"]),
+            "total": sum(durations),
+            "p50": percentile(durations, 0.5),
+            "p99": percentile(durations, 0.99),
+            "result_bytes": sum(span["result_bytes"] for span in entries),
+            "state_calls": dict(state_calls.most_common(3)),
+        })
+    rows.sort(key=lambda row: row["total"], reverse=True)
+    return rows
+
+def load(path: str) -> List[Dict]:
+    spans = []
+    for name in (path + ".1", path):
+        if os.path.exists(name):
+            with open(name) as f:
+                spans.extend(json.loads(line) for line in f if line.strip())
+    return spans
+
+def main():
+    parser = argparse.ArgumentParser(description="ACCTA tool traces")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("path", help="JSONL trace file")
+    parser.add_argument("--sort", choices=["total", "p99"], default="total", help="Ranking")
+    args = parser.parse_args()
+
+    rows = report(load(args.path))
+    rows.sort(key=lambda row: row[args.sort], reverse=True)
+
+    print(f"{'tool':<50} {'calls':>6} {'errors':>6} {'total ms':>10} {'p50 ms':>8} {'p99 ms':>8} {'out KiB':>8}  state calls")
+    for row in rows:
+        print(
+            f"{row['tool']:<50} {row['calls']:>6} {row['errors']:>6} {row['total'] * 1e3:>10.1f}"
+            f" {row['p50'] * 1e3:>8.2f} {row['p99'] * 1e3:>8.2f} {row['result_bytes'] / 1024:>8.1f}"
+            f"  {', '.join(f'{k}={v}' for (k, v) in row['state_calls'].items())}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Wire encodings for the agent websocket.
+
+The client announces which encodings it understands through the websocket
+subprotocol list, e.g. `new WebSocket(url, ["accta.msgpack", "accta.json"])`.
+The server picks the first one it supports, falling back to plain JSON text
+frames for clients which do not offer any subprotocol.
+
+Messages which encode to more than `max_frame_size` bytes are split into
+a sequence of `ChunkMessage` frames, each carrying a piece of the encoded
+message, which the client reassembles. The pieces are sized so that
+every frame, chunk envelope included, is at most `max_frame_size` bytes.
+"""
+import os
+import uuid
+
+from dataclasses import asdict
+from typing import List, Optional, Union
+
+from fastapi import WebSocket
+from pydantic_core import to_json
+
+from messages import BaseMessage, ChunkMessage
+from serializer import encode, encode_python
+
+try:
+    import msgpack
+except ImportError:  # optional: clients fall back to JSON
+    msgpack = None
+
+SUBPROTOCOL_JSON = "accta.json"
+SUBPROTOCOL_MSGPACK = "accta.msgpack"
+
+MAX_FRAME_SIZE = int(os.environ.get("ACCTA_MAX_FRAME_SIZE", 64 * 1024))
+# leaves room for the data of a chunk next to its envelope
+MIN_FRAME_SIZE = 1024
+
+Frame = Union[str, bytes]
+
+def frame_size(frame: Frame) -> int:
+    """The size of a frame on the wire: text frames are sent UTF-8 encoded."""
+    return len(frame.encode()) if isinstance(frame, str) else len(frame)
+
+def check_frame_size(max_frame_size: int) -> int:
+    if max_frame_size < MIN_FRAME_SIZE:
+        raise ValueError(f"The maximum frame size must be at least {MIN_FRAME_SIZE} bytes")
+    return max_frame_size
+
+def json_split(text: str, size: int) -> List[str]:
+    """
+    Splits text into pieces which are at most `size` bytes once encoded
+    as (the contents of) a JSON string, where quotes, backslashes and
+    control characters are escaped.
+    """
+    pieces = []
+    start = 0
+    while start < len(text):
+        end = start + size
+        piece = text[start:end]
+        encoded = len(to_json(piece)) - 2
+        while encoded > size:
+            # shrink in proportion to the excess (an escaped character is at most 6 bytes)
+            end = start + max(1, len(piece) * size // encoded)
+            piece = text[start:end]
+            encoded = len(to_json(piece)) - 2
+        pieces.append(piece)
+        start = end
+    return pieces
+
+class JsonCodec:
+    """JSON text frames (the default)"""
+    subprotocol: Optional[str] = None
+    binary = False
+
+    def __init__(self, subprotocol: Optional[str] = None, max_frame_size: int = MAX_FRAME_SIZE):
+        self.subprotocol = subprotocol
+        self.max_frame_size = check_frame_size(max_frame_size)
+
+    def frames(self, message: BaseMessage) -> List[Frame]:
+        data = encode(message)
+        if len(data) <= self.max_frame_size:
+            return [data.decode()]
+
+        # the pieces of the JSON text are escaped again in their chunk
+        text = data.decode()
+        chunk_id = uuid.uuid4().hex
+        envelope = len(encode(ChunkMessage(chunk_id=chunk_id, index=len(text), count=len(text), data="")))
+        pieces = json_split(text, self.max_frame_size - envelope)
+        return [
+            encode(ChunkMessage(chunk_id=chunk_id, index=i, count=len(pieces), data=piece)).decode()
+            for (i, piece) in enumerate(pieces)
+        ]
+
+class MsgpackCodec:
+    """MessagePack binary frames"""
+    subprotocol = SUBPROTOCOL_MSGPACK
+    binary = True
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        self.max_frame_size = check_frame_size(max_frame_size)
+
+    def frames(self, message: BaseMessage) -> List[Frame]:
+        data = msgpack.packb(encode_python(message))
+        if len(data) <= self.max_frame_size:
+            return [data]
+
+        chunk_id = uuid.uuid4().hex
+        # the envelope of the largest chunk, whose data has the longest length prefix
+        largest = ChunkMessage(chunk_id=chunk_id, index=len(data), count=len(data), data=bytes(self.max_frame_size))
+        size = self.max_frame_size - (len(msgpack.packb(asdict(largest))) - self.max_frame_size)
+        count = (len(data) + size - 1) // size
+        return [
+            # chunks carry raw bytes, which the JSON mode serializer would mangle
+            msgpack.packb(asdict(
+                ChunkMessage(chunk_id=chunk_id, index=i, count=count, data=data[i * size:(i + 1) * size])
+            ))
+            for i in range(count)
+        ]
+
+Codec = Union[JsonCodec, MsgpackCodec]
+
+def negotiate(websocket: WebSocket) -> Codec:
+    """Picks the wire encoding from the subprotocols offered by the client."""
+    for subprotocol in websocket.scope.get("subprotocols", []):
+        if subprotocol == SUBPROTOCOL_MSGPACK and msgpack is not None:
+            return MsgpackCodec()
+        if subprotocol == SUBPROTOCOL_JSON:
+            return JsonCodec(SUBPROTOCOL_JSON)
+    return JsonCodec()
@@ -0,0 +1,285 @@
+"""
+Document uploads.
+
+Files arrive as a multipart/form-data stream which is parsed as it is
+received, on a thread so that disk writes do not stall the event loop:
+every part is written to a temporary file chunk by chunk while its
+SHA-256 is computed, then moved to `<hash>` in the upload directory
+(or dropped when a file with that content is already there).
+Documents are identified by their hash, so uploading a file twice does
+not store or extract it twice.
+
+Extraction (see extract.py) runs on a bounded process pool; its result
+is kept next to the file as `<hash>.json` (and redone when it is of an
+earlier version of extract.py).
+
+Configured through:
+
+- ACCTA_UPLOAD_DIR:       where files are stored (default: accta-uploads in the temp directory)
+- ACCTA_UPLOAD_MAX_BYTES: largest accepted request (default 50 MB)
+- ACCTA_EXTRACT_WORKERS:  extraction processes (default 2)
+- ACCTA_EXTRACT_QUEUE:    extraction jobs submitted to the pool at once (default 8)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from extract import VERSION, extract
+from metrics import EXTRACT_DURATION, UPLOAD_BYTES, UPLOAD_DUPLICATES
+from state import Document
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.environ.get("ACCTA_UPLOAD_DIR") or os.path.join(tempfile.gettempdir(), "accta-uploads")
+MAX_UPLOAD_BYTES = int(os.environ.get("ACCTA_UPLOAD_MAX_BYTES", 50 * 1024 * 1024))
+EXTRACT_WORKERS = int(os.environ.get("ACCTA_EXTRACT_WORKERS", 2))
+EXTRACT_QUEUE = int(os.environ.get("ACCTA_EXTRACT_QUEUE", 8))
+
+# Namespace of the document ids derived from content hashes
+DOCUMENT_NAMESPACE = uuid.UUID("4f0c2a55-8d3e-4b8e-9a57-6c1d0e9b7a21")
+
+class UploadTooLarge(ValueError):
+    pass
+
+@dataclass
+class StoredFile:
+    sha256: str
+    path: str
+    name: str
+    content_type: str
+    size: int
+    duplicate: bool  # the content was already stored
+
+    @property
+    def document_id(self) -> uuid.UUID:
+        return uuid.uuid5(DOCUMENT_NAMESPACE, self.sha256)
+
+class _Part:
+    """The file part being received: its headers, temporary file and running hash."""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.headers: Dict[bytes, bytes] = {}
+        self.field = b""
+        self.value = b""
+        self.name: Optional[str] = None
+        self.content_type = ""
+        self.file = None
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def open(self):
+        (_, options) = parse_options_header(self.headers.get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        if filename is None:
+            return  # a form field, not a file
+        self.name = os.path.basename(filename.decode("utf-8", "replace")) or "upload"
+        self.content_type = self.headers.get(b"content-type", b"").decode("latin-1")
+        self.file = tempfile.NamedTemporaryFile(dir=self.directory, prefix=".upload-", delete=False)
+
+    def write(self, data: bytes):
+        if self.file is not None:
+            self.file.write(data)
+            self.hash.update(data)
+            self.size += len(data)
+
+    def close(self) -> Optional[StoredFile]:
+        if self.file is None:
+            return None
+        self.file.close()
+        sha256 = self.hash.hexdigest()
+        path = os.path.join(self.directory, sha256)
+        duplicate = os.path.exists(path)
+        if duplicate:
+            os.unlink(self.file.name)
+            UPLOAD_DUPLICATES.inc()
+        else:
+            os.replace(self.file.name, path)
+            UPLOAD_BYTES.inc(self.size)
+        self.file = None  # nothing left to discard
+        return StoredFile(sha256, path, self.name, self.content_type, self.size, duplicate)
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            os.unlink(self.file.name)
+
+async def receive(
+    stream: AsyncIterator[bytes],
+    content_type: str,
+    directory: str = UPLOAD_DIR,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> List[StoredFile]:
+    """Writes the files of a multipart/form-data body to the directory, as it arrives."""
+    (media, options) = parse_options_header(content_type)
+    boundary = options.get(b"boundary")
+    if media != b"multipart/form-data" or not boundary:
+        raise ValueError("Expected a multipart/form-data body")
+    os.makedirs(directory, exist_ok=True)
+
+    stored: List[StoredFile] = []
+    part = _Part(directory)
+
+    def on_part_begin():
+        nonlocal part
+        part = _Part(directory)
+
+    def on_header_field(data: bytes, start: int, end: int):
+        part.field += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        part.value += data[start:end]
+
+    def on_header_end():
+        part.headers[part.field.lower()] = part.value
+        part.field = part.value = b""
+
+    def on_part_data(data: bytes, start: int, end: int):
+        part.write(data[start:end])
+
+    def on_part_end():
+        result = part.close()
+        if result is not None:
+            stored.append(result)
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": lambda: part.open(),
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    # the parser, and the file writes of its callbacks, run on a thread one call at a time
+    loop = asyncio.get_running_loop()
+    pending: Optional[asyncio.Future] = None
+
+    def run(fn: Callable, *args: Any) -> Awaitable:
+        nonlocal pending
+        pending = loop.run_in_executor(None, fn, *args)
+        # shielded: a cancelled upload lets the call finish before discarding its part
+        return asyncio.shield(pending)
+
+    def discard_when_done(call: asyncio.Future):
+        if not call.cancelled():
+            call.exception()  # the upload failed anyway
+        loop.run_in_executor(None, part.discard)
+
+    received = 0
+    try:
+        async for chunk in stream:
+            received += len(chunk)
+            if received > max_bytes:
+                raise UploadTooLarge(f"The upload exceeds {max_bytes} bytes")
+            await run(parser.write, chunk)
+        await run(parser.finalize)
+    except BaseException:
+        if pending is not None and not pending.done():
+            pending.add_done_callback(discard_when_done)
+        else:
+            await asyncio.to_thread(part.discard)
+        raise
+    return stored
+
+class _Extraction:
+    """An extraction in progress, shared by the concurrent uploads of a file."""
+    def __init__(self):
+        self.future: Optional[asyncio.Future] = None
+        self.started = False
+        self.on_start: List[Callable[[], None]] = []
+
+    def add_on_start(self, on_start: Optional[Callable[[], None]]):
+        if on_start is None:
+            return
+        if self.started:
+            on_start()
+        else:
+            self.on_start.append(on_start)
+
+    def start(self):
+        self.started = True
+        for on_start in self.on_start:
+            on_start()
+
+_extract_pool: Optional[ProcessPoolExecutor] = None
+_extract_slots: Optional[asyncio.Semaphore] = None
+# extractions in progress, by hash
+_extracting: Dict[str, _Extraction] = {}
+
+def extract_pool() -> ProcessPoolExecutor:
+    global _extract_pool
+    if _extract_pool is None:
+        _extract_pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    return _extract_pool
+
+def shutdown():
+    global _extract_pool
+    if _extract_pool is not None:
+        _extract_pool.shutdown(cancel_futures=True)
+        _extract_pool = None
+
+def _slots() -> asyncio.Semaphore:
+    global _extract_slots
+    if _extract_slots is None:
+        _extract_slots = asyncio.Semaphore(EXTRACT_QUEUE)
+    return _extract_slots
+
+async def _extract(stored: StoredFile, on_start: Callable[[], None]) -> Dict[str, Any]:
+    result_path = stored.path + ".json"
+    if os.path.exists(result_path):
+        result = json.loads(Path(result_path).read_text())
+        if result.get("version") == VERSION:
+            return result
+
+    started = time.perf_counter()
+    async with _slots():
+        on_start()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                extract_pool(), extract, stored.path, stored.name, stored.content_type
+            )
+        except Exception:
+            EXTRACT_DURATION.observe(time.perf_counter() - started, outcome="error")
+            raise
+    EXTRACT_DURATION.observe(time.perf_counter() - started, outcome="complete")
+    Path(result_path).write_text(json.dumps(result))
+    return result
+
+def extracting() -> int:
+    """Extractions queued or running."""
+    return len(_extracting)
+
+async def extract_document(stored: StoredFile, on_start: Optional[Callable[[], None]] = None) -> Document:
+    """
+    The document of a stored file, extracting it unless that was done before.
+    `on_start` is called when the extraction leaves the queue for the pool,
+    also when it is shared with a concurrent upload of the same file.
+    """
+    extraction = _extracting.get(stored.sha256)
+    if extraction is None:
+        extraction = _extracting[stored.sha256] = _Extraction()
+        extraction.future = asyncio.ensure_future(_extract(stored, extraction.start))
+        extraction.future.add_done_callback(lambda _: _extracting.pop(stored.sha256, None))
+    extraction.add_on_start(on_start)
+    result = await asyncio.shield(extraction.future)
+    return Document(
+        id=stored.document_id,
+        name=stored.name,
+        description=result["description"],
+        content=result["content"],
+        date=result["date"],
+        location=result["location"],
+    )
@@ -0,0 +1,255 @@
+"""
+Offline validation of VAT numbers.
+
+A number is checked against the format of its country (see refdata.VAT_FORMATS)
+and, where the country has one, its check digit. The country is taken from
+the prefix of the number ("DK12345678", "EL123456789", "CHE-123.456.789")
+or given separately. Results are cached by normalized number, so
+re-validating a whole client and supplier base mostly hits the cache.
+"""
+import functools
+import re
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+import refdata
+
+@dataclass(frozen=True)
+class VatResult:
+    number: str  # normalized, with the prefix of the country
+    country: Optional[str]  # alpha2 code
+    valid: Optional[bool]  # None when the country has no known format
+    reason: str = ""
+
+def _digits(number: str) -> List[int]:
+    return [int(char) for char in number]
+
+def _weighted(number: str, weights) -> int:
+    return sum(weight * int(char) for (weight, char) in zip(weights, number))
+
+def _luhn(number: str) -> int:
+    digits = _digits(number)[::-1]
+    return (sum(digits[::2]) + sum(sum(divmod(2 * d, 10)) for d in digits[1::2])) % 10
+
+def _mod_11_10(number: str) -> bool:
+    """ISO 7064 Mod 11, 10 (Germany, Croatia)."""
+    product = 10
+    for d in _digits(number[:-1]):
+        total = (d + product) % 10 or 10
+        product = (2 * total) % 11
+    return (11 - product) % 10 == int(number[-1])
+
+def _at(number: str) -> bool:
+    return (6 - _luhn(number[1:8])) % 10 == int(number[8])
+
+def _be(number: str) -> bool:
+    return 97 - int(number[:8]) % 97 == int(number[8:])
+
+def _bg(number: str) -> bool:
+    if len(number) != 9:
+        return True  # ten digits are personal numbers, with other checks
+    check = _weighted(number, range(1, 9)) % 11
+    if check == 10:
+        check = _weighted(number, range(3, 11)) % 11
+    return check % 10 == int(number[8])
+
+def _ch(number: str) -> bool:
+    check = 11 - _weighted(number, (5, 4, 3, 2, 7, 6, 5, 4)) % 11
+    return check != 10 and check % 11 == int(number[8])
+
+def _cz(number: str) -> bool:
+    if len(number) == 10:  # a personal number
+        return int(number[:9]) % 11 % 10 == int(number[9])
+    if len(number) != 8:
+        return True  # nine digit personal numbers have no check digit
+    check = (11 - _weighted(number, range(8, 1, -1))) % 11
+    return (check or 1) % 10 == int(number[7])
+
+def _ee(number: str) -> bool:
+    return _weighted(number, (3, 7, 1, 3, 7, 1, 3, 7, 1)) % 10 == 0
+
+def _fi(number: str) -> bool:
+    return _weighted(number, (7, 9, 10, 5, 8, 4, 2, 1)) % 11 == 0
+
+def _fr(number: str) -> bool:
+    if not number[:2].isdigit():
+        return True  # keys with letters have no published check
+    return int(number[:2]) == (12 + 3 * (int(number[2:]) % 97)) % 97
+
+def _gb(number: str) -> bool:
+    if not number.isdigit():
+        return True  # government departments and health authorities
+    return _weighted(number, (8, 7, 6, 5, 4, 3, 2, 10, 1)) % 97 in (0, 42, 55)
+
+def _gr(number: str) -> bool:
+    check = 0
+    for d in _digits(number[:8]):
+        check = 2 * check + d
+    return 2 * check % 11 % 10 == int(number[8])
+
+def _hu(number: str) -> bool:
+    return _weighted(number, (9, 7, 3, 1, 9, 7, 3, 1)) % 10 == 0
+
+_IE_LETTERS = "WABCDEFGHIJKLMNOPQRSTUV"
+
+def _ie(number: str) -> bool:
+    if not number[1].isdigit():
+        # old style: a digit, a letter or symbol, five digits and the check letter
+        number = "0" + number[2:7] + number[0] + number[7:]
+    check = _weighted(number[:7], range(8, 1, -1)) + 9 * _IE_LETTERS.index(number[8:] or "W")
+    return _IE_LETTERS[check % 23] == number[7]
+
+def _it(number: str) -> bool:
+    return int(number[:7]) != 0 and _luhn(number) == 0
+
+def _lt(number: str) -> bool:
+    body = number[:-1]
+    check = sum((1 + i % 9) * d for (i, d) in enumerate(_digits(body))) % 11
+    if check == 10:
+        check = sum((1 + (i + 2) % 9) * d for (i, d) in enumerate(_digits(body))) % 11
+    return check % 10 == int(number[-1])
+
+def _lu(number: str) -> bool:
+    return int(number[:6]) % 89 == int(number[6:])
+
+def _lv(number: str) -> bool:
+    if int(number[0]) <= 3:
+        return True  # personal codes start with the date of birth
+    return _weighted(number, (9, 1, 4, 8, 3, 10, 2, 5, 7, 6, 1)) % 11 == 3
+
+def _mt(number: str) -> bool:
+    return _weighted(number, (3, 4, 6, 7, 8, 9, 10, 1)) % 37 == 0
+
+def _mod_97_10(text: str) -> int:
+    return int("".join(str(int(char, 36)) for char in text)) % 97
+
+def _nl(number: str) -> bool:
+    # legal entities have the check of a BSN, sole proprietors (since 2020) an IBAN-like one
+    if number[10:] == "00":
+        return False  # the suffix counts from B01
+    digits = number[:9]
+    bsn = (_weighted(digits, range(9, 1, -1)) - int(digits[8])) % 11 == 0
+    return bsn or _mod_97_10("NL" + number) == 1
+
+def _no(number: str) -> bool:
+    return _weighted(number, (3, 2, 7, 6, 5, 4, 3, 2, 1)) % 11 == 0
+
+def _pl(number: str) -> bool:
+    return _weighted(number, (6, 5, 7, 2, 3, 4, 5, 6, 7, -1)) % 11 == 0
+
+def _pt(number: str) -> bool:
+    return (11 - _weighted(number, range(9, 1, -1))) % 11 % 10 == int(number[8])
+
+def _ro(number: str) -> bool:
+    body = number[:-1].zfill(9)
+    return 10 * _weighted(body, (7, 5, 3, 2, 1, 7, 5, 3, 2)) % 11 % 10 == int(number[-1])
+
+def _se(number: str) -> bool:
+    return _luhn(number[:10]) == 0
+
+def _si(number: str) -> bool:
+    check = 11 - _weighted(number, range(8, 1, -1)) % 11
+    return check != 11 and check % 10 == int(number[7])
+
+def _sk(number: str) -> bool:
+    return int(number) % 11 == 0
+
+# check digit of the (prefix-less, normalized) number per country
+CHECKSUMS: Dict[str, Callable[[str], bool]] = {
+    "AT": _at, "BE": _be, "BG": _bg, "CH": _ch, "CZ": _cz, "DE": _mod_11_10, "DK": lambda n: _weighted(n, (2, 7, 6, 5, 4, 3, 2, 1)) % 11 == 0,
+    "EE": _ee, "FI": _fi, "FR": _fr, "GB": _gb, "GR": _gr, "HR": _mod_11_10, "HU": _hu, "IE": _ie,
+    "IT": _it, "LT": _lt, "LU": _lu, "LV": _lv, "MT": _mt, "NL": _nl, "NO": _no, "PL": _pl,
+    "PT": _pt, "RO": _ro, "SE": _se, "SI": _si, "SK": _sk,
+}
+
+# the country of a prefix, longest prefixes first ("CHE" before "CH")
+PREFIXES = sorted(
+    ((fmt.prefix, alpha2) for (alpha2, fmt) in refdata.VAT_FORMATS.items()),
+    key=lambda item: -len(item[0]),
+)
+
+# countries whose numbers can be written without their leading zeros
+_WIDTHS = {"BE": 10, "GR": 9}
+
+def _pad(alpha2: str, body: str) -> str:
+    if alpha2 in _WIDTHS and body.isdigit():
+        return body.zfill(_WIDTHS[alpha2])
+    if alpha2 == "NL" and body[-3:-2] == "B":
+        return body[:-3].zfill(9) + body[-3:]
+    return body
+
+_SEPARATORS = re.compile(r"[\s.,\-/]")
+
+def compact(number: str) -> str:
+    return _SEPARATORS.sub("", number).upper()
+
+def split(number: str, country: Optional[str] = None):
+    """
+    (alpha2, number without prefix) of a compacted number.
+
+    The prefix of the country is optional; a number with the prefix of
+    another country (and its format) is taken to be of that country.
+    """
+    data = refdata.reference()
+    alpha2 = None
+    if country is not None:
+        found = data.country(country)
+        alpha2 = found.alpha2 if found else None
+    fmt = refdata.VAT_FORMATS.get(alpha2)
+    if fmt is not None and number.startswith(fmt.prefix):
+        return (alpha2, number[len(fmt.prefix):])
+    for (prefix, other) in PREFIXES:
+        if number.startswith(prefix) and data.vat_patterns[other].fullmatch(_pad(other, number[len(prefix):])):
+            return (other, number[len(prefix):])
+    return (alpha2, number)
+
+@functools.lru_cache(maxsize=65536)
+def _validate(number: str, country: Optional[str]) -> VatResult:
+    (alpha2, body) = split(number, country)
+    if alpha2 is None:
+        return VatResult(number, None, None, "Unknown country")
+    fmt = refdata.VAT_FORMATS.get(alpha2)
+    if fmt is None:
+        return VatResult(number, alpha2, None, f"No known VAT number format for {alpha2}")
+    body = _pad(alpha2, body)
+    normalized = fmt.prefix + body
+    if refdata.reference().vat_patterns[alpha2].fullmatch(body) is None:
+        return VatResult(normalized, alpha2, False, f"Does not have the format of {alpha2} (e.g. {fmt.example})")
+    checksum = CHECKSUMS.get(alpha2)
+    if checksum is not None and not checksum(body):
+        return VatResult(normalized, alpha2, False, "Wrong check digit")
+    return VatResult(normalized, alpha2, True)
+
+def validate(number: str, country: Optional[str] = None) -> VatResult:
+    """
+    Validates a VAT number of the country (alpha2, alpha3, name, ...)
+    or of the country of its prefix.
+    """
+    return _validate(compact(number), country)
+
+def check(number: str, country: Optional[str] = None) -> str:
+    """The normalized number, raises ValueError when it is invalid for a country with a known format."""
+    result = validate(number, country)
+    if result.valid is False:
+        raise ValueError(f"Invalid VAT number {number!r}: {result.reason}")
+    return result.number if result.valid else number
+
+def validate_many(records: Iterable) -> List[Dict]:
+    """Validates the VAT number of records with `vat_number` and `country` (clients, suppliers, the company)."""
+    results = []
+    for record in records:
+        number = getattr(record, "vat_number", "") or ""
+        if not number:
+            result = VatResult("", None, None, "No VAT number")
+        else:
+            result = validate(number, getattr(record, "country", None) or None)
+        results.append({
+            "id": getattr(record, "id", None),
+            "vat_number": number,
+            "normalized": result.number,
+            "country": result.country,
+            "valid": result.valid,
+            "reason": result.reason,
+        })
+    return results
@@ -4,18 +4,40 @@ import { ChatMessage } from './components/ChatMessage';
 import { ChatInput } from './components/ChatInput';
 import { LoadingMessage } from './components/LoadingMessage';
 import { ActionPane, ActionItem } from './components/ActionPane';
-import { ChatMessage as ChatMessageType, AgentMessage } from './types';
+import { ChatMessage as ChatMessageType, AgentMessage, UploadItem } from './types';
 import './App.css';
 
 function App() {
   const [messages, setMessages] = useState<ChatMessageType[]>([]);
   const [isProcessing, setIsProcessing] = useState(false);
   const [actions, setActions] = useState<ActionItem[]>([]);
+  const [sessionId, setSessionId] = useState<string | null>(null);
+  const [uploads, setUploads] = useState<UploadItem[]>([]);
   const messagesEndRef = useRef<HTMLDivElement>(null);
   
   const handleMessage = useCallback((data: AgentMessage) => {
     
     switch (data.type) {
+      case 'session_init':
+        if (data.session_id) {
+          setSessionId(data.session_id);
+        }
+        break;
+
+      case 'document_progress':
+        if (data.upload_id && data.stage) {
+          const update: UploadItem = {
+            id: data.upload_id,
+            name: data.name || '',
+            stage: data.stage,
+            error: data.error
+          };
+          setUploads(prev => prev.some(upload => upload.id === update.id)
+            ? prev.map(upload => upload.id === update.id ? update : upload)
+            : [...prev, update]);
+        }
+        break;
+
       case 'start':
         setIsProcessing(true);
         break;
@@ -114,6 +136,20 @@ function App() {
         setIsProcessing(false);
         break;
 
+      case 'run_cancelled':
+        setIsProcessing(false);
+        setMessages(prev => {
+          const lastMessage = prev[prev.length - 1];
+          if (lastMessage && lastMessage.isStreaming) {
+            return [
+              ...prev.slice(0, -1),
+              { ...lastMessage, isStreaming: false }
+            ];
+          }
+          return prev;
+        });
+        break;
+
       case 'action_created':
         if (data.action_id && data.action_type && data.timestamp) {
           const newAction: ActionItem = {
@@ -137,6 +173,31 @@ function App() {
         setActions([]);
         break;
 
+      case 'actions_state':
+        if (data.actions) {
+          const events = data.actions;
+          setActions(prev => events.reduce<ActionItem[]>((actions, event) => {
+            switch (event.event) {
+              case 'action_created':
+                if (!event.action_id || !event.action_type || !event.timestamp) return actions;
+                return [...actions, {
+                  id: event.action_id,
+                  name: event.action_type,
+                  args: JSON.stringify(event.action_args || {}),
+                  timestamp: new Date(event.timestamp),
+                  status: 'active'
+                }];
+              case 'action_removed':
+                return actions.filter(action => action.id !== event.action_id);
+              case 'action_clear':
+                return [];
+              default:
+                return actions;
+            }
+          }, prev));
+        }
+        break;
+
       case 'error':
         setIsProcessing(false);
         setMessages(prev => [
@@ -152,7 +213,7 @@ function App() {
     }
   }, []);
 
-  const { isConnected, connect, sendMessage } = useWebSocket(handleMessage);
+  const { isConnected, connect, sendMessage, sendCommand } = useWebSocket(handleMessage);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -181,6 +242,37 @@ function App() {
     sendMessage(message);
   };
 
+  const handleCancel = () => {
+    sendCommand('cancel_run');
+  };
+
+  const handleUpload = async (files: FileList) => {
+    if (!sessionId) return;
+
+    // the request body is streamed by the browser: progress arrives over the websocket
+    const pendingId = `pending-${Date.now()}`;
+    const names = Array.from(files).map(file => file.name).join(', ');
+    setUploads(prev => [...prev, { id: pendingId, name: names, stage: 'uploading' }]);
+
+    const form = new FormData();
+    Array.from(files).forEach(file => form.append('file', file, file.name));
+    try {
+      const response = await fetch(`/api/documents?session_id=${encodeURIComponent(sessionId)}`, {
+        method: 'POST',
+        body: form
+      });
+      if (!response.ok) {
+        const body = await response.json().catch(() => ({}));
+        throw new Error(body.detail || response.statusText);
+      }
+      setUploads(prev => prev.filter(upload => upload.id !== pendingId));
+    } catch (e) {
+      setUploads(prev => prev.map(upload => upload.id === pendingId
+        ? { ...upload, stage: 'failed', error: e instanceof Error ? e.message : String(e) }
+        : upload));
+    }
+  };
+
 
   return (
     <div className="App">
@@ -201,8 +293,21 @@ function App() {
             <div ref={messagesEndRef} />
           </div>
 
+          {uploads.length > 0 && (
+            <div className="uploads">
+              {uploads.map(upload => (
+                <div key={upload.id} className={`upload upload-${upload.stage}`}>
+                  <span className="upload-name">{upload.name}</span>
+                  <span className="upload-stage">{upload.error ? `${upload.stage}: ${upload.error}` : upload.stage}</span>
+                </div>
+              ))}
+            </div>
+          )}
+
           <ChatInput
             onSendMessage={handleSendMessage}
+            onCancel={isProcessing ? handleCancel : undefined}
+            onUpload={sessionId && isConnected ? handleUpload : undefined}
             disabled={!isConnected || isProcessing}
           />
         </main>
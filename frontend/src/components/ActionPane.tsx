@@ -19,6 +19,8 @@ export const ActionPane: React.FC<ActionPaneProps> = ({ actions }) => {
       'new_supplier': 'Create Supplier',
       'update_supplier': 'Update Supplier',
       'create_invoice': 'Create Invoice',
+      'settle_invoice': 'Settle Invoice',
+      'add_document': 'Add Document',
       'reconcile_transactions': 'Reconcile'
     };
 
@@ -44,6 +46,7 @@ export const ActionPane: React.FC<ActionPaneProps> = ({ actions }) => {
       'description': 'Description',
       'due_date': 'Due Date',
       'bank_txs': 'Bank Transactions',
+      'bank_tx': 'Bank Transaction',
       'receipts': 'Receipts'
     };
     return labelMap[key] || key.charAt(0).toUpperCase() + key.slice(1).replace(/_/g, ' ');
@@ -58,7 +61,7 @@ export const ActionPane: React.FC<ActionPaneProps> = ({ actions }) => {
     }
 
     // Handle ID fields specially
-    if (key.endsWith('_id') || key === 'client' || key === 'supplier') {
+    if (key.endsWith('_id') || key === 'client' || key === 'supplier' || key === 'bank_tx') {
       return <span className="arg-id">{String(value).substring(0, 8)}...</span>;
     }
 
@@ -1,12 +1,15 @@
-import React, { useState, KeyboardEvent } from 'react';
+import React, { useState, useRef, KeyboardEvent, ChangeEvent } from 'react';
 
 interface ChatInputProps {
   onSendMessage: (message: string) => void;
+  onCancel?: () => void;
+  onUpload?: (files: FileList) => void;
   disabled?: boolean;
 }
 
-export const ChatInput: React.FC<ChatInputProps> = ({ onSendMessage, disabled }) => {
+export const ChatInput: React.FC<ChatInputProps> = ({ onSendMessage, onCancel, onUpload, disabled }) => {
   const [message, setMessage] = useState('');
+  const fileInputRef = useRef<HTMLInputElement>(null);
 
   const handleSend = () => {
     if (message.trim() && !disabled) {
@@ -22,8 +25,33 @@ export const ChatInput: React.FC<ChatInputProps> = ({ onSendMessage, disabled })
     }
   };
 
+  const handleFiles = (e: ChangeEvent<HTMLInputElement>) => {
+    if (e.target.files && e.target.files.length > 0 && onUpload) {
+      onUpload(e.target.files);
+    }
+    e.target.value = '';
+  };
+
   return (
     <div className="chat-input">
+      {onUpload && (
+        <>
+          <input
+            ref={fileInputRef}
+            type="file"
+            multiple
+            onChange={handleFiles}
+            style={{ display: 'none' }}
+          />
+          <button
+            className="attach-button"
+            onClick={() => fileInputRef.current?.click()}
+            title="Upload documents"
+          >
+            Attach
+          </button>
+        </>
+      )}
       <textarea
         value={message}
         onChange={(e) => setMessage(e.target.value)}
@@ -32,9 +60,15 @@ export const ChatInput: React.FC<ChatInputProps> = ({ onSendMessage, disabled })
         disabled={disabled}
         rows={3}
       />
-      <button onClick={handleSend} disabled={disabled || !message.trim()}>
-        Send
-      </button>
+      {onCancel ? (
+        <button onClick={onCancel}>
+          Stop
+        </button>
+      ) : (
+        <button onClick={handleSend} disabled={disabled || !message.trim()}>
+          Send
+        </button>
+      )}
     </div>
   );
 };
\ No newline at end of file
@@ -1,5 +1,32 @@
 import { useState, useRef, useCallback, useEffect } from "react";
-import { AgentMessage } from "../types";
+import { decode } from "@msgpack/msgpack";
+import { AgentMessage, ChunkMessage } from "../types";
+
+// Wire encodings offered to the server, in order of preference
+const SUBPROTOCOLS = ["accta.msgpack", "accta.json"];
+
+// Decode a single websocket frame (binary frames are MessagePack)
+const decodeFrame = (data: string | ArrayBuffer): AgentMessage | ChunkMessage => {
+  if (typeof data === "string") {
+    return JSON.parse(data);
+  }
+  return decode(new Uint8Array(data)) as AgentMessage | ChunkMessage;
+};
+
+// Reassemble the payload of a chunked message and decode it
+const joinChunks = (parts: (string | Uint8Array)[]): AgentMessage => {
+  if (typeof parts[0] === "string") {
+    return JSON.parse(parts.join(""));
+  }
+  const chunks = parts as Uint8Array[];
+  const buffer = new Uint8Array(chunks.reduce((len, part) => len + part.length, 0));
+  let offset = 0;
+  for (const part of chunks) {
+    buffer.set(part, offset);
+    offset += part.length;
+  }
+  return decode(buffer) as AgentMessage;
+};
 
 export const useWebSocket = (onMessage?: (message: AgentMessage) => void) => {
   const [isConnected, setIsConnected] = useState(false);
@@ -11,6 +38,7 @@ export const useWebSocket = (onMessage?: (message: AgentMessage) => void) => {
   const reconnectTimeoutRef = useRef<NodeJS.Timeout | null>(null);
   const shouldReconnectRef = useRef(true);
   const reconnectAttemptsRef = useRef(0);
+  const chunksRef = useRef<Map<string, (string | Uint8Array)[]>>(new Map());
 
   // Update the message handler ref when the callback changes
   useEffect(() => {
@@ -54,7 +82,9 @@ export const useWebSocket = (onMessage?: (message: AgentMessage) => void) => {
 
     const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
     const host = window.location.host;
-    const ws = new WebSocket(`${protocol}//${host}/ws/agent`);
+    const ws = new WebSocket(`${protocol}//${host}/ws/agent`, SUBPROTOCOLS);
+    ws.binaryType = "arraybuffer";
+    chunksRef.current.clear();
 
     ws.onopen = () => {
       setIsConnected(true);
@@ -79,7 +109,22 @@ export const useWebSocket = (onMessage?: (message: AgentMessage) => void) => {
 
     ws.onmessage = (event) => {
       try {
-        const data: AgentMessage = JSON.parse(event.data);
+        const frame = decodeFrame(event.data);
+        let data: AgentMessage;
+        if (frame.type === "chunk") {
+          // Large messages arrive as a sequence of chunks
+          const chunk = frame as ChunkMessage;
+          const parts = chunksRef.current.get(chunk.chunk_id) || [];
+          parts[chunk.index] = chunk.data;
+          if (parts.filter((part) => part !== undefined).length < chunk.count) {
+            chunksRef.current.set(chunk.chunk_id, parts);
+            return;
+          }
+          chunksRef.current.delete(chunk.chunk_id);
+          data = joinChunks(parts);
+        } else {
+          data = frame as AgentMessage;
+        }
         if (messageHandlerRef.current) {
           messageHandlerRef.current(data);
         }
@@ -122,11 +167,21 @@ export const useWebSocket = (onMessage?: (message: AgentMessage) => void) => {
     }
   }, []);
 
+  const sendCommand = useCallback((command: string) => {
+    if (wsRef.current?.readyState === WebSocket.OPEN) {
+      const payload = JSON.stringify({ type: "session_command", command });
+      wsRef.current.send(payload);
+    } else {
+      console.error("WebSocket not open. State:", wsRef.current?.readyState);
+    }
+  }, []);
+
   return {
     isConnected,
     isConnecting,
     connect,
     disconnect,
     sendMessage,
+    sendCommand,
   };
 };
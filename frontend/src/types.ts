@@ -1,5 +1,6 @@
 export interface AgentMessage {
-  type: 'start' | 'tool_called' | 'tool_output' | 'text_delta' | 'text_done' | 'complete' | 'error' | 'action_created' | 'action_removed' | 'action_clear';
+  type: 'session_init' | 'start' | 'tool_called' | 'tool_output' | 'text_delta' | 'text_done' | 'complete' | 'run_cancelled' | 'error' | 'action_created' | 'action_removed' | 'action_clear' | 'actions_state' | 'document_progress';
+  session_id?: string;
   message?: string;
   tool_name?: string;
   tool_args?: string;
@@ -10,6 +11,39 @@ export interface AgentMessage {
   action_type?: string;
   action_args?: any;
   timestamp?: string;
+  // Batched action events, in the order they happened
+  actions?: ActionEvent[];
+  // Document upload progress
+  upload_id?: string;
+  name?: string;
+  stage?: UploadStage;
+  document_id?: string;
+  error?: string;
+}
+
+export type UploadStage = 'uploading' | 'stored' | 'queued' | 'extracting' | 'done' | 'duplicate' | 'failed';
+
+export interface UploadItem {
+  id: string;
+  name: string;
+  stage: UploadStage;
+  error?: string;
+}
+
+export interface ActionEvent {
+  event: 'action_created' | 'action_removed' | 'action_clear';
+  action_id?: string;
+  action_type?: string;
+  action_args?: any;
+  timestamp?: string;
+}
+
+export interface ChunkMessage {
+  type: 'chunk';
+  chunk_id: string;
+  index: number;
+  count: number;
+  data: string | Uint8Array;
 }
 
 export interface ChatMessage {